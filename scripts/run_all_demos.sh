@@ -17,6 +17,8 @@ export PYTHONUNBUFFERED=1
 TIMESTAMP="$(date +%Y%m%d_%H%M%S)"
 LOG_DIR="$ROOT_DIR/artifacts/logs/run_all/$TIMESTAMP"
 mkdir -p "$LOG_DIR"
+# Marca de inicio: las trazas más nuevas que ella son de esta ejecución.
+touch "$LOG_DIR/.started"
 
 LOCAL_ITERS="${LOCAL_ITERS:-20}"
 HYBRID_ITERS="${HYBRID_ITERS:-30}"
@@ -24,6 +26,7 @@ COMPARISON_ITERS="${COMPARISON_ITERS:-50}"
 RUN_QR="${RUN_QR:-1}"
 XMPP_HOST="${XMPP_HOST:-127.0.0.1}"
 XMPP_PORT="${XMPP_PORT:-5222}"
+XMPP_LOOPBACK="${XMPP_LOOPBACK:-0}"
 
 TIMEOUT_DEMO1="${TIMEOUT_DEMO1:-420}"
 TIMEOUT_DEMO2A="${TIMEOUT_DEMO2A:-240}"
@@ -36,6 +39,7 @@ READY_TIMEOUT_RECEIVER="${READY_TIMEOUT_RECEIVER:-30}"
 
 RECEIVER_PID=""
 CAPTURE_PID=""
+ROUTER_PID=""
 
 cleanup() {
   if [[ -n "${RECEIVER_PID}" ]] && kill -0 "$RECEIVER_PID" 2>/dev/null; then
@@ -46,6 +50,10 @@ cleanup() {
     kill -SIGINT "$CAPTURE_PID" || true
     wait "$CAPTURE_PID" 2>/dev/null || true
   fi
+  if [[ -n "${ROUTER_PID}" ]] && kill -0 "$ROUTER_PID" 2>/dev/null; then
+    kill "$ROUTER_PID" || true
+    wait "$ROUTER_PID" 2>/dev/null || true
+  fi
 }
 trap cleanup EXIT
 
@@ -92,6 +100,24 @@ require_file() {
   }
 }
 
+start_loopback_router() {
+  local log_file="$1"
+  log "Iniciando router XMPP loopback en ${XMPP_HOST}:${XMPP_PORT}"
+  "$VENV_PY" "$ROOT_DIR/src/xmpp_loopback/router.py" --host "$XMPP_HOST" --port "$XMPP_PORT" >"$log_file" 2>&1 &
+  ROUTER_PID=$!
+
+  local elapsed=0
+  until grep -q "listo" "$log_file" 2>/dev/null; do
+    if ! kill -0 "$ROUTER_PID" 2>/dev/null || [[ "$elapsed" -ge 10 ]]; then
+      echo "ERROR: el router loopback no arrancó. Revisa: $log_file" >&2
+      tail -n 20 "$log_file" >&2 || true
+      exit 1
+    fi
+    sleep 1
+    elapsed=$((elapsed + 1))
+  done
+}
+
 start_capture() {
   local pcap_file="$1"
   local filter="${2:-tcp port 5222}"
@@ -200,6 +226,7 @@ main() {
   log "RUN_QR=$RUN_QR"
   log "XMPP_HOST=$XMPP_HOST"
   log "XMPP_PORT=$XMPP_PORT"
+  log "XMPP_LOOPBACK=$XMPP_LOOPBACK"
   log "STARTUP_TIMEOUT_XMPP=$STARTUP_TIMEOUT_XMPP"
   log "READY_TIMEOUT_RECEIVER=$READY_TIMEOUT_RECEIVER"
 
@@ -210,6 +237,10 @@ main() {
   rm -f "$ROOT_DIR/artifacts/csv/hybrid_xmpp_sender_metrics.csv"
   rm -f "$ROOT_DIR/artifacts/csv/hybrid_xmpp_receiver_metrics.csv"
 
+  if [[ "$XMPP_LOOPBACK" == "1" ]]; then
+    start_loopback_router "$LOG_DIR/xmpp_loopback_router.log"
+  fi
+
   # Preflight XMPP para evitar bloqueos silenciosos
   check_xmpp_connectivity "$XMPP_HOST" "$XMPP_PORT"
 
@@ -272,6 +303,22 @@ main() {
     log "RUN_QR=0, saltando Demo2C QR"
   fi
 
+  # Trazas de handshake (solo con TRACE_DIR): se combinan las de esta ejecución. Los receptores
+  # escriben la suya al recibir SIGTERM en stop_receiver.
+  if [[ -n "${TRACE_DIR:-}" ]]; then
+    local trace_files
+    trace_files="$(cd "$ROOT_DIR" && find "$TRACE_DIR" -name '*.trace.json' -newer "$LOG_DIR/.started" 2>/dev/null | sort | tr '\n' ' ')"
+    if [[ -n "$trace_files" ]]; then
+      run_fg \
+        "Trazas merge" \
+        "PYTHONPATH='$PYTHONPATH' '$VENV_PY' '$ROOT_DIR/src/metrics/tracing.py' $trace_files --out '$TRACE_DIR/merged_$TIMESTAMP.json'" \
+        "$LOG_DIR/traces_merge.log" \
+        "$TIMEOUT_DEMO3"
+    else
+      log "TRACE_DIR=$TRACE_DIR sin trazas nuevas"
+    fi
+  fi
+
   # Demo 3: análisis y resumen
   run_fg \
     "Demo3 plot_metrics" \
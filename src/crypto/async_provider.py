@@ -0,0 +1,224 @@
+import asyncio
+import math
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+from crypto.executor import DEFAULT_PROCESS_ALGS, CryptoExecutor, _run_worker_op_timed
+from crypto.pqc_wrapper import (
+    BatchSignResult,
+    BatchVerifyResult,
+    DecapsulateResult,
+    EncapsulateResult,
+    KEMKeypairResult,
+    PQCProvider,
+    SignatureKeypairResult,
+    SignResult,
+    VerifyResult,
+)
+from crypto.verify_cache import verify_cache_key
+
+T = TypeVar("T")
+
+
+@dataclass
+class AsyncOpResult(Generic[T]):
+    """
+    Resultado de una operación asíncrona.
+
+    - `queue_wait_ms`: desde el envío al executor hasta que un worker la empieza.
+    - `run_ms`: ejecución en el worker (incluye préstamo de contexto; el tiempo
+      criptográfico puro sigue en `value.*_time_ms`).
+    """
+
+    value: T
+    queue_wait_ms: float
+    run_ms: float
+
+
+def _timed_call(fn, *args):
+    t_start = time.perf_counter()
+    value = fn(*args)
+    return t_start, time.perf_counter(), value
+
+
+class AsyncPQCProvider:
+    """
+    Fachada asyncio de PQCProvider para handlers de slixmpp.
+
+    - Cada operación es una corrutina que se ejecuta en un ThreadPoolExecutor
+      (liboqs se llama vía ctypes, que suelta el GIL) o, para los algoritmos de
+      `process_algs` con `process_workers > 0`, en el pool de procesos de CryptoExecutor.
+    - `timeout_s` (global o por llamada) lanza asyncio.TimeoutError; cancelar la
+      corrutina retira la operación si aún no ha empezado. Una operación ya en
+      curso no se interrumpe: termina en el worker y su resultado se descarta.
+    - El tiempo en cola se mide aparte del de ejecución. perf_counter usa el reloj
+      monótono del sistema, así que es comparable entre procesos de la misma máquina.
+    """
+
+    def __init__(
+        self,
+        pqc: PQCProvider | None = None,
+        max_threads: int = 4,
+        process_workers: int = 0,
+        process_algs: tuple[str, ...] = DEFAULT_PROCESS_ALGS,
+        timeout_s: float | None = None,
+    ):
+        self.pqc = pqc if pqc is not None else PQCProvider()
+        self.crypto = CryptoExecutor(self.pqc, process_workers=process_workers, process_algs=process_algs)
+        self.timeout_s = timeout_s
+        self._threads = ThreadPoolExecutor(max_workers=max(1, max_threads), thread_name_prefix="pqc")
+        self.in_flight = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+
+    def warmup(self) -> None:
+        self.crypto.warmup()
+
+    async def _submit(self, alg_name: str, op_name: str, *args, timeout_s: float | None = None) -> AsyncOpResult:
+        loop = asyncio.get_running_loop()
+        process_pool = self.crypto.executor_for(alg_name)
+        t_submit = time.perf_counter()
+        if process_pool is None:
+            fut = loop.run_in_executor(self._threads, _timed_call, getattr(self.pqc, op_name), *args)
+        else:
+            fut = loop.run_in_executor(process_pool, _run_worker_op_timed, op_name, *args)
+
+        timeout = self.timeout_s if timeout_s is None else timeout_s
+        self.in_flight += 1
+        try:
+            t_start, t_end, value = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        return AsyncOpResult(
+            value=value,
+            queue_wait_ms=max(0.0, (t_start - t_submit) * 1000.0),
+            run_ms=(t_end - t_start) * 1000.0,
+        )
+
+    async def sign_message(
+        self, alg_name: str, message_bytes: bytes, timeout_s: float | None = None
+    ) -> AsyncOpResult[SignResult]:
+        return await self._submit(alg_name, "sign_message", alg_name, message_bytes, timeout_s=timeout_s)
+
+    async def verify_signature(
+        self, alg_name: str, message_bytes: bytes, sig_b64: str, pk_b64: str, timeout_s: float | None = None
+    ) -> AsyncOpResult[VerifyResult]:
+        return await self._submit(
+            alg_name, "verify_signature", alg_name, message_bytes, sig_b64, pk_b64, timeout_s=timeout_s
+        )
+
+    async def verify_signature_raw(
+        self, alg_name: str, message_bytes: bytes, sig_bytes: bytes, pk_bytes: bytes, timeout_s: float | None = None
+    ) -> AsyncOpResult[VerifyResult]:
+        # Los workers de proceso no comparten la caché: se consulta y rellena aquí.
+        cache = self.pqc.verify_cache
+        cache_key = None
+        if cache is not None and self.crypto.executor_for(alg_name) is not None:
+            t0 = time.perf_counter()
+            cache_key = verify_cache_key(alg_name, message_bytes, sig_bytes, pk_bytes)
+            cached_ok = cache.get(cache_key)
+            if cached_ok is not None:
+                lookup_ms = (time.perf_counter() - t0) * 1000.0
+                return AsyncOpResult(
+                    value=VerifyResult(ok=cached_ok, verify_time_ms=lookup_ms, cached=True),
+                    queue_wait_ms=0.0,
+                    run_ms=lookup_ms,
+                )
+
+        timed = await self._submit(
+            alg_name, "verify_signature_raw", alg_name, message_bytes, sig_bytes, pk_bytes, timeout_s=timeout_s
+        )
+        # verify_time_ms NaN = excepción en liboqs (longitudes, algoritmo): no se memoriza.
+        if cache_key is not None and not math.isnan(timed.value.verify_time_ms):
+            cache.put(cache_key, timed.value.ok)
+        return timed
+
+    async def generate_signature_keypair(
+        self, alg_name: str, timeout_s: float | None = None
+    ) -> AsyncOpResult[SignatureKeypairResult]:
+        return await self._submit(alg_name, "generate_signature_keypair", alg_name, timeout_s=timeout_s)
+
+    async def sign_with_secret_key(
+        self, alg_name: str, message_bytes: bytes, secret_key_b64: str, public_key_b64: str,
+        timeout_s: float | None = None,
+    ) -> AsyncOpResult[SignResult]:
+        return await self._submit(
+            alg_name, "sign_with_secret_key", alg_name, message_bytes, secret_key_b64, public_key_b64,
+            timeout_s=timeout_s,
+        )
+
+    async def sign_with_secret_key_raw(
+        self, alg_name: str, message_bytes: bytes, secret_key: bytes, public_key: bytes,
+        timeout_s: float | None = None,
+    ) -> AsyncOpResult[SignResult]:
+        return await self._submit(
+            alg_name, "sign_with_secret_key_raw", alg_name, message_bytes, secret_key, public_key,
+            timeout_s=timeout_s,
+        )
+
+    async def generate_kem_keypair(
+        self, alg_name: str, timeout_s: float | None = None
+    ) -> AsyncOpResult[KEMKeypairResult]:
+        return await self._submit(alg_name, "generate_kem_keypair", alg_name, timeout_s=timeout_s)
+
+    async def encapsulate_secret(
+        self, alg_name: str, public_key_b64: str, timeout_s: float | None = None
+    ) -> AsyncOpResult[EncapsulateResult]:
+        return await self._submit(alg_name, "encapsulate_secret", alg_name, public_key_b64, timeout_s=timeout_s)
+
+    async def encapsulate_secret_raw(
+        self, alg_name: str, public_key: bytes, timeout_s: float | None = None
+    ) -> AsyncOpResult[EncapsulateResult]:
+        return await self._submit(alg_name, "encapsulate_secret_raw", alg_name, public_key, timeout_s=timeout_s)
+
+    async def decapsulate_secret(
+        self, alg_name: str, ciphertext_b64: str, secret_key_b64: str, ephemeral: bool = False,
+        timeout_s: float | None = None,
+    ) -> AsyncOpResult[DecapsulateResult]:
+        return await self._submit(
+            alg_name, "decapsulate_secret", alg_name, ciphertext_b64, secret_key_b64, ephemeral,
+            timeout_s=timeout_s,
+        )
+
+    async def decapsulate_secret_raw(
+        self, alg_name: str, ciphertext: bytes, secret_key: bytes, ephemeral: bool = False,
+        timeout_s: float | None = None,
+    ) -> AsyncOpResult[DecapsulateResult]:
+        return await self._submit(
+            alg_name, "decapsulate_secret_raw", alg_name, ciphertext, secret_key, ephemeral,
+            timeout_s=timeout_s,
+        )
+
+    async def sign_many(
+        self, alg_name: str, items: Sequence[tuple[bytes, bytes]], timeout_s: float | None = None
+    ) -> AsyncOpResult[BatchSignResult]:
+        return await self._submit(alg_name, "sign_many", alg_name, list(items), timeout_s=timeout_s)
+
+    async def verify_many(
+        self, alg_name: str, items: Sequence[tuple[bytes, bytes, bytes]], timeout_s: float | None = None
+    ) -> AsyncOpResult[BatchVerifyResult]:
+        return await self._submit(alg_name, "verify_many", alg_name, list(items), timeout_s=timeout_s)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._threads.shutdown(wait=wait, cancel_futures=True)
+        self.crypto.shutdown(wait=wait)
@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+from crypto.oqs_pool import OQSContextPool
+from crypto.pqc_wrapper import PQCProvider
+
+# Prefijos de algoritmo que se envían al pool de procesos por defecto:
+# SPHINCS+ tarda cientos de ms en firmar; ML-DSA / ML-KEM son sub-milisegundo
+# y el coste de IPC superaría al de la operación.
+DEFAULT_PROCESS_ALGS = ("SPHINCS+",)
+
+_worker_pqc: PQCProvider | None = None
+
+
+def _init_worker() -> None:
+    global _worker_pqc
+    _worker_pqc = PQCProvider(context_pool=OQSContextPool())
+
+
+def _worker_provider() -> PQCProvider:
+    if _worker_pqc is None:
+        _init_worker()
+    return _worker_pqc
+
+
+def _run_worker_op(op_name: str, *args):
+    return getattr(_worker_provider(), op_name)(*args)
+
+
+def _run_worker_op_timed(op_name: str, *args):
+    # Devuelve (inicio, fin, resultado) para separar espera en cola de ejecución.
+    t_start = time.perf_counter()
+    value = _run_worker_op(op_name, *args)
+    return t_start, time.perf_counter(), value
+
+
+def _worker_ready() -> int:
+    _worker_provider()
+    return os.getpid()
+
+
+class CryptoExecutor:
+    """
+    Pool de procesos para las operaciones PQC caras y su enrutado por algoritmo.
+
+    - Los algoritmos cuyo nombre empieza por un prefijo de `process_algs` van a un
+      ProcessPoolExecutor (un PQCProvider por proceso): `executor_for` lo devuelve.
+    - Para el resto devuelve None: son más baratas que el IPC y AsyncPQCProvider las
+      ejecuta en su pool de hilos. Con `process_workers=0` no hay pool de procesos.
+    El único camino asíncrono es `AsyncPQCProvider`; esta clase no ejecuta nada por sí misma.
+    """
+
+    def __init__(
+        self,
+        pqc: PQCProvider | None = None,
+        process_workers: int = 0,
+        process_algs: tuple[str, ...] = DEFAULT_PROCESS_ALGS,
+    ):
+        self.pqc = pqc if pqc is not None else PQCProvider()
+        self.process_workers = max(0, process_workers)
+        self.process_algs = tuple(process_algs)
+        self._process_pool: ProcessPoolExecutor | None = None
+        if self.process_workers > 0 and self.process_algs:
+            # spawn: el proceso padre ya tiene hilos (slixmpp, asyncio); fork no es seguro.
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+
+    def route(self, alg_name: str) -> str:
+        if self._process_pool is not None and alg_name.startswith(self.process_algs):
+            return "process"
+        return "inline"
+
+    def executor_for(self, alg_name: str) -> Executor | None:
+        if self.route(alg_name) == "process":
+            return self._process_pool
+        return None
+
+    def warmup(self) -> None:
+        """Arranca todos los procesos antes de medir (spawn + import de liboqs)."""
+        if self._process_pool is None:
+            return
+        futures = [self._process_pool.submit(_worker_ready) for _ in range(self.process_workers)]
+        wait_futures(futures)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=True)
+            self._process_pool = None
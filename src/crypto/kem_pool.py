@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+
+from crypto.pqc_wrapper import KEMKeypairResult, PQCProvider
+
+DEFAULT_KEM_ALGS = ("ML-KEM-512", "ML-KEM-768", "ML-KEM-1024")
+
+
+class KEMKeypairPool:
+    """
+    Pool de keypairs KEM efímeros pregenerados por un hilo en segundo plano.
+
+    - `take()` entrega cada keypair una sola vez (se extrae de la cola).
+    - Cuando una cola baja de `low_water`, el hilo la rellena hasta `capacity`.
+    - Si la cola está vacía, `take()` genera inline y `try_take()` devuelve None
+      (ambos cuentan como miss).
+
+    Uso:
+        with KEMKeypairPool(pqc, ("ML-KEM-768",)) as pool:
+            kem = pool.take("ML-KEM-768")
+    """
+
+    def __init__(
+        self,
+        pqc: PQCProvider,
+        algs: tuple[str, ...] = DEFAULT_KEM_ALGS,
+        capacity: int = 32,
+        low_water: int = 8,
+    ):
+        self.pqc = pqc
+        self.capacity = max(1, capacity)
+        # Nunca 0: con la cola vacía siempre hay que rellenar.
+        self.low_water = min(max(1, low_water), self.capacity)
+        self._queues: dict[str, deque] = {alg: deque() for alg in algs}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._thread = threading.Thread(target=self._refill_loop, name="kem-pool", daemon=True)
+        self._thread.start()
+
+    def _needs_refill(self) -> str | None:
+        for alg, queue in self._queues.items():
+            if len(queue) < self.low_water:
+                return alg
+        return None
+
+    def _refill_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and self._needs_refill() is None:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                alg = self._needs_refill()
+                missing = self.capacity - len(self._queues[alg])
+
+            for _ in range(missing):
+                kp = self.pqc.generate_kem_keypair(alg)
+                with self._cond:
+                    if self._closed:
+                        return
+                    self._queues[alg].append(kp)
+                    self.generated += 1
+                    self._cond.notify_all()
+
+    def wait_ready(self, timeout_s: float | None = None) -> bool:
+        """Espera a que todas las colas estén llenas (para no medir el llenado inicial)."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._closed or all(len(q) >= self.capacity for q in self._queues.values()),
+                timeout=timeout_s,
+            )
+
+    def try_take(self, alg_name: str) -> KEMKeypairResult | None:
+        """Extrae un keypair pregenerado, o None si la cola está vacía (miss)."""
+        with self._cond:
+            queue = self._queues.get(alg_name)
+            kp = queue.popleft() if queue else None
+            if kp is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if queue is not None and len(queue) < self.low_water:
+                self._cond.notify_all()
+            return kp
+
+    def take(self, alg_name: str) -> KEMKeypairResult:
+        kp = self.try_take(alg_name)
+        if kp is None:
+            kp = self.pqc.generate_kem_keypair(alg_name)
+        return kp
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+                "available": {alg: len(q) for alg, q in self._queues.items()},
+                "capacity": self.capacity,
+                "low_water": self.low_water,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            for queue in self._queues.values():
+                queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=5.0)
+
+    def __enter__(self) -> "KEMKeypairPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from oqs.oqs import KeyEncapsulation
+from oqs.oqs import Signature
+
+
+class _PooledContext:
+    __slots__ = ("ctx", "leases", "evicted")
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.leases = 0
+        self.evicted = False
+
+
+class OQSContextPool:
+    """
+    Pool LRU de contextos liboqs vivos, indexados por (tipo, algoritmo, clave secreta).
+
+    - Los contextos sin clave secreta (verify / encaps) se comparten por algoritmo.
+    - Los contextos con clave secreta (sign / decaps) se comparten por clave.
+    - Al superar `max_size` se libera (free) el contexto menos usado; si está
+      prestado en ese momento, se libera al devolverse.
+
+    Uso:
+        with pool.signature("ML-DSA-65", secret_key) as sig:
+            signature = sig.sign(message)
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max(1, max_size)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def signature(self, alg_name: str, secret_key: bytes | None = None):
+        return self._lease(("sig", alg_name, secret_key), Signature, alg_name, secret_key)
+
+    def kem(self, alg_name: str, secret_key: bytes | None = None):
+        return self._lease(("kem", alg_name, secret_key), KeyEncapsulation, alg_name, secret_key)
+
+    @contextmanager
+    def _lease(self, key, factory, alg_name: str, secret_key: bytes | None):
+        entry = self._acquire(key, factory, alg_name, secret_key)
+        try:
+            yield entry.ctx
+        finally:
+            self._release(entry)
+
+    def _acquire(self, key, factory, alg_name: str, secret_key: bytes | None) -> _PooledContext:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("OQSContextPool cerrado")
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = _PooledContext(factory(alg_name, secret_key))
+                self._entries[key] = entry
+                while len(self._entries) > self.max_size:
+                    _, old = self._entries.popitem(last=False)
+                    self._evict(old)
+            entry.leases += 1
+            return entry
+
+    def _release(self, entry: _PooledContext) -> None:
+        with self._lock:
+            entry.leases -= 1
+            if entry.evicted and entry.leases == 0:
+                entry.ctx.free()
+
+    def _evict(self, entry: _PooledContext) -> None:
+        self.evictions += 1
+        entry.evicted = True
+        if entry.leases == 0:
+            entry.ctx.free()
+
+    def discard(self, alg_name: str, secret_key: bytes) -> None:
+        """Libera los contextos de una clave secreta que ya no se va a usar (p. ej. KEM efímera)."""
+        with self._lock:
+            for kind in ("sig", "kem"):
+                entry = self._entries.pop((kind, alg_name, secret_key), None)
+                if entry is not None:
+                    self._evict(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            while self._entries:
+                _, entry = self._entries.popitem(last=False)
+                self._evict(entry)
+
+    def __enter__(self) -> "OQSContextPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -1,8 +1,11 @@
 import base64
 import hashlib
 import json
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta, timezone
+from functools import cached_property
 from typing import Optional
 
 from cryptography import x509
@@ -37,6 +40,204 @@ class CertificateValidationResult:
     fingerprint_sha256: str
 
 
+@dataclass
+class ValidationPolicy:
+    mode: str
+    trusted_fingerprints: Optional[set[str]] = None
+    trusted_issuer_public_keys: Optional[set[str]] = None
+    now: Optional[datetime] = None
+    trust_anchors: Optional["TrustAnchorRegistry"] = None
+
+
+@dataclass(eq=False)
+class ParsedCertificate:
+    """
+    Certificado X.509-PQC parseado una sola vez a partir de su DER.
+
+    Contiene todo lo que necesita `validate()`; el resultado de la firma del emisor
+    se memoriza en `signature_ok` la primera vez que se comprueba.
+    """
+
+    cert_obj: x509.Certificate
+    der: bytes
+    pem: str
+    fingerprint_sha256: str
+    sig_alg: str
+    subject_dn: str
+    issuer_dn: str
+    pqc_subject_public_key_b64: str
+    issuer_public_key_b64: str
+    not_before: datetime
+    not_after: datetime
+    schema: str = CERT_SCHEMA
+    signature_ok: Optional[bool] = None
+
+    @classmethod
+    def from_x509(cls, cert_obj: x509.Certificate, pem: Optional[str] = None) -> "ParsedCertificate":
+        der = cert_obj.public_bytes(serialization.Encoding.DER)
+        pqc_info = _extract_pqc_info(cert_obj)
+        return cls(
+            cert_obj=cert_obj,
+            der=der,
+            pem=pem if pem is not None else _x509_to_pem(cert_obj),
+            fingerprint_sha256=hashlib.sha256(der).hexdigest(),
+            sig_alg=pqc_info.get("sig_alg", ""),
+            subject_dn=cert_obj.subject.rfc4514_string(),
+            issuer_dn=cert_obj.issuer.rfc4514_string(),
+            pqc_subject_public_key_b64=pqc_info.get("subject_public_key_b64", ""),
+            issuer_public_key_b64=_extract_issuer_pubkey_b64(cert_obj),
+            not_before=_cert_not_valid_before_utc(cert_obj),
+            not_after=_cert_not_valid_after_utc(cert_obj),
+        )
+
+    @classmethod
+    def from_der(cls, der: bytes) -> "ParsedCertificate":
+        return cls.from_x509(x509.load_der_x509_certificate(der))
+
+    @classmethod
+    def from_pem(cls, pem: str) -> "ParsedCertificate":
+        return cls.from_x509(_x509_from_pem(pem), pem=pem)
+
+    @cached_property
+    def issuer_public_key(self):
+        return _load_spki_b64(self.issuer_public_key_b64)
+
+    def to_dict(self) -> dict:
+        return {
+            "schema": self.schema,
+            "x509_pem": self.pem,
+            "x509_der_b64": base64.b64encode(self.der).decode("ascii"),
+            "sig_alg": self.sig_alg,
+            "subject_dn": self.subject_dn,
+            "issuer_dn": self.issuer_dn,
+            "pqc_subject_public_key_b64": self.pqc_subject_public_key_b64,
+            "issuer_public_key_b64": self.issuer_public_key_b64,
+            "not_before": _iso8601(self.not_before),
+            "not_after": _iso8601(self.not_after),
+            "fingerprint_sha256": self.fingerprint_sha256,
+        }
+
+
+def _load_spki_b64(public_key_b64: str):
+    return serialization.load_der_public_key(base64.b64decode(public_key_b64.encode("ascii")))
+
+
+class TrustAnchorRegistry:
+    """
+    Claves públicas de emisores cargadas una sola vez, indexadas por su SPKI en base64
+    (el mismo formato que `trusted_issuer_public_keys`).
+
+    - Las claves confiables se cargan al construir / en `update()`.
+    - Las claves de emisores no confiables (p. ej. certificados autofirmados en modo
+      `qr`) se cargan bajo demanda en un LRU de `max_untrusted` entradas.
+    """
+
+    def __init__(self, trusted_issuer_public_keys=(), max_untrusted: int = 256):
+        self.max_untrusted = max(1, max_untrusted)
+        self._trusted: dict = {}
+        self._trusted_set: frozenset[str] = frozenset()
+        self._untrusted: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.update(trusted_issuer_public_keys)
+
+    def update(self, trusted_issuer_public_keys) -> None:
+        """Sustituye el conjunto confiable; las claves ya cargadas se reutilizan."""
+        new_set = frozenset(trusted_issuer_public_keys or ())
+        if new_set == self._trusted_set:
+            return
+        with self._lock:
+            trusted = {}
+            for key_b64 in new_set:
+                key_obj = self._trusted.get(key_b64) or self._untrusted.pop(key_b64, None)
+                if key_obj is None:
+                    try:
+                        key_obj = _load_spki_b64(key_b64)
+                    except Exception:
+                        continue
+                    self.loads += 1
+                trusted[key_b64] = key_obj
+            self._trusted = trusted
+            self._trusted_set = new_set
+
+    def __len__(self) -> int:
+        return len(self._trusted)
+
+    def is_trusted(self, public_key_b64: str) -> bool:
+        return public_key_b64 in self._trusted
+
+    def public_key(self, public_key_b64: str):
+        key_obj = self._trusted.get(public_key_b64)
+        if key_obj is not None:
+            return key_obj
+        with self._lock:
+            key_obj = self._untrusted.get(public_key_b64)
+            if key_obj is not None:
+                self._untrusted.move_to_end(public_key_b64)
+                return key_obj
+        key_obj = _load_spki_b64(public_key_b64)
+        with self._lock:
+            self.loads += 1
+            self._untrusted[public_key_b64] = key_obj
+            while len(self._untrusted) > self.max_untrusted:
+                self._untrusted.popitem(last=False)
+        return key_obj
+
+
+class CertificateCache:
+    """
+    Caché LRU de certificados ya parseados, indexada por un hash BLAKE2b del PEM
+    (o del DER, si el certificado llega en binario).
+
+    Guarda el `ParsedCertificate` (con el resultado de la firma del emisor), de modo
+    que un mismo certificado se parsea y se verifica una sola vez. La vigencia
+    (notBefore/notAfter) se vuelve a comprobar en cada validación contra las fechas
+    ya extraídas.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max(1, max_entries)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(cert_pem: str | bytes) -> bytes:
+        raw = cert_pem if isinstance(cert_pem, bytes) else cert_pem.strip().encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def get(self, cert_pem: str | bytes) -> Optional[ParsedCertificate]:
+        key = self.key_for(cert_pem)
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return parsed
+
+    def put(self, cert_pem: str | bytes, parsed: ParsedCertificate) -> None:
+        with self._lock:
+            self._entries[self.key_for(cert_pem)] = parsed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 def _utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
@@ -254,81 +455,116 @@ def create_self_signed_certificate(
     )
 
 
-def _parse_iso8601_utc(ts: str) -> Optional[datetime]:
-    if not isinstance(ts, str):
-        return None
-    try:
-        if ts.endswith("Z"):
-            ts = ts[:-1] + "+00:00"
-        dt = datetime.fromisoformat(ts)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt.astimezone(timezone.utc)
-    except Exception:
-        return None
+def _check_signature(parsed: ParsedCertificate, trust_anchors: Optional[TrustAnchorRegistry] = None) -> bool:
+    if parsed.signature_ok is None:
+        try:
+            if trust_anchors is not None:
+                issuer_key = trust_anchors.public_key(parsed.issuer_public_key_b64)
+            else:
+                issuer_key = parsed.issuer_public_key
+            parsed.signature_ok = _verify_x509_signature(parsed.cert_obj, issuer_key)
+        except Exception:
+            parsed.signature_ok = False
+    return parsed.signature_ok
 
 
-def verify_certificate_signature(cert: dict, pqc: PQCProvider) -> bool:
-    _ = pqc
-    try:
-        if cert.get("schema") != CERT_SCHEMA:
-            return False
-        cert_obj = _x509_from_pem(cert["x509_pem"])
-        issuer_public_key_b64 = cert.get("issuer_public_key_b64") or _extract_issuer_pubkey_b64(cert_obj)
-        issuer_pub = serialization.load_der_public_key(base64.b64decode(issuer_public_key_b64.encode("ascii")))
-        return _verify_x509_signature(cert_obj, issuer_pub)
-    except Exception:
-        return False
+def validate(parsed: ParsedCertificate, policy: ValidationPolicy) -> CertificateValidationResult:
+    """Valida un certificado ya parseado: no vuelve a parsear PEM/DER ni claves."""
+    fingerprint = parsed.fingerprint_sha256
 
-
-def verify_certificate(
-    cert: dict,
-    pqc: PQCProvider,
-    *,
-    mode: str,
-    trusted_fingerprints: Optional[set[str]] = None,
-    trusted_issuer_public_keys: Optional[set[str]] = None,
-) -> CertificateValidationResult:
-    cert_obj = _x509_from_pem(cert["x509_pem"])
-    fingerprint = certificate_fingerprint_sha256(cert)
-
-    if cert.get("schema") != CERT_SCHEMA:
+    if parsed.schema != CERT_SCHEMA:
         return CertificateValidationResult(False, "schema_no_soportado", fingerprint)
 
-    not_before_dt = _cert_not_valid_before_utc(cert_obj)
-    not_after_dt = _cert_not_valid_after_utc(cert_obj)
-
-    not_before = _parse_iso8601_utc(_iso8601(not_before_dt))
-    not_after = _parse_iso8601_utc(_iso8601(not_after_dt))
-    now = _utc_now()
-
-    if not not_before or not not_after:
-        return CertificateValidationResult(False, "validez_temporal_invalida", fingerprint)
-    if now < not_before:
+    now = policy.now or _utc_now()
+    if now < parsed.not_before:
         return CertificateValidationResult(False, "cert_no_vigente_aun", fingerprint)
-    if now > not_after:
+    if now > parsed.not_after:
         return CertificateValidationResult(False, "cert_expirado", fingerprint)
 
-    if not verify_certificate_signature(cert, pqc):
+    anchors = policy.trust_anchors
+    if not _check_signature(parsed, anchors):
         return CertificateValidationResult(False, "firma_cert_invalida", fingerprint)
 
-    issuer_pk = cert.get("issuer_public_key_b64") or _extract_issuer_pubkey_b64(cert_obj)
-    if mode == "cert":
-        if trusted_issuer_public_keys is not None and len(trusted_issuer_public_keys) > 0:
-            if issuer_pk not in trusted_issuer_public_keys:
+    if policy.mode == "cert":
+        if anchors is not None and len(anchors) > 0:
+            if not anchors.is_trusted(parsed.issuer_public_key_b64):
+                return CertificateValidationResult(False, "issuer_no_confiable", fingerprint)
+        elif policy.trusted_issuer_public_keys:
+            if parsed.issuer_public_key_b64 not in policy.trusted_issuer_public_keys:
                 return CertificateValidationResult(False, "issuer_no_confiable", fingerprint)
         return CertificateValidationResult(True, "ok", fingerprint)
 
-    if mode == "qr":
-        if not trusted_fingerprints:
+    if policy.mode == "qr":
+        if not policy.trusted_fingerprints:
             return CertificateValidationResult(False, "sin_huellas_qr_confiables", fingerprint)
-        if fingerprint not in trusted_fingerprints:
+        if fingerprint not in policy.trusted_fingerprints:
             return CertificateValidationResult(False, "huella_qr_no_confiable", fingerprint)
         return CertificateValidationResult(True, "ok", fingerprint)
 
     return CertificateValidationResult(False, "modo_verificacion_desconocido", fingerprint)
 
 
+def parse_certificate(text: str | bytes, cache: Optional[CertificateCache] = None) -> ParsedCertificate:
+    """Parsea un certificado PEM, o DER si recibe bytes (o lo toma de `cache` si ya se vio)."""
+    parse = ParsedCertificate.from_der if isinstance(text, bytes) else ParsedCertificate.from_pem
+    if cache is None:
+        return parse(text)
+    parsed = cache.get(text)
+    if parsed is None:
+        parsed = parse(text)
+        cache.put(text, parsed)
+    return parsed
+
+
+def _parsed_from_dict(cert: dict, cache: Optional[CertificateCache]) -> ParsedCertificate:
+    parsed = parse_certificate(cert["x509_pem"], cache)
+    overrides = {}
+    if cert.get("schema") != parsed.schema:
+        overrides["schema"] = cert.get("schema")
+    # Si el dict trae otra clave de emisor, se respeta (y no se reutiliza la firma memorizada).
+    issuer_pk = cert.get("issuer_public_key_b64")
+    if issuer_pk and issuer_pk != parsed.issuer_public_key_b64:
+        overrides["issuer_public_key_b64"] = issuer_pk
+    if overrides:
+        parsed = replace(parsed, signature_ok=None, **overrides)
+    return parsed
+
+
+def verify_certificate_signature(
+    cert: dict,
+    pqc: PQCProvider,
+    cache: Optional[CertificateCache] = None,
+    trust_anchors: Optional[TrustAnchorRegistry] = None,
+) -> bool:
+    _ = pqc
+    try:
+        if cert.get("schema") != CERT_SCHEMA:
+            return False
+        return _check_signature(_parsed_from_dict(cert, cache), trust_anchors)
+    except Exception:
+        return False
+
+
+def verify_certificate(
+    cert: dict,
+    pqc: PQCProvider,
+    *,
+    mode: str,
+    trusted_fingerprints: Optional[set[str]] = None,
+    trusted_issuer_public_keys: Optional[set[str]] = None,
+    cache: Optional[CertificateCache] = None,
+    trust_anchors: Optional[TrustAnchorRegistry] = None,
+) -> CertificateValidationResult:
+    _ = pqc
+    policy = ValidationPolicy(
+        mode=mode,
+        trusted_fingerprints=trusted_fingerprints,
+        trusted_issuer_public_keys=trusted_issuer_public_keys,
+        trust_anchors=trust_anchors,
+    )
+    return validate(_parsed_from_dict(cert, cache), policy)
+
+
 def certificate_to_json(cert: dict) -> str:
     return cert["x509_pem"]
 
@@ -341,26 +577,8 @@ def certificate_to_pem(cert: dict) -> str:
     return cert["x509_pem"]
 
 
-def certificate_from_pem(text: str) -> dict:
-    cert_obj = _x509_from_pem(text)
-    pqc_info = _extract_pqc_info(cert_obj)
-    der = cert_obj.public_bytes(serialization.Encoding.DER)
-    issuer_pub_b64 = _extract_issuer_pubkey_b64(cert_obj)
-
-    out = {
-        "schema": CERT_SCHEMA,
-        "x509_pem": text,
-        "x509_der_b64": base64.b64encode(der).decode("ascii"),
-        "sig_alg": pqc_info.get("sig_alg", ""),
-        "subject_dn": cert_obj.subject.rfc4514_string(),
-        "issuer_dn": cert_obj.issuer.rfc4514_string(),
-        "pqc_subject_public_key_b64": pqc_info.get("subject_public_key_b64", ""),
-        "issuer_public_key_b64": issuer_pub_b64,
-        "not_before": _iso8601(_cert_not_valid_before_utc(cert_obj)),
-        "not_after": _iso8601(_cert_not_valid_after_utc(cert_obj)),
-    }
-    out["fingerprint_sha256"] = hashlib.sha256(der).hexdigest()
-    return out
+def certificate_from_pem(text: str, cache: Optional[CertificateCache] = None) -> dict:
+    return parse_certificate(text, cache).to_dict()
 
 
 def certificate_to_qr_payload(cert: dict) -> str:
@@ -369,9 +587,9 @@ def certificate_to_qr_payload(cert: dict) -> str:
     return QR_PREFIX + b64
 
 
-def certificate_from_qr_payload(payload: str) -> dict:
+def certificate_from_qr_payload(payload: str, cache: Optional[CertificateCache] = None) -> dict:
     if not payload.startswith(QR_PREFIX):
         raise ValueError("QR payload no reconocido")
     b64 = payload[len(QR_PREFIX):]
     raw = base64.urlsafe_b64decode(b64.encode("ascii"))
-    return certificate_from_pem(raw.decode("utf-8"))
+    return certificate_from_pem(raw.decode("utf-8"), cache=cache)
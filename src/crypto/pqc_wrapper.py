@@ -2,86 +2,207 @@ import base64
 from oqs.oqs import Signature
 from oqs.oqs import KeyEncapsulation
 import time
+from collections.abc import Sequence
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
+from functools import cached_property
 
+from crypto.oqs_pool import OQSContextPool
+from crypto.verify_cache import VerifyCache, verify_cache_key
+
+
+def b64encode_str(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def b64decode_str(text: str) -> bytes:
+    return base64.b64decode(text.encode("ascii"))
+
+
+# Los resultados guardan bytes crudos; la versión base64 se calcula solo si se pide
+# (p. ej. al serializar la stanza XML) y se memoriza.
 
 @dataclass
 class SignResult:
-    pk_b64: str
-    sig_b64: str
+    pk: bytes
+    sig: bytes
     sign_time_ms: float
 
+    @cached_property
+    def pk_b64(self) -> str:
+        return b64encode_str(self.pk)
+
+    @cached_property
+    def sig_b64(self) -> str:
+        return b64encode_str(self.sig)
+
 
 @dataclass
 class VerifyResult:
     ok: bool
     verify_time_ms: float
+    cached: bool = False
 
 
 @dataclass
 class SignatureKeypairResult:
-    public_key_b64: str
-    secret_key_b64: str
+    public_key: bytes
+    secret_key: bytes
     keygen_time_ms: float
 
+    @cached_property
+    def public_key_b64(self) -> str:
+        return b64encode_str(self.public_key)
+
+    @cached_property
+    def secret_key_b64(self) -> str:
+        return b64encode_str(self.secret_key)
+
 
 @dataclass
 class KEMKeypairResult:
-    public_key_b64: str
-    secret_key_b64: str
+    public_key: bytes
+    secret_key: bytes
     keygen_time_ms: float
 
+    @cached_property
+    def public_key_b64(self) -> str:
+        return b64encode_str(self.public_key)
+
+    @cached_property
+    def secret_key_b64(self) -> str:
+        return b64encode_str(self.secret_key)
+
 
 @dataclass
 class EncapsulateResult:
-    ciphertext_b64: str
-    shared_secret_b64: str
+    ciphertext: bytes
+    shared_secret: bytes
     encaps_time_ms: float
 
+    @cached_property
+    def ciphertext_b64(self) -> str:
+        return b64encode_str(self.ciphertext)
+
+    @cached_property
+    def shared_secret_b64(self) -> str:
+        return b64encode_str(self.shared_secret)
+
 
 @dataclass
 class DecapsulateResult:
-    shared_secret_b64: str
+    shared_secret: bytes
     decaps_time_ms: float
 
+    @cached_property
+    def shared_secret_b64(self) -> str:
+        return b64encode_str(self.shared_secret)
+
+
+@dataclass
+class BatchSignResult:
+    sigs: list[bytes]
+    sign_times_ms: list[float]
+    total_time_ms: float
+
+    @property
+    def ops_per_sec(self) -> float:
+        if self.total_time_ms <= 0:
+            return float("nan")
+        return len(self.sigs) * 1000.0 / self.total_time_ms
+
+
+@dataclass
+class BatchVerifyResult:
+    ok: list[bool]
+    verify_times_ms: list[float]
+    total_time_ms: float
+
+    @property
+    def ok_count(self) -> int:
+        return sum(self.ok)
+
+    @property
+    def ops_per_sec(self) -> float:
+        if self.total_time_ms <= 0:
+            return float("nan")
+        return len(self.ok) * 1000.0 / self.total_time_ms
+
 
 class PQCProvider:
     """
     - Firma/verifica con oqs-python.
-    - Genera un keypair nuevo por mensaje (demo/bench).
-      (En un diseño real, la clave pública sería identidad persistente.)
+    - `sign_message` genera un keypair nuevo por mensaje (demo/bench); para una
+      identidad persistente ver `crypto.signing_identity` y `sign_with_secret_key_raw`.
+    - Con `context_pool`, sign/verify/encaps/decaps reutilizan contextos liboqs
+      vivos en lugar de crear y liberar uno por llamada.
+    - Los métodos `*_raw` trabajan con bytes; los que reciben `*_b64` son envoltorios
+      para quien ya tiene texto base64 (p. ej. leído de una stanza).
+    - Con `verify_cache`, una verificación repetida devuelve el resultado memorizado
+      (`cached=True`, `verify_time_ms` = coste de la búsqueda).
     """
 
-    @staticmethod
-    def sign_message(alg_name: str, message_bytes: bytes) -> SignResult:
+    def __init__(self, context_pool: OQSContextPool | None = None, verify_cache: VerifyCache | None = None):
+        self.context_pool = context_pool
+        self.verify_cache = verify_cache
+
+    @contextmanager
+    def _signature_ctx(self, alg_name: str, secret_key: bytes | None = None):
+        if self.context_pool is None:
+            with Signature(alg_name, secret_key=secret_key) as sig:
+                yield sig
+        else:
+            with self.context_pool.signature(alg_name, secret_key) as sig:
+                yield sig
+
+    @contextmanager
+    def _kem_ctx(self, alg_name: str, secret_key: bytes | None = None):
+        if self.context_pool is None:
+            with KeyEncapsulation(alg_name, secret_key) as kem:
+                yield kem
+        else:
+            with self.context_pool.kem(alg_name, secret_key) as kem:
+                yield kem
+
+    def sign_message(self, alg_name: str, message_bytes: bytes) -> SignResult:
+        # Keypair nuevo por mensaje: el contexto queda ligado a esa clave, no se reutiliza.
         with Signature(alg_name) as sig:
             pk = sig.generate_keypair()
             t0 = time.perf_counter()
             signature = sig.sign(message_bytes)
             t1 = time.perf_counter()
 
-        return SignResult(
-            pk_b64=base64.b64encode(pk).decode("ascii"),
-            sig_b64=base64.b64encode(signature).decode("ascii"),
-            sign_time_ms=(t1 - t0) * 1000.0,
-        )
+        return SignResult(pk=pk, sig=signature, sign_time_ms=(t1 - t0) * 1000.0)
+
+    def verify_signature(self, alg_name: str, message_bytes: bytes, sig_b64: str, pk_b64: str) -> VerifyResult:
+        try:
+            sig_bytes = b64decode_str(sig_b64)
+            pk_bytes = b64decode_str(pk_b64)
+        except Exception:
+            return VerifyResult(ok=False, verify_time_ms=float("nan"))
+        return self.verify_signature_raw(alg_name, message_bytes, sig_bytes, pk_bytes)
 
-    @staticmethod
-    def verify_signature(alg_name: str, message_bytes: bytes, sig_b64: str, pk_b64: str) -> VerifyResult:
+    def verify_signature_raw(self, alg_name: str, message_bytes: bytes, sig_bytes: bytes, pk_bytes: bytes) -> VerifyResult:
+        cache_key = None
+        if self.verify_cache is not None:
+            t0 = time.perf_counter()
+            cache_key = verify_cache_key(alg_name, message_bytes, sig_bytes, pk_bytes)
+            cached_ok = self.verify_cache.get(cache_key)
+            if cached_ok is not None:
+                return VerifyResult(ok=cached_ok, verify_time_ms=(time.perf_counter() - t0) * 1000.0, cached=True)
         try:
-            sig_bytes = base64.b64decode(sig_b64.encode("ascii"))
-            pk_bytes = base64.b64decode(pk_b64.encode("ascii"))
-            with Signature(alg_name) as sig:
+            with self._signature_ctx(alg_name) as sig:
                 t0 = time.perf_counter()
                 ok = sig.verify(message_bytes, sig_bytes, pk_bytes)
                 t1 = time.perf_counter()
+            if cache_key is not None:
+                self.verify_cache.put(cache_key, ok)
             return VerifyResult(ok=ok, verify_time_ms=(t1 - t0) * 1000.0)
         except Exception:
-            # si algo falla (b64, algoritmo, etc.)
+            # si algo falla (algoritmo, longitudes, etc.)
             return VerifyResult(ok=False, verify_time_ms=float("nan"))
 
-    @staticmethod
-    def generate_signature_keypair(alg_name: str) -> SignatureKeypairResult:
+    def generate_signature_keypair(self, alg_name: str) -> SignatureKeypairResult:
         with Signature(alg_name) as sig:
             t0 = time.perf_counter()
             public_key = sig.generate_keypair()
@@ -89,27 +210,27 @@ class PQCProvider:
             t1 = time.perf_counter()
 
         return SignatureKeypairResult(
-            public_key_b64=base64.b64encode(public_key).decode("ascii"),
-            secret_key_b64=base64.b64encode(secret_key).decode("ascii"),
+            public_key=public_key,
+            secret_key=secret_key,
             keygen_time_ms=(t1 - t0) * 1000.0,
         )
 
-    @staticmethod
-    def sign_with_secret_key(alg_name: str, message_bytes: bytes, secret_key_b64: str, public_key_b64: str) -> SignResult:
-        secret_key = base64.b64decode(secret_key_b64.encode("ascii"))
-        with Signature(alg_name, secret_key=secret_key) as sig:
+    def sign_with_secret_key(self, alg_name: str, message_bytes: bytes, secret_key_b64: str, public_key_b64: str) -> SignResult:
+        res = self.sign_with_secret_key_raw(
+            alg_name, message_bytes, b64decode_str(secret_key_b64), b64decode_str(public_key_b64)
+        )
+        res.pk_b64 = public_key_b64
+        return res
+
+    def sign_with_secret_key_raw(self, alg_name: str, message_bytes: bytes, secret_key: bytes, public_key: bytes) -> SignResult:
+        with self._signature_ctx(alg_name, secret_key) as sig:
             t0 = time.perf_counter()
             signature = sig.sign(message_bytes)
             t1 = time.perf_counter()
 
-        return SignResult(
-            pk_b64=public_key_b64,
-            sig_b64=base64.b64encode(signature).decode("ascii"),
-            sign_time_ms=(t1 - t0) * 1000.0,
-        )
+        return SignResult(pk=public_key, sig=signature, sign_time_ms=(t1 - t0) * 1000.0)
 
-    @staticmethod
-    def generate_kem_keypair(alg_name: str) -> KEMKeypairResult:
+    def generate_kem_keypair(self, alg_name: str) -> KEMKeypairResult:
         with KeyEncapsulation(alg_name) as kem:
             t0 = time.perf_counter()
             public_key = kem.generate_keypair()
@@ -117,36 +238,80 @@ class PQCProvider:
             t1 = time.perf_counter()
 
         return KEMKeypairResult(
-            public_key_b64=base64.b64encode(public_key).decode("ascii"),
-            secret_key_b64=base64.b64encode(secret_key).decode("ascii"),
+            public_key=public_key,
+            secret_key=secret_key,
             keygen_time_ms=(t1 - t0) * 1000.0,
         )
 
-    @staticmethod
-    def encapsulate_secret(alg_name: str, public_key_b64: str) -> EncapsulateResult:
-        public_key = base64.b64decode(public_key_b64.encode("ascii"))
-        with KeyEncapsulation(alg_name) as kem:
+    def encapsulate_secret(self, alg_name: str, public_key_b64: str) -> EncapsulateResult:
+        return self.encapsulate_secret_raw(alg_name, b64decode_str(public_key_b64))
+
+    def encapsulate_secret_raw(self, alg_name: str, public_key: bytes) -> EncapsulateResult:
+        with self._kem_ctx(alg_name) as kem:
             t0 = time.perf_counter()
             ciphertext, shared_secret = kem.encap_secret(public_key)
             t1 = time.perf_counter()
 
         return EncapsulateResult(
-            ciphertext_b64=base64.b64encode(ciphertext).decode("ascii"),
-            shared_secret_b64=base64.b64encode(shared_secret).decode("ascii"),
+            ciphertext=ciphertext,
+            shared_secret=shared_secret,
             encaps_time_ms=(t1 - t0) * 1000.0,
         )
 
-    @staticmethod
-    def decapsulate_secret(alg_name: str, ciphertext_b64: str, secret_key_b64: str) -> DecapsulateResult:
-        ciphertext = base64.b64decode(ciphertext_b64.encode("ascii"))
-        secret_key = base64.b64decode(secret_key_b64.encode("ascii"))
+    def decapsulate_secret(self, alg_name: str, ciphertext_b64: str, secret_key_b64: str, ephemeral: bool = False) -> DecapsulateResult:
+        return self.decapsulate_secret_raw(
+            alg_name, b64decode_str(ciphertext_b64), b64decode_str(secret_key_b64), ephemeral=ephemeral
+        )
 
-        with KeyEncapsulation(alg_name, secret_key) as kem:
+    def decapsulate_secret_raw(self, alg_name: str, ciphertext: bytes, secret_key: bytes, ephemeral: bool = False) -> DecapsulateResult:
+        with self._kem_ctx(alg_name, secret_key) as kem:
             t0 = time.perf_counter()
             shared_secret = kem.decap_secret(ciphertext)
             t1 = time.perf_counter()
 
-        return DecapsulateResult(
-            shared_secret_b64=base64.b64encode(shared_secret).decode("ascii"),
-            decaps_time_ms=(t1 - t0) * 1000.0,
-        )
+        # Una clave KEM efímera no vuelve a usarse: no ocupar hueco en el pool.
+        if ephemeral and self.context_pool is not None:
+            self.context_pool.discard(alg_name, secret_key)
+
+        return DecapsulateResult(shared_secret=shared_secret, decaps_time_ms=(t1 - t0) * 1000.0)
+
+    def sign_many(self, alg_name: str, items: Sequence[tuple[bytes, bytes]]) -> BatchSignResult:
+        """Firma una lista de (mensaje, clave_secreta) con un único contexto por clave."""
+        sigs: list[bytes] = []
+        times_ms: list[float] = []
+        with ExitStack() as stack:
+            contexts: dict = {}
+            t_batch0 = time.perf_counter()
+            for message_bytes, secret_key in items:
+                sig = contexts.get(secret_key)
+                if sig is None:
+                    sig = stack.enter_context(self._signature_ctx(alg_name, secret_key))
+                    contexts[secret_key] = sig
+                t0 = time.perf_counter()
+                sigs.append(sig.sign(message_bytes))
+                times_ms.append((time.perf_counter() - t0) * 1000.0)
+            total_ms = (time.perf_counter() - t_batch0) * 1000.0
+
+        return BatchSignResult(sigs=sigs, sign_times_ms=times_ms, total_time_ms=total_ms)
+
+    def verify_many(self, alg_name: str, items: Sequence[tuple[bytes, bytes, bytes]]) -> BatchVerifyResult:
+        """Verifica una lista de (mensaje, firma, clave_pública) con un único contexto."""
+        oks: list[bool] = []
+        times_ms: list[float] = []
+        with self._signature_ctx(alg_name) as sig:
+            t_batch0 = time.perf_counter()
+            for message_bytes, sig_bytes, pk_bytes in items:
+                t0 = time.perf_counter()
+                try:
+                    ok = bool(sig.verify(message_bytes, sig_bytes, pk_bytes))
+                except Exception:
+                    ok = False
+                times_ms.append((time.perf_counter() - t0) * 1000.0)
+                oks.append(ok)
+            total_ms = (time.perf_counter() - t_batch0) * 1000.0
+
+        return BatchVerifyResult(ok=oks, verify_times_ms=times_ms, total_time_ms=total_ms)
+
+    def close(self) -> None:
+        if self.context_pool is not None:
+            self.context_pool.close()
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from crypto.pqc_wrapper import PQCProvider, b64decode_str, b64encode_str
+
+
+def key_id_for(alg_name: str, public_key: bytes) -> str:
+    """Identificador corto de una clave pública: SHA-256 de (alg, pk), 16 bytes en hex."""
+    h = hashlib.sha256()
+    h.update(alg_name.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(public_key)
+    return h.hexdigest()[:32]
+
+
+@dataclass
+class SigningIdentity:
+    alg_name: str
+    public_key: bytes
+    secret_key: bytes
+    key_id: str
+    keygen_time_ms: float  # 0 si se cargó de disco
+
+    @property
+    def public_key_b64(self) -> str:
+        return b64encode_str(self.public_key)
+
+
+def _identity_path(directory: str, alg_name: str) -> Path:
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in alg_name)
+    return Path(directory) / f"{safe}.json"
+
+
+def load_or_create_identity(pqc: PQCProvider, alg_name: str, directory: str | None = None) -> SigningIdentity:
+    """
+    Identidad de firma de larga duración para `alg_name`.
+
+    Sin `directory` el keypair vive solo en memoria (uno por ejecución). Con `directory`
+    se lee `<dir>/<alg>.json` si existe y, si no, se genera y se guarda con permisos 0600.
+    """
+    path = _identity_path(directory, alg_name) if directory else None
+    if path is not None and path.exists():
+        data = json.loads(path.read_text(encoding="utf-8"))
+        public_key = b64decode_str(data["public_key_b64"])
+        return SigningIdentity(
+            alg_name=alg_name,
+            public_key=public_key,
+            secret_key=b64decode_str(data["secret_key_b64"]),
+            key_id=key_id_for(alg_name, public_key),
+            keygen_time_ms=0.0,
+        )
+
+    kp = pqc.generate_signature_keypair(alg_name)
+    identity = SigningIdentity(
+        alg_name=alg_name,
+        public_key=kp.public_key,
+        secret_key=kp.secret_key,
+        key_id=key_id_for(alg_name, kp.public_key),
+        keygen_time_ms=kp.keygen_time_ms,
+    )
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps(
+            {"alg": alg_name, "public_key_b64": kp.public_key_b64, "secret_key_b64": kp.secret_key_b64}
+        )
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(payload)
+    return identity
+
+
+class PublicKeyCache:
+    """
+    Claves públicas anunciadas por los emisores (key ID -> (alg, clave pública)).
+
+    Solo se admite una clave si su key ID coincide con el calculado, así que una
+    entrada no puede suplantar a otra. LRU acotada a `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(1, max_entries)
+        self._keys: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key_id: str, alg_name: str) -> bytes | None:
+        entry = self._keys.get(key_id)
+        if entry is None or entry[0] != alg_name:
+            self.misses += 1
+            return None
+        self._keys.move_to_end(key_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key_id: str, alg_name: str, public_key: bytes) -> bool:
+        if key_id_for(alg_name, public_key) != key_id:
+            return False
+        self._keys[key_id] = (alg_name, public_key)
+        self._keys.move_to_end(key_id)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+        return True
+
+    def stats(self) -> dict:
+        return {"keys": len(self._keys), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,85 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Coste aproximado por entrada: clave (bytes de 32) + tupla + nodo del OrderedDict.
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def verify_cache_key(alg_name: str, message_bytes: bytes, sig_bytes: bytes, pk_bytes: bytes) -> bytes:
+    """Digest de (alg, clave pública, mensaje, firma); los campos van prefijados por longitud."""
+    h = hashlib.blake2b(digest_size=32)
+    for part in (alg_name.encode("utf-8"), pk_bytes, message_bytes, sig_bytes):
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.digest()
+
+
+class VerifyCache:
+    """
+    Caché LRU + TTL de resultados de verificación de firmas.
+
+    - La clave es un digest de las entradas, no las entradas: una firma SPHINCS+
+      repetida cuesta un hash y una búsqueda, y la memoria por entrada es fija.
+    - Se acota por número de entradas (`max_entries`) y por memoria estimada
+      (`max_bytes`); al superarse se expulsa la entrada menos usada.
+    - Se guardan resultados válidos e inválidos: la verificación es determinista.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 1 << 20, ttl_s: float | None = 300.0):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(_ENTRY_OVERHEAD_BYTES, max_bytes)
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def bytes_used(self) -> int:
+        return len(self._entries) * _ENTRY_OVERHEAD_BYTES
+
+    def get(self, key: bytes) -> bool | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            ok, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return ok
+
+    def put(self, key: bytes, ok: bool) -> None:
+        expires_at = None if self.ttl_s is None else time.monotonic() + self.ttl_s
+        with self._lock:
+            self._entries[key] = (bool(ok), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries or self.bytes_used > self.max_bytes:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,20 +1,23 @@
 import asyncio
 import argparse
-import csv
 import os
 import time
-import psutil as _psutil
 import slixmpp
 from slixmpp.xmlstream import ET
 from crypto.pqc_wrapper import PQCProvider
+from crypto.oqs_pool import OQSContextPool
+from crypto.async_provider import AsyncPQCProvider
+from crypto.signing_identity import load_or_create_identity
 from crypto import xmpp_env
-from metrics.realtime import RealtimeStats
+from metrics.realtime import RealtimeStatsByLabel
+from metrics.resources import ResourceProbe, ResourceSampler
+from metrics.sink import MetricsSink
+from metrics.throughput import append_throughput_row, measure_signature_throughput, print_throughput_row
 
 NS = "urn:uma:tfm:pqc:0"
 
 OUT_CSV = "artifacts/csv/sender_metrics.csv"
 
-_PROC = _psutil.Process()
 
 # Algoritmos disponibles (family, alg_name)
 _ALL_ALGS = [
@@ -32,7 +35,8 @@ _ALG_FAMILIES = {
 
 class EmisorBench(slixmpp.ClientXMPP):
     def __init__(self, jid, password, recipient, startup_timeout_s=20,
-                 algs=None, iterations=100):
+                 algs=None, iterations=100, throughput_batch=0,
+                 identity_mode="ephemeral", identity_dir=None):
         super().__init__(jid, password)
 
         self.use_tls = False
@@ -46,22 +50,33 @@ class EmisorBench(slixmpp.ClientXMPP):
         self.startup_timeout_s = startup_timeout_s
         self.session_ready = False
         self.exit_code = 0
-        self.pqc = PQCProvider()
+        self.pqc = PQCProvider(context_pool=OQSContextPool())
+        self.apqc = AsyncPQCProvider(self.pqc)
+        self.probe = ResourceProbe(sampler=ResourceSampler(source="signature_sender"))
         self.algs = algs if algs is not None else _ALL_ALGS
         self.iterations = max(1, iterations)
+        self.throughput_batch = max(0, throughput_batch)
+        # ephemeral: keypair nuevo y clave pública en cada stanza.
+        # persistent: una identidad por algoritmo; la clave se anuncia hasta que llega el
+        # primer receipt (el receptor lo envía tras verificar y guardar la clave) y después
+        # cada stanza lleva solo su key ID. Si el receptor no la conoce, responde con un NACK
+        # `clave_desconocida` y la stanza se reenvía con la clave.
+        self.identity_mode = identity_mode
+        self.identity_dir = identity_dir
+        self.advertised: set[str] = set()
 
         self.pending = {}  # msg_id -> (send_time_perf, future)
         self.net_baseline_rtt_ms = float("nan")
 
         self.add_event_handler("session_start", self.start)
         self.add_event_handler("receipt_received", self.on_receipt)
+        self.add_event_handler("message", self.on_message)
         self.add_event_handler("failed_auth", self.on_failed_auth)
         self.add_event_handler("connection_failed", self.on_connection_failed)
         self.add_event_handler("disconnected", self.on_disconnected)
 
         # CSV
-        self.csv_f = open(OUT_CSV, "w", newline="", encoding="utf-8")
-        self.writer = csv.DictWriter(self.csv_f, fieldnames=[
+        self.metrics = MetricsSink(OUT_CSV, append=False, fieldnames=[
             "ts_unix",
             "alg_family",
             "alg_name",
@@ -81,9 +96,13 @@ class EmisorBench(slixmpp.ClientXMPP):
             "mem_delta_kb",
             "cpu_user_ms",
             "cpu_sys_ms",
+            "sign_queue_ms",
+            "identity_mode",
+            "key_id",
+            "pk_sent",
+            "key_nack",
         ])
-        self.writer.writeheader()
-        self.stats = RealtimeStats(window=50)
+        self.stats = RealtimeStatsByLabel()
 
     async def start(self, _):
         self.session_ready = True
@@ -130,6 +149,46 @@ class EmisorBench(slixmpp.ClientXMPP):
             if not fut.done():
                 fut.set_result(rtt_ms)
 
+    def on_message(self, msg):
+        err = msg.xml.find(f"{{{NS}}}pqc_error")
+        if err is None:
+            return
+        # NACK de clave: se resuelve el envío pendiente con None para que se repita con la clave.
+        self.advertised.discard(err.get("kid") or "")
+        pending = self.pending.pop(err.get("ref") or "", None)
+        if pending is not None and not pending[1].done():
+            pending[1].set_result(None)
+
+    def _build_stanza(self, body: str, alg_name: str, sig_b64: str, key_id: str, public_key_b64: str, pk_sent: int):
+        msg = self.make_message(mto=self.recipient, mbody=body, mtype="chat")
+        msg_id = msg["id"] = self.new_id()
+        msg["request_receipt"] = True
+
+        pqc_tag = ET.Element(f"{{{NS}}}pqc_auth")
+        pqc_tag.set("alg", alg_name)
+
+        sig_el = ET.SubElement(pqc_tag, f"{{{NS}}}sig")
+        sig_el.text = sig_b64
+
+        if key_id:
+            pqc_tag.set("kid", key_id)
+        if pk_sent:
+            pk_el = ET.SubElement(pqc_tag, f"{{{NS}}}pk")
+            pk_el.text = public_key_b64
+
+        msg.xml.append(pqc_tag)
+        return msg, msg_id
+
+    async def _send_and_wait(self, msg, msg_id: str, t_send: float):
+        """RTT en ms desde `t_send`, None si el receptor respondió con NACK de clave; TimeoutError a los 10 s."""
+        fut = asyncio.get_event_loop().create_future()
+        self.pending[msg_id] = (t_send, fut)
+        msg.send()
+        try:
+            return await asyncio.wait_for(fut, timeout=10.0)
+        finally:
+            self.pending.pop(msg_id, None)
+
     async def _measure_baseline_rtt(self, n: int = 5) -> float:
         """Mide el RTT de mensajes XMPP sin PQC (referencia de latencia de red)."""
         rtts = []
@@ -155,67 +214,77 @@ class EmisorBench(slixmpp.ClientXMPP):
         for family, alg_name in self.algs:
             n = self.iterations
             print(f"\n== Benchmark {family}: {alg_name} ({n} mensajes) ==")
+            identity = None
+            if self.identity_mode == "persistent":
+                identity = load_or_create_identity(self.pqc, alg_name, self.identity_dir)
+                print(f"Identidad {alg_name}: key_id={identity.key_id} (keygen {identity.keygen_time_ms:.2f} ms)")
             for i in range(1, n + 1):
                 seq_global += 1
                 body = f"[{family} #{i}] Mensaje benchmark UMA"
                 body_bytes = len(body.encode("utf-8"))
 
                 # Keygen + firma separados para medir ambos tiempos
-                _t_cpu0 = _PROC.cpu_times()
-                _mem0_kb = _PROC.memory_info().rss >> 10
-                kp = self.pqc.generate_signature_keypair(alg_name)
-                sign_res = self.pqc.sign_with_secret_key(
+                _t_cpu0 = self.probe.cpu()
+                _mem0_kb = self.probe.rss_kb()
+                if identity is None:
+                    kp = (await self.apqc.generate_signature_keypair(alg_name)).value
+                    secret_key, public_key, public_key_b64 = kp.secret_key, kp.public_key, kp.public_key_b64
+                    sig_keygen_time_ms = kp.keygen_time_ms
+                    key_id = ""
+                else:
+                    secret_key, public_key, public_key_b64 = identity.secret_key, identity.public_key, identity.public_key_b64
+                    sig_keygen_time_ms = 0.0
+                    key_id = identity.key_id
+                timed_sign = await self.apqc.sign_with_secret_key_raw(
                     alg_name,
                     body.encode("utf-8"),
-                    kp.secret_key_b64,
-                    kp.public_key_b64,
+                    secret_key,
+                    public_key,
                 )
-                _mem1_kb = _PROC.memory_info().rss >> 10
-                _t_cpu1 = _PROC.cpu_times()
-                cpu_user_ms = (_t_cpu1.user - _t_cpu0.user) * 1000.0
-                cpu_sys_ms  = (_t_cpu1.system - _t_cpu0.system) * 1000.0
+                sign_res = timed_sign.value
+                _mem1_kb = self.probe.rss_kb()
+                _t_cpu1 = self.probe.cpu()
+                cpu_user_ms = (_t_cpu1[0] - _t_cpu0[0]) * 1000.0
+                cpu_sys_ms  = (_t_cpu1[1] - _t_cpu0[1]) * 1000.0
                 mem_rss_kb   = _mem1_kb
                 mem_delta_kb = _mem1_kb - _mem0_kb
 
                 # Serializar stanza con campos PQC (medir tiempo)
                 _t0_ser = time.perf_counter()
-                msg = self.make_message(mto=self.recipient, mbody=body, mtype="chat")
-                msg_id = msg["id"] = self.new_id()
-                msg["request_receipt"] = True
-
-                pqc_tag = ET.Element(f"{{{NS}}}pqc_auth")
-                pqc_tag.set("alg", alg_name)
-
-                sig_el = ET.SubElement(pqc_tag, f"{{{NS}}}sig")
-                sig_el.text = sign_res.sig_b64
-
-                pk_el = ET.SubElement(pqc_tag, f"{{{NS}}}pk")
-                pk_el.text = kp.public_key_b64
-
-                msg.xml.append(pqc_tag)
+                pk_sent = int(not key_id or key_id not in self.advertised)
+                msg, msg_id = self._build_stanza(body, alg_name, sign_res.sig_b64, key_id, public_key_b64, pk_sent)
 
                 stanza_bytes = len(ET.tostring(msg.xml, encoding="utf-8"))
                 serialize_time_ms = (time.perf_counter() - _t0_ser) * 1000.0
 
-                pk_b64_bytes = len(kp.public_key_b64.encode("ascii"))
-                sig_b64_bytes = len(sign_res.sig_b64.encode("ascii"))
+                # base64 es ASCII: longitud en caracteres == longitud en bytes
+                pk_b64_bytes = len(public_key_b64) if pk_sent else 0
+                sig_b64_bytes = len(sign_res.sig_b64)
 
                 # Enviar y esperar receipt con timeout
-                fut = asyncio.get_event_loop().create_future()
                 t_send = time.perf_counter()
-                self.pending[msg_id] = (t_send, fut)
-
-                msg.send()
-
                 rtt_ms = float("nan")
                 receipt_ok = 0
+                key_nack = 0
                 try:
-                    rtt_ms = await asyncio.wait_for(fut, timeout=10.0)
-                    receipt_ok = 1
+                    rtt = await self._send_and_wait(msg, msg_id, t_send)
+                    if rtt is None:
+                        # El receptor no tiene la clave: misma firma, ahora con la clave pública.
+                        # El RTT se sigue midiendo desde el primer envío.
+                        key_nack = pk_sent = 1
+                        msg, msg_id = self._build_stanza(body, alg_name, sign_res.sig_b64, key_id, public_key_b64, 1)
+                        stanza_bytes += len(ET.tostring(msg.xml, encoding="utf-8"))
+                        pk_b64_bytes = len(public_key_b64)
+                        rtt = await self._send_and_wait(msg, msg_id, t_send)
+                    if rtt is not None:
+                        rtt_ms = rtt
+                        receipt_ok = 1
+                        if key_id and pk_sent:
+                            # El receipt sale después de verificar y guardar la clave en el receptor.
+                            self.advertised.add(key_id)
                 except asyncio.TimeoutError:
                     # no receipt; lo dejamos como NaN y seguimos
-                    if msg_id in self.pending:
-                        self.pending.pop(msg_id, None)
+                    pass
 
                 row = {
                     "ts_unix": time.time(),
@@ -227,7 +296,7 @@ class EmisorBench(slixmpp.ClientXMPP):
                     "stanza_bytes": stanza_bytes,
                     "pk_b64_bytes": pk_b64_bytes,
                     "sig_b64_bytes": sig_b64_bytes,
-                    "sig_keygen_time_ms": kp.keygen_time_ms,
+                    "sig_keygen_time_ms": sig_keygen_time_ms,
                     "sign_time_ms": sign_res.sign_time_ms,
                     "serialize_time_ms": serialize_time_ms,
                     "rtt_ms": rtt_ms,
@@ -237,26 +306,39 @@ class EmisorBench(slixmpp.ClientXMPP):
                     "mem_delta_kb": mem_delta_kb,
                     "cpu_user_ms": cpu_user_ms,
                     "cpu_sys_ms": cpu_sys_ms,
+                    "sign_queue_ms": timed_sign.queue_wait_ms,
+                    "identity_mode": self.identity_mode,
+                    "key_id": key_id,
+                    "pk_sent": pk_sent,
+                    "key_nack": key_nack,
                 }
-                self.writer.writerow(row)
-                self.csv_f.flush()
+                self.metrics.write(row)
 
                 # Realtime stats (consola)
-                self.stats.add(
+                self.stats[alg_name].add(
                     rtt_ms=rtt_ms,
                     sign_ms=sign_res.sign_time_ms,
                     stanza_bytes=stanza_bytes,
                 )
-                self.stats.maybe_print(prefix=f"[{alg_name}] ")
+                self.stats[alg_name].maybe_print(prefix=f"[{alg_name}] ")
 
                 # Pequeño pacing para no saturar
                 await asyncio.sleep(0.05)
 
+            if self.throughput_batch:
+                # La ráfaga es síncrona (segundos con SPHINCS+): en un hilo, para no bloquear
+                # el bucle de slixmpp (keepalives, receipts pendientes).
+                tp_row = await asyncio.get_running_loop().run_in_executor(
+                    None, measure_signature_throughput, self.pqc, alg_name, self.throughput_batch, "demo1_emisor"
+                )
+                append_throughput_row(tp_row)
+                print_throughput_row(tp_row, prefix=f"[{alg_name}] ")
+
     def close(self):
-        try:
-            self.csv_f.close()
-        except Exception:
-            pass
+        self.metrics.close()
+        self.probe.close()
+        self.apqc.shutdown()
+        self.pqc.close()
 
 
 if __name__ == "__main__":
@@ -272,6 +354,18 @@ if __name__ == "__main__":
         "--algorithms", choices=["ML-DSA", "SPHINCS", "all"], default="all",
         help="Familia de algoritmos a ejecutar (default: all)"
     )
+    parser.add_argument(
+        "--throughput-batch", type=int, default=0,
+        help="Tamaño de ráfaga sign_many/verify_many por algoritmo para medir ops/s (0 = desactivado)"
+    )
+    parser.add_argument(
+        "--identity", choices=["ephemeral", "persistent"], default="ephemeral",
+        help="ephemeral: keypair y clave pública por mensaje; persistent: una identidad por algoritmo y key ID en la stanza"
+    )
+    parser.add_argument(
+        "--identity-dir", default=None,
+        help="Directorio donde guardar/cargar la identidad persistente (<alg>.json); sin él, solo en memoria"
+    )
     args = parser.parse_args()
 
     emisor_jid = xmpp_env.get_xmpp_jid("EMISOR")
@@ -283,11 +377,17 @@ if __name__ == "__main__":
         startup_timeout_s=args.startup_timeout,
         algs=_ALG_FAMILIES[args.algorithms],
         iterations=args.iterations,
+        throughput_batch=args.throughput_batch,
+        identity_mode=args.identity,
+        identity_dir=args.identity_dir,
     )
     bot.register_plugin("xep_0030")
     bot.register_plugin("xep_0184")  # Delivery Receipts
 
     bot.connect(host=args.host, port=args.port)
     bot.loop.call_later(args.startup_timeout, bot._startup_watchdog)
-    bot.loop.run_forever()
+    try:
+        bot.loop.run_forever()
+    finally:
+        bot.close()
     raise SystemExit(bot.exit_code)
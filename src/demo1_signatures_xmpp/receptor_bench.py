@@ -1,23 +1,26 @@
 import argparse
-import csv
 import os
+import signal
 import time
-import psutil as _psutil
 import slixmpp
 from slixmpp.xmlstream import ET
-from crypto.pqc_wrapper import PQCProvider
+from crypto.pqc_wrapper import PQCProvider, b64decode_str
+from crypto.oqs_pool import OQSContextPool
+from crypto.async_provider import AsyncPQCProvider
+from crypto.signing_identity import PublicKeyCache
 from crypto.xmpp_env import get_xmpp_host, get_xmpp_jid, get_xmpp_password, get_xmpp_port
-from metrics.realtime import RealtimeStats
+from metrics.realtime import RealtimeStatsByLabel
+from metrics.resources import ResourceProbe, ResourceSampler
+from metrics.sink import MetricsSink
 
 NS = "urn:uma:tfm:pqc:0"
 
 OUT_CSV = "artifacts/csv/receiver_metrics.csv"
 
-_PROC = _psutil.Process()
 
 
 class ReceptorBench(slixmpp.ClientXMPP):
-    def __init__(self, jid, password, startup_timeout_s=20):
+    def __init__(self, jid, password, startup_timeout_s=20, key_cache_size=1024):
         super().__init__(jid, password)
 
         # Laboratorio local (sin TLS)
@@ -31,7 +34,12 @@ class ReceptorBench(slixmpp.ClientXMPP):
         self.session_ready = False
         self.exit_code = 0
 
-        self.pqc = PQCProvider()
+        self.pqc = PQCProvider(context_pool=OQSContextPool())
+        self.apqc = AsyncPQCProvider(self.pqc)
+        self.probe = ResourceProbe(sampler=ResourceSampler(source="signature_receiver"))
+        # Claves de emisores con identidad persistente (stanzas con kid y sin pk).
+        self.public_keys = PublicKeyCache(max_entries=key_cache_size)
+        self.key_nacks = 0
 
         self.add_event_handler("session_start", self.start)
         self.add_event_handler("message", self.on_message)
@@ -40,8 +48,7 @@ class ReceptorBench(slixmpp.ClientXMPP):
         self.add_event_handler("disconnected", self.on_disconnected)
 
         # CSV
-        self.csv_f = open(OUT_CSV, "w", newline="", encoding="utf-8")
-        self.writer = csv.DictWriter(self.csv_f, fieldnames=[
+        self.metrics = MetricsSink(OUT_CSV, append=False, fieldnames=[
             "ts_unix",
             "from",
             "msg_id",
@@ -56,9 +63,11 @@ class ReceptorBench(slixmpp.ClientXMPP):
             "cpu_user_ms",
             "cpu_sys_ms",
             "mem_rss_kb",
+            "verify_queue_ms",
+            "key_id",
+            "key_cached",
         ])
-        self.writer.writeheader()
-        self.stats = RealtimeStats(window=50)
+        self.stats = RealtimeStatsByLabel()
 
     async def start(self, _):
         self.session_ready = True
@@ -86,7 +95,7 @@ class ReceptorBench(slixmpp.ClientXMPP):
             self.exit_code = 2
             self.disconnect()
 
-    def on_message(self, msg):
+    async def on_message(self, msg):
         if msg["type"] not in ("chat", "normal"):
             return
 
@@ -104,6 +113,7 @@ class ReceptorBench(slixmpp.ClientXMPP):
             return
 
         alg = pqc.get("alg") or "UNKNOWN"
+        key_id = pqc.get("kid") or ""
         sig_el = pqc.find(f"{{{NS}}}sig")
         pk_el = pqc.find(f"{{{NS}}}pk")
         sig_b64 = (sig_el.text or "").strip() if sig_el is not None else ""
@@ -111,13 +121,29 @@ class ReceptorBench(slixmpp.ClientXMPP):
         deserialize_time_ms = (time.perf_counter() - _t0_deser) * 1000.0
 
         # Verificación con métricas CPU/memoria
-        _t_cpu0 = _PROC.cpu_times()
-        _mem0_kb = _PROC.memory_info().rss >> 10
-        vr = self.pqc.verify_signature(alg, body.encode("utf-8"), sig_b64, pk_b64)
-        _mem1_kb = _PROC.memory_info().rss >> 10
-        _t_cpu1 = _PROC.cpu_times()
-        cpu_user_ms = (_t_cpu1.user - _t_cpu0.user) * 1000.0
-        cpu_sys_ms  = (_t_cpu1.system - _t_cpu0.system) * 1000.0
+        _t_cpu0 = self.probe.cpu()
+        try:
+            sig_bytes = b64decode_str(sig_b64)
+            pk_bytes = b64decode_str(pk_b64)
+        except Exception:
+            sig_bytes, pk_bytes = b"", b""
+        key_cached = 0
+        if key_id and not pk_b64:
+            # Solo key ID: la clave se anunció antes.
+            pk_bytes = self.public_keys.get(key_id, alg) or b""
+            key_cached = int(bool(pk_bytes))
+            if not key_cached:
+                # NACK (expulsión LRU, reinicio): el emisor reenviará la stanza con la clave pública.
+                self._send_key_nack(msg, key_id)
+                return
+        timed = await self.apqc.verify_signature_raw(alg, body.encode("utf-8"), sig_bytes, pk_bytes)
+        vr = timed.value
+        if key_id and pk_b64 and vr.ok:
+            self.public_keys.put(key_id, alg, pk_bytes)
+        _mem1_kb = self.probe.rss_kb()
+        _t_cpu1 = self.probe.cpu()
+        cpu_user_ms = (_t_cpu1[0] - _t_cpu0[0]) * 1000.0
+        cpu_sys_ms  = (_t_cpu1[1] - _t_cpu0[1]) * 1000.0
         mem_rss_kb  = _mem1_kb
 
         # Log
@@ -128,43 +154,56 @@ class ReceptorBench(slixmpp.ClientXMPP):
             "alg": alg,
             "stanza_bytes": stanza_bytes,
             "body_bytes": body_bytes,
-            "pk_b64_bytes": len(pk_b64.encode("ascii")),
-            "sig_b64_bytes": len(sig_b64.encode("ascii")),
+            "pk_b64_bytes": len(pk_b64),
+            "sig_b64_bytes": len(sig_b64),
             "deserialize_time_ms": deserialize_time_ms,
             "verify_time_ms": vr.verify_time_ms,
             "verify_ok": int(bool(vr.ok)),
             "cpu_user_ms": cpu_user_ms,
             "cpu_sys_ms": cpu_sys_ms,
             "mem_rss_kb": mem_rss_kb,
+            "verify_queue_ms": timed.queue_wait_ms,
+            "key_id": key_id,
+            "key_cached": key_cached,
         }
-        self.writer.writerow(row)
-        self.csv_f.flush()
+        self.metrics.write(row)
 
         # Realtime stats (consola)
-        self.stats.add(
+        self.stats[alg].add(
             verify_ms=vr.verify_time_ms,
             stanza_bytes=stanza_bytes,
         )
-        self.stats.maybe_print(prefix=f"[{alg}] ")
+        self.stats[alg].maybe_print(prefix=f"[{alg}] ")
 
 
         # Responder receipt (RTT en el emisor)
         self._send_receipt_if_requested(msg)
 
+    def _send_key_nack(self, msg, key_id: str):
+        self.key_nacks += 1
+        nack = self.make_message(mto=msg["from"], mtype="chat")
+        err = ET.SubElement(nack.xml, f"{{{NS}}}pqc_error")
+        err.set("reason", "clave_desconocida")
+        err.set("kid", key_id)
+        err.set("ref", msg["id"])
+        nack.send()
+
     def _send_receipt_if_requested(self, msg):
-        # Slixmpp XEP-0184: si el emisor lo pidió, contestamos.
+        # Slixmpp XEP-0184: si el emisor lo pidió, contestamos (auto_ack desactivado: el receipt
+        # sale tras verificar, así que el RTT del emisor incluye la verificación).
         try:
             if msg["request_receipt"]:
-                msg.reply().send_receipt(msg["id"])
+                self.plugin["xep_0184"].ack(msg)
         except Exception:
             # No matamos el receptor por receipts
             pass
 
     def close(self):
-        try:
-            self.csv_f.close()
-        except Exception:
-            pass
+        self.metrics.close()
+        self.probe.close()
+        print("Claves por key ID:", self.public_keys.stats(), f"nacks={self.key_nacks}")
+        self.apqc.shutdown()
+        self.pqc.close()
 
 
 if __name__ == "__main__":
@@ -172,16 +211,31 @@ if __name__ == "__main__":
     parser.add_argument("--host", default=get_xmpp_host())
     parser.add_argument("--port", type=int, default=get_xmpp_port())
     parser.add_argument("--startup-timeout", type=int, default=20)
+    parser.add_argument(
+        "--key-cache-size", type=int, default=1024,
+        help="Claves públicas recordadas por key ID para emisores con identidad persistente (default: 1024)"
+    )
     args = parser.parse_args()
 
     receptor_jid = get_xmpp_jid("RECEPTOR")
     receptor_password = get_xmpp_password("RECEPTOR")
 
-    bot = ReceptorBench(receptor_jid, receptor_password, startup_timeout_s=args.startup_timeout)
+    bot = ReceptorBench(
+        receptor_jid, receptor_password,
+        startup_timeout_s=args.startup_timeout,
+        key_cache_size=args.key_cache_size,
+    )
     bot.register_plugin("xep_0030")
-    bot.register_plugin("xep_0184")  # Delivery Receipts
+    # Delivery Receipts sin auto_ack: on_message es una corrutina y el plugin respondería antes de verificar.
+    bot.register_plugin("xep_0184", {"auto_ack": False})
 
     bot.connect(host=args.host, port=args.port)
     bot.loop.call_later(args.startup_timeout, bot._startup_watchdog)
-    bot.loop.run_forever()
+    # run_all_demos.sh lo para con SIGTERM: se sale del bucle y close() vuelca las métricas pendientes.
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        bot.loop.add_signal_handler(sig, bot.loop.stop)
+    try:
+        bot.loop.run_forever()
+    finally:
+        bot.close()
     raise SystemExit(bot.exit_code)
@@ -1,22 +1,44 @@
 import asyncio
 import argparse
-import base64
-import csv
 import os
+import random
 import time
-from pathlib import Path
-import psutil as _psutil
 
 import slixmpp
 from slixmpp.xmlstream import ET
 
-from crypto.pqc_wrapper import PQCProvider
+from crypto.pqc_wrapper import PQCProvider, b64decode_str
+from crypto.oqs_pool import OQSContextPool
+from crypto.executor import DEFAULT_PROCESS_ALGS
+from crypto.async_provider import AsyncPQCProvider
+from crypto.kem_pool import KEMKeypairPool
 from crypto.pqc_certificate import create_certificate, create_self_signed_certificate, certificate_to_pem
 from crypto import xmpp_env
-from metrics.realtime import RealtimeStats
-from demo2_hybrid_kem_signed.protocol import NS_HYBRID, hello_message_to_sign, sha256_hex_from_b64
+from metrics.csv_out import open_append_csv
+from metrics.histogram import LatencyHistogram
+from metrics.sink import MetricsSink
+from metrics.realtime import RealtimeStatsByLabel
+from metrics.resources import ResourceProbe, ResourceSampler
+from metrics.tracing import Tracer
+from demo2_hybrid_kem_signed.protocol import (
+    HYBRID_ENCODINGS,
+    HybridHelloData,
+    ResumptionTicket,
+    build_compact_hello_element,
+    build_hello_element,
+    build_resume_element,
+    decode_response_element,
+    derive_resumption_secret,
+    find_hybrid,
+    hello_message_to_sign,
+    resume_mac,
+    resumed_session_secret,
+    sha256_hex,
+    ticket_from_response,
+)
 
 OUT_CSV = "artifacts/csv/hybrid_xmpp_sender_metrics.csv"
+OUT_LOAD_CSV = "artifacts/csv/hybrid_xmpp_load_summary.csv"
 
 KEM_ALG = "ML-KEM-768"
 SIG_ALGS = [
@@ -24,8 +46,6 @@ SIG_ALGS = [
     ("SPHINCS", "SPHINCS+-SHA2-128s-simple", 30),
 ]
 
-_PROC = _psutil.Process()
-
 
 class EmisorHybridBench(slixmpp.ClientXMPP):
     def __init__(
@@ -41,6 +61,16 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
         qr_fingerprint_output_file: str | None,
         startup_timeout_s: int = 20,
         iterations: int = 30,
+        crypto_processes: int = 0,
+        offload_algs: tuple[str, ...] = DEFAULT_PROCESS_ALGS,
+        crypto_threads: int = 4,
+        kem_pool_size: int = 0,
+        kem_pool_low_water: int = 8,
+        window: int = 0,
+        rate: float = 0.0,
+        encoding: str = "xml",
+        cert_by_reference: bool = False,
+        resume: bool = False,
     ):
         super().__init__(jid, password)
 
@@ -52,7 +82,23 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
         self.boundjid.resource = "hybrid-send"
 
         self.recipient = recipient
-        self.pqc = PQCProvider()
+        self.pqc = PQCProvider(context_pool=OQSContextPool())
+        self.apqc = AsyncPQCProvider(
+            self.pqc,
+            max_threads=crypto_threads,
+            process_workers=crypto_processes,
+            process_algs=offload_algs,
+        )
+        # CPU por handshake con getrusage (proceso: incluye los hilos de cripto); RSS del muestreador.
+        self.probe = ResourceProbe(sampler=ResourceSampler(source="hybrid_xmpp_sender"))
+        # Spans por handshake (Chrome trace) si existe TRACE_DIR; si no, no hace nada.
+        self.tracer = Tracer.from_env("hybrid_xmpp_sender")
+        # Keypairs ML-KEM pregenerados fuera del camino crítico del handshake (0 = desactivado).
+        self.kem_pool = None
+        if kem_pool_size > 0:
+            self.kem_pool = KEMKeypairPool(
+                self.pqc, (KEM_ALG,), capacity=kem_pool_size, low_water=kem_pool_low_water
+            )
         self.verify_mode = verify_mode
         self.startup_timeout_s = startup_timeout_s
         self.session_ready = False
@@ -67,18 +113,35 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
 
         self.pending = {}
 
+        # Codificación del hello: xml (v1) o compact (v2); si el receptor no la acepta se baja a xml.
+        self.encoding = encoding
+        # Huellas cuyo certificado confirmó el receptor (atributo cert_ack de la respuesta).
+        self.cert_by_reference = cert_by_reference
+        self.cert_acked: set[str] = set()
+        # Tickets de reanudación emitidos por el receptor, uno por algoritmo de firma.
+        self.resume = resume
+        self.tickets: dict[str, ResumptionTicket] = {}
+
+        # Modo de carga: closed (uno tras otro), window (N pendientes) o rate (Poisson, R/s).
+        self.window = max(0, window)
+        self.rate = max(0.0, rate)
+        if self.rate > 0:
+            self.load_mode = "rate"
+        elif self.window > 0:
+            self.load_mode = "window"
+        else:
+            self.load_mode = "closed"
+
         self.add_event_handler("session_start", self.start)
         self.add_event_handler("message", self.on_message)
         self.add_event_handler("failed_auth", self.on_failed_auth)
         self.add_event_handler("connection_failed", self.on_connection_failed)
         self.add_event_handler("disconnected", self.on_disconnected)
 
-        os.makedirs("artifacts/csv", exist_ok=True)
-        csv_exists = Path(OUT_CSV).exists() and Path(OUT_CSV).stat().st_size > 0
-        self.csv_f = open(OUT_CSV, "a", newline="", encoding="utf-8")
-        self.writer = csv.DictWriter(
-            self.csv_f,
-            fieldnames=[
+        # Filas por handshake: búfer en memoria volcado por un hilo, fuera de la latencia medida.
+        self.metrics = MetricsSink(
+            OUT_CSV,
+            [
                 "ts_unix",
                 "alg_family",
                 "sig_alg",
@@ -103,11 +166,38 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
                 "mem_rss_kb",
                 "cpu_user_ms",
                 "cpu_sys_ms",
+                "sign_queue_ms",
+                "decaps_queue_ms",
+                "kem_pool_hit",
+                "kem_pool_keygen_ms",
+                "error_reason",
+                "encoding",
+                "cert_by_ref",
+                "cert_nack",
+                "resumed",
+                "resume_fallback",
+            ],
+        )
+        self.load_csv_f, self.load_writer = open_append_csv(
+            OUT_LOAD_CSV,
+            [
+                "ts_unix",
+                "alg_family",
+                "sig_alg",
+                "kem_alg",
+                "mode",
+                "window",
+                "target_rate_per_s",
+                "handshakes",
+                "ok",
+                "elapsed_s",
+                "throughput_per_s",
+                "rtt_p50_ms",
+                "rtt_p95_ms",
+                "rtt_p99_ms",
             ],
         )
-        if not csv_exists:
-            self.writer.writeheader()
-        self.stats = RealtimeStats(window=50)
+        self.stats = RealtimeStatsByLabel()
 
     def _load_text_file(self, path: str | None) -> str | None:
         if not path:
@@ -150,11 +240,12 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
             )
 
         identity = {
-            "secret_key_b64": signer_kp.secret_key_b64,
-            "public_key_b64": signer_kp.public_key_b64,
+            "secret_key": signer_kp.secret_key,
+            "public_key": signer_kp.public_key,
             "cert": cert,
             "cert_fingerprint": cert["fingerprint_sha256"],
             "cert_pem": certificate_to_pem(cert),
+            "cert_der": b64decode_str(cert["x509_der_b64"]),
         }
         self.identity_by_alg[sig_alg] = identity
         return identity
@@ -174,6 +265,9 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
         await self.get_roster()
         await asyncio.sleep(0.2)
 
+        self.apqc.warmup()
+        if self.kem_pool is not None:
+            self.kem_pool.wait_ready(timeout_s=30.0)
         print("EmisorHybridBench listo. CSV:", OUT_CSV)
         await self.run_benchmark()
         self.exit_code = 0
@@ -201,25 +295,52 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
             self.exit_code = 2
             self.disconnect()
 
-    def on_message(self, msg):
+    def _on_hybrid_error(self, msg):
+        # El receptor rechazó el hello (p. ej. cola llena): cerrar el handshake sin esperar al timeout.
+        error, _ = find_hybrid(msg.xml, "hybrid_error")
+        if error is None:
+            return
+        if error.get("reason") == "codificacion_no_soportada" and self.encoding != "xml":
+            print(f"WARN: el receptor no acepta la codificación {self.encoding}; se usa xml.")
+            self.encoding = "xml"
+        rec = self.pending.pop(error.get("nonce") or "", None)
+        if rec is None or rec["future"].done():
+            return
+        rec["future"].set_result(
+            {
+                "rtt_ms": (time.perf_counter() - rec["send_t0"]) * 1000.0,
+                "response_stanza_bytes": len(ET.tostring(msg.xml, encoding="utf-8")),
+                "decaps_time_ms": float("nan"),
+                "shared_secret_match": 0,
+                "ok": 0,
+                "sender_total_ms": (time.perf_counter() - rec["t_total_start"]) * 1000.0,
+                "kem_ct_bytes": 0,
+                "decaps_queue_ms": float("nan"),
+                "error_reason": error.get("reason") or "desconocido",
+            }
+        )
+
+    async def on_message(self, msg):
         if msg["type"] not in ("chat", "normal"):
             return
 
-        response = msg.xml.find(f"{{{NS_HYBRID}}}hybrid_response")
+        response, encoding = find_hybrid(msg.xml, "hybrid_response")
         if response is None:
+            self._on_hybrid_error(msg)
             return
 
-        nonce = response.get("nonce") or ""
+        try:
+            with self.tracer.span("parse", response.get("nonce") or "", encoding=encoding):
+                nonce, ciphertext, peer_hash = decode_response_element(response, encoding)
+        except ValueError:
+            return
         if nonce not in self.pending:
             return
 
-        ciphertext_el = response.find(f"{{{NS_HYBRID}}}ciphertext")
-        ss_hash_el = response.find(f"{{{NS_HYBRID}}}shared_secret_sha256")
-
-        ciphertext_b64 = (ciphertext_el.text or "").strip() if ciphertext_el is not None else ""
-        peer_hash = (ss_hash_el.text or "").strip() if ss_hash_el is not None else ""
-
         rec = self.pending.pop(nonce)
+        cert_ack = response.get("cert_ack")
+        if cert_ack:
+            self.cert_acked.add(cert_ack)
 
         rtt_ms = (time.perf_counter() - rec["send_t0"]) * 1000.0
         response_stanza_bytes = len(ET.tostring(msg.xml, encoding="utf-8"))
@@ -228,16 +349,28 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
         decaps_ms = float("nan")
         shared_secret_match = 0
         kem_ct_bytes = 0
+        decaps_queue_ms = float("nan")
 
         try:
-            dec = self.pqc.decapsulate_secret(
-                rec["kem_alg"], ciphertext_b64, rec["kem_secret_key_b64"]
-            )
+            with self.tracer.span("decaps", nonce, kem_alg=rec["kem_alg"]) as span:
+                timed = await self.apqc.decapsulate_secret_raw(
+                    rec["kem_alg"], ciphertext, rec["kem_secret_key"], ephemeral=True
+                )
+                span.set(queue_ms=timed.queue_wait_ms)
+            dec = timed.value
             decaps_ms = dec.decaps_time_ms
-            own_hash = sha256_hex_from_b64(dec.shared_secret_b64)
+            decaps_queue_ms = timed.queue_wait_ms
+            secret = dec.shared_secret
+            if rec["resumption_secret"] is not None:
+                secret = resumed_session_secret(rec["resumption_secret"], secret)
+            own_hash = sha256_hex(secret)
             shared_secret_match = int(own_hash == peer_hash)
             ok = int(shared_secret_match == 1)
-            kem_ct_bytes = len(base64.b64decode(ciphertext_b64)) if ciphertext_b64 else 0
+            kem_ct_bytes = len(ciphertext)
+            if ok and self.resume and response.get("ticket"):
+                self.tickets[rec["sig_alg"]] = ticket_from_response(
+                    response, derive_resumption_secret(dec.shared_secret, nonce)
+                )
         except Exception:
             ok = 0
 
@@ -253,135 +386,322 @@ class EmisorHybridBench(slixmpp.ClientXMPP):
                     "ok": ok,
                     "sender_total_ms": sender_total_ms,
                     "kem_ct_bytes": kem_ct_bytes,
+                    "decaps_queue_ms": decaps_queue_ms,
+                    "error_reason": "",
                 }
             )
 
-    async def run_benchmark(self):
-        for _, sig_alg, _ in SIG_ALGS:
-            self._build_identity_for_alg(sig_alg)
-        self._write_qr_fingerprints()
-
-        for family, sig_alg, _ in SIG_ALGS:
-            identity = self._build_identity_for_alg(sig_alg)
-            n = self.iterations
-            print(f"\n== {family} + {KEM_ALG} ({n} handshakes) ==")
-            for i in range(1, n + 1):
-                nonce = f"{family}-{i}-{time.time_ns()}"
-
-                t_total_start = time.perf_counter()
-                _t_cpu0 = _PROC.cpu_times()
-                _mem0_kb = _PROC.memory_info().rss >> 10
-                kem = self.pqc.generate_kem_keypair(KEM_ALG)
-                sign = self.pqc.sign_with_secret_key(
-                    sig_alg,
-                    hello_message_to_sign(KEM_ALG, kem.public_key_b64, nonce, identity["cert_fingerprint"]),
-                    identity["secret_key_b64"],
-                    identity["public_key_b64"],
+    def _build_hello_stanza(self, sig_alg, nonce, kem, sign, identity, encoding: str, include_cert: bool):
+        msg = self.make_message(mto=self.recipient, mbody="[HYBRID_HELLO]", mtype="chat")
+        msg["thread"] = nonce
+        if encoding == "compact":
+            hello = build_compact_hello_element(
+                KEM_ALG,
+                sig_alg,
+                nonce,
+                kem.public_key,
+                sign.sig,
+                identity["cert_der"] if include_cert else b"",
+                identity["cert_fingerprint"],
+            )
+        else:
+            hello = build_hello_element(
+                HybridHelloData(
+                    kem_alg=KEM_ALG,
+                    sig_alg=sig_alg,
+                    nonce=nonce,
+                    kem_pk_b64=kem.public_key_b64,
+                    sig_b64=sign.sig_b64,
+                    cert_pem=identity["cert_pem"] if include_cert else "",
+                    cert_fingerprint_sha256=identity["cert_fingerprint"],
                 )
-                _mem1_kb = _PROC.memory_info().rss >> 10
-                _t_cpu1 = _PROC.cpu_times()
-                cpu_user_ms = (_t_cpu1.user - _t_cpu0.user) * 1000.0
-                cpu_sys_ms  = (_t_cpu1.system - _t_cpu0.system) * 1000.0
-                mem_rss_kb  = _mem1_kb
+            )
+        msg.xml.append(hello)
+        return msg
 
-                kem_pk_bytes = len(base64.b64decode(kem.public_key_b64))
+    async def _send_hello(
+        self,
+        msg,
+        nonce: str,
+        kem,
+        t_total_start: float,
+        send_t0: float,
+        sig_alg: str,
+        resumption_secret: bytes | None = None,
+    ) -> dict:
+        fut = asyncio.get_event_loop().create_future()
+        self.pending[nonce] = {
+            "future": fut,
+            "send_t0": send_t0,
+            "t_total_start": t_total_start,
+            "kem_alg": KEM_ALG,
+            "kem_secret_key": kem.secret_key,
+            "kem_pk_bytes": len(kem.public_key),
+            "sig_alg": sig_alg,
+            "resumption_secret": resumption_secret,
+        }
 
-                # Serializar stanza hello con todos los campos PQC
-                _t0_ser = time.perf_counter()
-                msg = self.make_message(mto=self.recipient, mbody="[HYBRID_HELLO]", mtype="chat")
+        with self.tracer.span("send", nonce):
+            msg.send()
+
+        result = {
+            "rtt_ms": float("nan"),
+            "response_stanza_bytes": 0,
+            "decaps_time_ms": float("nan"),
+            "shared_secret_match": 0,
+            "ok": 0,
+            "sender_total_ms": float("nan"),
+            "kem_ct_bytes": 0,
+            "decaps_queue_ms": float("nan"),
+            "error_reason": "timeout",
+        }
+        try:
+            with self.tracer.span("await_response", nonce):
+                result = await asyncio.wait_for(fut, timeout=10.0)
+        except asyncio.TimeoutError:
+            self.pending.pop(nonce, None)
+        return result
+
+    def _take_ticket(self, sig_alg: str) -> ResumptionTicket | None:
+        if not self.resume:
+            return None
+        ticket = self.tickets.get(sig_alg)
+        if ticket is None or not ticket.usable():
+            self.tickets.pop(sig_alg, None)
+            return None
+        ticket.uses_left -= 1
+        return ticket
+
+    async def _run_handshake(self, family: str, sig_alg: str, identity: dict, i: int) -> dict:
+        nonce = f"{family}-{i}-{time.time_ns()}"
+
+        t_total_start = time.perf_counter()
+        _t_cpu0 = self.probe.cpu()
+        kem = self.kem_pool.try_take(KEM_ALG) if self.kem_pool is not None else None
+        kem_pool_hit = int(kem is not None)
+        if kem is None:
+            with self.tracer.span("kem_keygen", nonce, kem_alg=KEM_ALG):
+                kem = (await self.apqc.generate_kem_keypair(KEM_ALG)).value
+        kem_pk_bytes = len(kem.public_key)
+        encoding = self.encoding
+        fingerprint = identity["cert_fingerprint"]
+
+        hello_stanza_bytes = 0
+        serialize_time_ms = 0.0
+        cert_by_ref = 0
+        cert_nack = 0
+        resumed = 0
+        resume_fallback = 0
+        result = None
+
+        ticket = self._take_ticket(sig_alg)
+        if ticket is not None:
+            # Reanudación: un HMAC con el secreto del ticket sustituye a firma y certificado.
+            _t0_mac = time.perf_counter()
+            with self.tracer.span("resume_mac", nonce):
+                mac = resume_mac(ticket.secret, KEM_ALG, kem.public_key_b64, nonce, ticket.ticket_id)
+            sign_time_ms = (time.perf_counter() - _t0_mac) * 1000.0
+            sign_queue_ms = 0.0
+            _t_cpu1 = self.probe.cpu()
+
+            _t0_ser = time.perf_counter()
+            with self.tracer.span("xml_build", nonce, resumed=1):
+                msg = self.make_message(mto=self.recipient, mbody="[HYBRID_RESUME]", mtype="chat")
                 msg["thread"] = nonce
-
-                hello = ET.Element(f"{{{NS_HYBRID}}}hybrid_hello")
-                hello.set("kem_alg", KEM_ALG)
-                hello.set("sig_alg", sig_alg)
-                hello.set("nonce", nonce)
-
-                kem_pk_el = ET.SubElement(hello, f"{{{NS_HYBRID}}}kem_pk")
-                kem_pk_el.text = kem.public_key_b64
-
-                sig_el = ET.SubElement(hello, f"{{{NS_HYBRID}}}sig")
-                sig_el.text = sign.sig_b64
-
-                cert_el = ET.SubElement(hello, f"{{{NS_HYBRID}}}cert_pem")
-                cert_el.text = identity["cert_pem"]
-
-                cert_fp_el = ET.SubElement(hello, f"{{{NS_HYBRID}}}cert_fingerprint_sha256")
-                cert_fp_el.text = identity["cert_fingerprint"]
-
-                msg.xml.append(hello)
-
+                msg.xml.append(build_resume_element(KEM_ALG, nonce, kem.public_key_b64, ticket.ticket_id, mac))
                 hello_stanza_bytes = len(ET.tostring(msg.xml, encoding="utf-8"))
-                serialize_time_ms = (time.perf_counter() - _t0_ser) * 1000.0
-
-                fut = asyncio.get_event_loop().create_future()
-                self.pending[nonce] = {
-                    "future": fut,
-                    "send_t0": time.perf_counter(),
-                    "t_total_start": t_total_start,
-                    "kem_alg": KEM_ALG,
-                    "kem_secret_key_b64": kem.secret_key_b64,
-                    "kem_pk_bytes": kem_pk_bytes,
-                }
+            serialize_time_ms = (time.perf_counter() - _t0_ser) * 1000.0
 
-                msg.send()
+            result = await self._send_hello(
+                msg, nonce, kem, t_total_start, time.perf_counter(), sig_alg, resumption_secret=ticket.secret
+            )
+            if result is not None and result["ok"]:
+                resumed = 1
+            else:
+                # Ticket caducado o desconocido en el receptor, timeout, sobrecarga o secreto
+                # distinto: se descarta el ticket y se hace el handshake completo con nonce nuevo.
+                self.tickets.pop(sig_alg, None)
+                resume_fallback = 1
+                nonce = f"{nonce}-full"
+
+        if not resumed:
+            with self.tracer.span("sign", nonce, sig_alg=sig_alg) as span:
+                timed_sign = await self.apqc.sign_with_secret_key_raw(
+                    sig_alg,
+                    hello_message_to_sign(KEM_ALG, kem.public_key_b64, nonce, fingerprint),
+                    identity["secret_key"],
+                    identity["public_key"],
+                )
+                span.set(queue_ms=timed_sign.queue_wait_ms)
+            sign = timed_sign.value
+            sign_time_ms = sign.sign_time_ms
+            sign_queue_ms = timed_sign.queue_wait_ms
+            _t_cpu1 = self.probe.cpu()
+
+            # Tras el primer contacto aceptado, el certificado puede ir solo por su huella.
+            cert_by_ref = int(self.cert_by_reference and fingerprint in self.cert_acked)
+
+            # Serializar stanza hello con todos los campos PQC
+            _t0_ser = time.perf_counter()
+            with self.tracer.span("xml_build", nonce, encoding=encoding, cert_by_ref=cert_by_ref):
+                msg = self._build_hello_stanza(sig_alg, nonce, kem, sign, identity, encoding, include_cert=not cert_by_ref)
+                hello_stanza_bytes += len(ET.tostring(msg.xml, encoding="utf-8"))
+            serialize_time_ms += (time.perf_counter() - _t0_ser) * 1000.0
+
+            send_t0 = time.perf_counter()
+            result = await self._send_hello(msg, nonce, kem, t_total_start, send_t0, sig_alg)
+
+            if cert_by_ref and result["error_reason"] == "cert_desconocido":
+                # El receptor ya no tiene el certificado (reinicio, expulsión LRU): se reenvía el
+                # mismo hello con él; la firma cubre la huella, no el PEM, así que sigue valiendo.
+                cert_nack = 1
+                self.cert_acked.discard(fingerprint)
+                msg = self._build_hello_stanza(sig_alg, nonce, kem, sign, identity, encoding, include_cert=True)
+                hello_stanza_bytes += len(ET.tostring(msg.xml, encoding="utf-8"))
+                result = await self._send_hello(msg, nonce, kem, t_total_start, send_t0, sig_alg)
+
+        cpu_user_ms = (_t_cpu1[0] - _t_cpu0[0]) * 1000.0
+        cpu_sys_ms  = (_t_cpu1[1] - _t_cpu0[1]) * 1000.0
+        mem_rss_kb  = self.probe.rss_kb()
+        # Bytes del certificado según la codificación: DER en compact (ns v2, dentro del blob base64), PEM en xml.
+        cert_wire_bytes = len(identity["cert_der"]) if encoding == "compact" else len(identity["cert_pem"].encode("utf-8"))
+
+        row = {
+            "ts_unix": time.time(),
+            "alg_family": family,
+            "sig_alg": sig_alg,
+            "kem_alg": KEM_ALG,
+            "seq": i,
+            "nonce": nonce,
+            "hello_stanza_bytes": hello_stanza_bytes,
+            "response_stanza_bytes": result["response_stanza_bytes"],
+            # Con hit, el keygen lo pagó el hilo de relleno: fuera del camino del handshake.
+            "kem_keygen_time_ms": 0.0 if kem_pool_hit else kem.keygen_time_ms,
+            "sign_time_ms": sign_time_ms,
+            "serialize_time_ms": serialize_time_ms,
+            "decaps_time_ms": result["decaps_time_ms"],
+            "rtt_ms": result["rtt_ms"],
+            "sender_total_ms": result["sender_total_ms"],
+            "shared_secret_match": result["shared_secret_match"],
+            "ok": result["ok"],
+            "verify_mode": self.verify_mode,
+            "cert_fingerprint_sha256": identity["cert_fingerprint"],
+            "cert_bytes": 0 if resumed or (cert_by_ref and not cert_nack) else cert_wire_bytes,
+            "kem_pk_bytes": kem_pk_bytes,
+            "kem_ct_bytes": result["kem_ct_bytes"],
+            "mem_rss_kb": mem_rss_kb,
+            "cpu_user_ms": cpu_user_ms,
+            "cpu_sys_ms": cpu_sys_ms,
+            "sign_queue_ms": sign_queue_ms,
+            "decaps_queue_ms": result["decaps_queue_ms"],
+            "kem_pool_hit": kem_pool_hit,
+            "kem_pool_keygen_ms": kem.keygen_time_ms if kem_pool_hit else 0.0,
+            "error_reason": result["error_reason"],
+            "encoding": encoding,
+            "cert_by_ref": cert_by_ref,
+            "cert_nack": cert_nack,
+            "resumed": resumed,
+            "resume_fallback": resume_fallback,
+        }
+        self.metrics.write(row)
 
-                result = {
-                    "rtt_ms": float("nan"),
-                    "response_stanza_bytes": 0,
-                    "decaps_time_ms": float("nan"),
-                    "shared_secret_match": 0,
-                    "ok": 0,
-                    "sender_total_ms": float("nan"),
-                    "kem_ct_bytes": 0,
-                }
-                try:
-                    result = await asyncio.wait_for(fut, timeout=10.0)
-                except asyncio.TimeoutError:
-                    self.pending.pop(nonce, None)
-
-                row = {
-                    "ts_unix": time.time(),
-                    "alg_family": family,
-                    "sig_alg": sig_alg,
-                    "kem_alg": KEM_ALG,
-                    "seq": i,
-                    "nonce": nonce,
-                    "hello_stanza_bytes": hello_stanza_bytes,
-                    "response_stanza_bytes": result["response_stanza_bytes"],
-                    "kem_keygen_time_ms": kem.keygen_time_ms,
-                    "sign_time_ms": sign.sign_time_ms,
-                    "serialize_time_ms": serialize_time_ms,
-                    "decaps_time_ms": result["decaps_time_ms"],
-                    "rtt_ms": result["rtt_ms"],
-                    "sender_total_ms": result["sender_total_ms"],
-                    "shared_secret_match": result["shared_secret_match"],
-                    "ok": result["ok"],
-                    "verify_mode": self.verify_mode,
-                    "cert_fingerprint_sha256": identity["cert_fingerprint"],
-                    "cert_bytes": len(identity["cert_pem"].encode("utf-8")),
-                    "kem_pk_bytes": kem_pk_bytes,
-                    "kem_ct_bytes": result["kem_ct_bytes"],
-                    "mem_rss_kb": mem_rss_kb,
-                    "cpu_user_ms": cpu_user_ms,
-                    "cpu_sys_ms": cpu_sys_ms,
-                }
-                self.writer.writerow(row)
-                self.csv_f.flush()
+        self.stats[sig_alg].add(
+            rtt_ms=result["rtt_ms"],
+            sign_ms=sign_time_ms,
+            stanza_bytes=hello_stanza_bytes,
+        )
+        self.stats[sig_alg].maybe_print(prefix=f"[{sig_alg}] ")
+        return row
+
+    async def _run_closed_loop(self, family: str, sig_alg: str, identity: dict, n: int) -> list[dict]:
+        rows = []
+        for i in range(1, n + 1):
+            rows.append(await self._run_handshake(family, sig_alg, identity, i))
+            await asyncio.sleep(0.05)
+        return rows
+
+    async def _run_windowed(self, family: str, sig_alg: str, identity: dict, n: int) -> list[dict]:
+        # Hasta `window` hellos pendientes a la vez; cada respuesta libera un hueco.
+        window = asyncio.Semaphore(self.window)
+
+        async def one(i: int) -> dict:
+            async with window:
+                return await self._run_handshake(family, sig_alg, identity, i)
+
+        return list(await asyncio.gather(*(one(i) for i in range(1, n + 1))))
+
+    async def _run_open_loop(self, family: str, sig_alg: str, identity: dict, n: int) -> list[dict]:
+        # Llegadas de Poisson a `rate` hellos/s, independientes de las respuestas.
+        tasks = []
+        for i in range(1, n + 1):
+            tasks.append(asyncio.ensure_future(self._run_handshake(family, sig_alg, identity, i)))
+            if i < n:
+                await asyncio.sleep(random.expovariate(self.rate))
+        return list(await asyncio.gather(*tasks))
+
+    def _write_load_summary(self, family: str, sig_alg: str, rows: list[dict], elapsed_s: float):
+        # Mismo histograma logarítmico que load_generator.py (NaN se ignora).
+        hist = LatencyHistogram()
+        for r in rows:
+            if r["ok"]:
+                hist.add(r["rtt_ms"])
+        ok_count = hist.count
+        rtt_p50, rtt_p95, rtt_p99 = hist.percentiles((50, 95, 99))
+        summary = {
+            "ts_unix": time.time(),
+            "alg_family": family,
+            "sig_alg": sig_alg,
+            "kem_alg": KEM_ALG,
+            "mode": self.load_mode,
+            "window": self.window if self.load_mode == "window" else "",
+            "target_rate_per_s": self.rate if self.load_mode == "rate" else "",
+            "handshakes": len(rows),
+            "ok": ok_count,
+            "elapsed_s": elapsed_s,
+            "throughput_per_s": ok_count / elapsed_s if elapsed_s > 0 else float("nan"),
+            "rtt_p50_ms": rtt_p50,
+            "rtt_p95_ms": rtt_p95,
+            "rtt_p99_ms": rtt_p99,
+        }
+        self.load_writer.writerow(summary)
+        self.load_csv_f.flush()
+        print(
+            f"[{sig_alg}] {self.load_mode}: {ok_count}/{len(rows)} ok en {elapsed_s:.2f}s | "
+            f"{summary['throughput_per_s']:.1f} handshakes/s | "
+            f"RTT p50={summary['rtt_p50_ms']:.2f} p95={summary['rtt_p95_ms']:.2f} p99={summary['rtt_p99_ms']:.2f} ms"
+        )
 
-                self.stats.add(
-                    rtt_ms=result["rtt_ms"],
-                    sign_ms=sign.sign_time_ms,
-                    stanza_bytes=hello_stanza_bytes,
-                )
-                self.stats.maybe_print(prefix=f"[{sig_alg}] ")
+    async def run_benchmark(self):
+        for _, sig_alg, _ in SIG_ALGS:
+            self._build_identity_for_alg(sig_alg)
+        self._write_qr_fingerprints()
 
-                await asyncio.sleep(0.05)
+        runners = {
+            "closed": self._run_closed_loop,
+            "window": self._run_windowed,
+            "rate": self._run_open_loop,
+        }
+        for family, sig_alg, _ in SIG_ALGS:
+            identity = self._build_identity_for_alg(sig_alg)
+            n = self.iterations
+            print(f"\n== {family} + {KEM_ALG} ({n} handshakes, modo {self.load_mode}) ==")
+            t0 = time.perf_counter()
+            rows = await runners[self.load_mode](family, sig_alg, identity, n)
+            self._write_load_summary(family, sig_alg, rows, time.perf_counter() - t0)
 
     def close(self):
+        self.metrics.close()
+        self.probe.close()
+        self.tracer.close()
         try:
-            self.csv_f.close()
+            self.load_csv_f.close()
         except Exception:
             pass
+        if self.kem_pool is not None:
+            print("KEM pool:", self.kem_pool.stats())
+            self.kem_pool.close()
+        self.apqc.shutdown()
+        self.pqc.close()
 
 
 if __name__ == "__main__":
@@ -399,6 +719,47 @@ if __name__ == "__main__":
         "--iterations", type=int, default=30,
         help="Handshakes a ejecutar por algoritmo de firma (default: 30)"
     )
+    parser.add_argument(
+        "--crypto-processes", type=int, default=0,
+        help="Procesos para firmar fuera del bucle XMPP los algoritmos de --offload-alg (0 = inline)"
+    )
+    parser.add_argument(
+        "--offload-alg", action="append", default=None,
+        help=f"Prefijo de algoritmo enviado al pool de procesos (repetible; default: {' '.join(DEFAULT_PROCESS_ALGS)})"
+    )
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument(
+        "--window", type=int, default=0,
+        help="Mantener hasta N hellos pendientes a la vez (0 = lazo cerrado, uno tras otro)"
+    )
+    load.add_argument(
+        "--rate", type=float, default=0.0,
+        help="Lazo abierto: llegadas de Poisson a R hellos/s sin esperar respuestas"
+    )
+    parser.add_argument(
+        "--encoding", choices=list(HYBRID_ENCODINGS), default="xml",
+        help="Codificación del hello: xml (campos base64, v1) o compact (blob binario único, v2)"
+    )
+    parser.add_argument(
+        "--cert-by-reference", action="store_true",
+        help="Tras el primer handshake aceptado, enviar solo la huella del certificado"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Reanudar sesiones con el ticket del receptor (sin firma ni certificado) mientras sea válido"
+    )
+    parser.add_argument(
+        "--kem-pool-size", type=int, default=0,
+        help=f"Keypairs {KEM_ALG} pregenerados en segundo plano (0 = keygen en cada handshake)"
+    )
+    parser.add_argument(
+        "--kem-pool-low-water", type=int, default=8,
+        help="Nivel por debajo del cual se rellena el pool de keypairs KEM (default: 8)"
+    )
+    parser.add_argument(
+        "--crypto-threads", type=int, default=4,
+        help="Hilos para operaciones PQC fuera del bucle XMPP (default: 4)"
+    )
     args = parser.parse_args()
 
     emisor_jid = xmpp_env.get_xmpp_jid("EMISOR")
@@ -417,10 +778,23 @@ if __name__ == "__main__":
         qr_fingerprint_output_file=args.qr_fingerprint_output_file,
         startup_timeout_s=args.startup_timeout,
         iterations=args.iterations,
+        crypto_processes=args.crypto_processes,
+        offload_algs=tuple(args.offload_alg or DEFAULT_PROCESS_ALGS),
+        crypto_threads=args.crypto_threads,
+        kem_pool_size=args.kem_pool_size,
+        kem_pool_low_water=args.kem_pool_low_water,
+        window=args.window,
+        rate=args.rate,
+        encoding=args.encoding,
+        cert_by_reference=args.cert_by_reference,
+        resume=args.resume,
     )
     bot.register_plugin("xep_0030")
 
     bot.connect(host=args.host, port=args.port)
     bot.loop.call_later(args.startup_timeout, bot._startup_watchdog)
-    bot.loop.run_forever()
+    try:
+        bot.loop.run_forever()
+    finally:
+        bot.close()
     raise SystemExit(bot.exit_code)
@@ -1,15 +1,16 @@
 import argparse
-import base64
-import csv
 import hashlib
 import itertools
 import json
 import os
 import time
 from statistics import fmean
-import psutil as _psutil
 
-from crypto.pqc_wrapper import PQCProvider
+from crypto.pqc_wrapper import PQCProvider, b64decode_str
+from crypto.oqs_pool import OQSContextPool
+from metrics.resources import ResourceProbe, ResourceSampler
+from metrics.sink import MetricsSink
+from metrics.throughput import OUT_CSV as THROUGHPUT_CSV, append_throughput_row, measure_signature_throughput, print_throughput_row
 
 KEM_ALGS = [
     "ML-KEM-512",
@@ -28,15 +29,13 @@ SIG_ALGS = [
 SENDER_CSV = "artifacts/csv/kem_signed_sender_metrics.csv"
 RECEIVER_CSV = "artifacts/csv/kem_signed_receiver_metrics.csv"
 
-_PROC = _psutil.Process()
 
 
 def _stable_json(payload: dict) -> bytes:
     return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
 
 
-def _sha256_hex_from_b64(secret_b64: str) -> str:
-    secret = base64.b64decode(secret_b64.encode("ascii"))
+def _sha256_hex(secret: bytes) -> str:
     return hashlib.sha256(secret).hexdigest()
 
 
@@ -51,12 +50,11 @@ def _hello_message_to_sign(kem_alg: str, kem_pk_b64: str, nonce: str) -> bytes:
     return _stable_json(payload)
 
 
-def run_one_handshake(pqc: PQCProvider, sig_alg: str, kem_alg: str, iteration: int):
+def run_one_handshake(pqc: PQCProvider, probe: ResourceProbe, sig_alg: str, kem_alg: str, iteration: int):
     nonce = f"i{iteration}-{time.time_ns()}"
 
     # --- lado emisor: keygen KEM + firma ---
-    _t_cpu_send0 = _PROC.cpu_times()
-    _mem_send0_kb = _PROC.memory_info().rss >> 10
+    _t_cpu_send0 = probe.cpu()
     sender_total_t0 = time.perf_counter()
 
     # 1) Emisor: genera par ML-KEM efímero
@@ -65,7 +63,7 @@ def run_one_handshake(pqc: PQCProvider, sig_alg: str, kem_alg: str, iteration: i
     # 2) Emisor: genera keypair de firma y firma su clave pública KEM
     hello_msg = _hello_message_to_sign(kem_alg, kem_kp.public_key_b64, nonce)
     sig_kp = pqc.generate_signature_keypair(sig_alg)
-    sign_res = pqc.sign_with_secret_key(sig_alg, hello_msg, sig_kp.secret_key_b64, sig_kp.public_key_b64)
+    sign_res = pqc.sign_with_secret_key_raw(sig_alg, hello_msg, sig_kp.secret_key, sig_kp.public_key)
     sig_keygen_time_ms = sig_kp.keygen_time_ms
 
     hello_packet = {
@@ -80,22 +78,23 @@ def run_one_handshake(pqc: PQCProvider, sig_alg: str, kem_alg: str, iteration: i
     }
 
     hello_bytes = len(_stable_json(hello_packet))
-    kem_pk_bytes = len(base64.b64decode(kem_kp.public_key_b64))
+    kem_pk_bytes = len(kem_kp.public_key)
 
     # --- lado receptor: verificación + encapsulación ---
     receiver_total_t0 = time.perf_counter()
-    _t_cpu_recv0 = _PROC.cpu_times()
-    _mem_recv0_kb = _PROC.memory_info().rss >> 10
+    _t_cpu_recv0 = probe.cpu()
 
-    vr = pqc.verify_signature(
+    # El receptor decodifica el paquete una sola vez y opera sobre bytes.
+    peer_kem_pk = b64decode_str(hello_packet["kem_pk_b64"])
+    vr = pqc.verify_signature_raw(
         sig_alg,
         _hello_message_to_sign(hello_packet["kem_alg"], hello_packet["kem_pk_b64"], hello_packet["nonce"]),
-        hello_packet["sig_b64"],
-        hello_packet["sig_pk_b64"],
+        b64decode_str(hello_packet["sig_b64"]),
+        b64decode_str(hello_packet["sig_pk_b64"]),
     )
 
     if vr.ok:
-        enc_res = pqc.encapsulate_secret(kem_alg, hello_packet["kem_pk_b64"])
+        enc_res = pqc.encapsulate_secret_raw(kem_alg, peer_kem_pk)
         verify_ok = 1
     else:
         enc_res = None
@@ -107,22 +106,24 @@ def run_one_handshake(pqc: PQCProvider, sig_alg: str, kem_alg: str, iteration: i
         "kem_alg": kem_alg,
         "nonce": nonce,
         "ciphertext_b64": enc_res.ciphertext_b64 if enc_res else "",
-        "shared_secret_sha256": _sha256_hex_from_b64(enc_res.shared_secret_b64) if enc_res else "",
+        "shared_secret_sha256": _sha256_hex(enc_res.shared_secret) if enc_res else "",
     }
 
     response_bytes = len(_stable_json(response_packet))
-    kem_ct_bytes = len(base64.b64decode(enc_res.ciphertext_b64)) if enc_res else 0
+    kem_ct_bytes = len(enc_res.ciphertext) if enc_res else 0
     receiver_total_ms = (time.perf_counter() - receiver_total_t0) * 1000.0
-    _t_cpu_recv1 = _PROC.cpu_times()
-    _mem_recv1_kb = _PROC.memory_info().rss >> 10
-    cpu_recv_user_ms = (_t_cpu_recv1.user - _t_cpu_recv0.user) * 1000.0
-    cpu_recv_sys_ms  = (_t_cpu_recv1.system - _t_cpu_recv0.system) * 1000.0
+    _t_cpu_recv1 = probe.cpu()
+    _mem_recv1_kb = probe.rss_kb()
+    cpu_recv_user_ms = (_t_cpu_recv1[0] - _t_cpu_recv0[0]) * 1000.0
+    cpu_recv_sys_ms  = (_t_cpu_recv1[1] - _t_cpu_recv0[1]) * 1000.0
     mem_recv_rss_kb  = _mem_recv1_kb
 
     # 4) Emisor: decapsula y valida que el secreto coincide
     if verify_ok:
-        dec_res = pqc.decapsulate_secret(kem_alg, response_packet["ciphertext_b64"], kem_kp.secret_key_b64)
-        sender_secret_hash = _sha256_hex_from_b64(dec_res.shared_secret_b64)
+        dec_res = pqc.decapsulate_secret_raw(
+            kem_alg, b64decode_str(response_packet["ciphertext_b64"]), kem_kp.secret_key, ephemeral=True
+        )
+        sender_secret_hash = _sha256_hex(dec_res.shared_secret)
         shared_secret_match = int(sender_secret_hash == response_packet["shared_secret_sha256"])
         decaps_ms = dec_res.decaps_time_ms
         encaps_ms = enc_res.encaps_time_ms
@@ -132,10 +133,10 @@ def run_one_handshake(pqc: PQCProvider, sig_alg: str, kem_alg: str, iteration: i
         encaps_ms = float("nan")
 
     sender_total_ms = (time.perf_counter() - sender_total_t0) * 1000.0
-    _t_cpu_send1 = _PROC.cpu_times()
-    _mem_send1_kb = _PROC.memory_info().rss >> 10
-    cpu_send_user_ms = (_t_cpu_send1.user - _t_cpu_send0.user) * 1000.0
-    cpu_send_sys_ms  = (_t_cpu_send1.system - _t_cpu_send0.system) * 1000.0
+    _t_cpu_send1 = probe.cpu()
+    _mem_send1_kb = probe.rss_kb()
+    cpu_send_user_ms = (_t_cpu_send1[0] - _t_cpu_send0[0]) * 1000.0
+    cpu_send_sys_ms  = (_t_cpu_send1[1] - _t_cpu_send0[1]) * 1000.0
     mem_send_rss_kb  = _mem_send1_kb
 
     sender_row = {
@@ -185,7 +186,7 @@ def _mean(rows: list, key: str) -> float:
     return fmean(values)
 
 
-def run_benchmark(iterations: int):
+def run_benchmark(iterations: int, throughput_batch: int = 0):
     os.makedirs("artifacts/csv", exist_ok=True)
 
     sender_fields = [
@@ -228,15 +229,13 @@ def run_benchmark(iterations: int):
     all_sender_rows = []
     all_receiver_rows = []
 
-    pqc = PQCProvider()
+    pqc = PQCProvider(context_pool=OQSContextPool())
+    # Todo corre en este hilo: CPU del hilo (getrusage), sin contar sink ni muestreador.
+    probe = ResourceProbe(scope="thread", sampler=ResourceSampler(source="kem_signed"))
 
-    with open(SENDER_CSV, "w", newline="", encoding="utf-8") as sender_f, open(
-        RECEIVER_CSV, "w", newline="", encoding="utf-8"
-    ) as receiver_f:
-        sender_writer = csv.DictWriter(sender_f, fieldnames=sender_fields)
-        receiver_writer = csv.DictWriter(receiver_f, fieldnames=receiver_fields)
-        sender_writer.writeheader()
-        receiver_writer.writeheader()
+    with MetricsSink(SENDER_CSV, sender_fields, append=False) as sender_sink, MetricsSink(
+        RECEIVER_CSV, receiver_fields, append=False
+    ) as receiver_sink:
 
         for kem_alg, (family, sig_alg) in itertools.product(KEM_ALGS, SIG_ALGS):
             print(f"\n== {kem_alg} + {sig_alg} | {iterations} iteraciones ==")
@@ -244,9 +243,9 @@ def run_benchmark(iterations: int):
             family_receiver = []
 
             for i in range(1, iterations + 1):
-                s_row, r_row = run_one_handshake(pqc, sig_alg=sig_alg, kem_alg=kem_alg, iteration=i)
-                sender_writer.writerow(s_row)
-                receiver_writer.writerow(r_row)
+                s_row, r_row = run_one_handshake(pqc, probe, sig_alg=sig_alg, kem_alg=kem_alg, iteration=i)
+                sender_sink.write(s_row)
+                receiver_sink.write(r_row)
 
                 family_sender.append(s_row)
                 family_receiver.append(r_row)
@@ -270,14 +269,30 @@ def run_benchmark(iterations: int):
                 f"decap={_mean(family_sender, 'decaps_time_ms'):.2f} ms"
             )
 
+    if throughput_batch > 0:
+        print(f"\n== Throughput sign_many/verify_many ({throughput_batch} mensajes por ráfaga) ==")
+        for _, sig_alg in SIG_ALGS:
+            tp_row = measure_signature_throughput(pqc, sig_alg, throughput_batch, source="demo2_local")
+            append_throughput_row(tp_row)
+            print_throughput_row(tp_row, prefix=f"  {sig_alg}: ")
+
+    probe.close()
+    pqc.close()
+
     print("\nCSV generados:")
     print(" -", SENDER_CSV)
     print(" -", RECEIVER_CSV)
+    if throughput_batch > 0:
+        print(" -", THROUGHPUT_CSV)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Benchmark de protocolo ML-KEM con clave firmada (ML-DSA/SPHINCS)")
     parser.add_argument("--iterations", type=int, default=20, help="Iteraciones por algoritmo de firma")
+    parser.add_argument(
+        "--throughput-batch", type=int, default=0,
+        help="Tamaño de ráfaga sign_many/verify_many por algoritmo para medir ops/s (0 = desactivado)"
+    )
     args = parser.parse_args()
 
-    run_benchmark(iterations=max(1, args.iterations))
+    run_benchmark(iterations=max(1, args.iterations), throughput_batch=max(0, args.throughput_batch))
@@ -0,0 +1,353 @@
+import asyncio
+import argparse
+import os
+import time
+import uuid
+
+import slixmpp
+
+from crypto.pqc_wrapper import PQCProvider
+from crypto.oqs_pool import OQSContextPool
+from crypto.async_provider import AsyncPQCProvider
+from crypto.pqc_certificate import create_self_signed_certificate, certificate_to_pem
+from crypto import xmpp_env
+from metrics.csv_out import open_append_csv
+from metrics.histogram import LatencyHistogram
+from demo2_hybrid_kem_signed.emisor_hybrid_bench import KEM_ALG, SIG_ALGS
+from demo2_hybrid_kem_signed.protocol import (
+    HybridHelloData,
+    build_hello_element,
+    decode_response_element,
+    find_hybrid,
+    hello_message_to_sign,
+    sha256_hex,
+)
+
+OUT_SUMMARY_CSV = "artifacts/csv/hybrid_xmpp_loadgen_summary.csv"
+OUT_SESSIONS_CSV = "artifacts/csv/hybrid_xmpp_loadgen_sessions.csv"
+OUT_HISTOGRAM_CSV = "artifacts/csv/hybrid_xmpp_loadgen_histogram.csv"
+
+
+def jid_from_pattern(pattern: str, i: int) -> str:
+    user = pattern.format(i=i)
+    if "@" in user:
+        return user
+    return f"{user}@{xmpp_env.get_env('XMPP_DOMAIN', 'localhost')}"
+
+
+class LoadClient(slixmpp.ClientXMPP):
+    """Sesión XMPP ligera del generador: solo envía hellos y espera respuestas."""
+
+    def __init__(self, jid, password, recipient, apqc: AsyncPQCProvider, response_timeout_s: float = 10.0):
+        super().__init__(jid, password)
+
+        self.use_tls = False
+        self.use_ssl = False
+        self.force_starttls = False
+        self["feature_mechanisms"].unencrypted_plain = True
+
+        self.recipient = recipient
+        self.apqc = apqc
+        self.response_timeout_s = response_timeout_s
+        self.ready = asyncio.Event()
+        self.failed = False
+        self.pending = {}
+        self.histogram = LatencyHistogram()
+        self.sent = 0
+        self.ok = 0
+
+        self.add_event_handler("session_start", self.start)
+        self.add_event_handler("message", self.on_message)
+        self.add_event_handler("failed_auth", self.on_failed_auth)
+
+    async def start(self, _):
+        self.send_presence()
+        await self.get_roster()
+        self.ready.set()
+
+    def on_failed_auth(self, _):
+        print(f"ERROR: autenticación fallida para {self.boundjid.bare}")
+        self.failed = True
+        self.ready.set()
+        self.disconnect()
+
+    async def on_message(self, msg):
+        if msg["type"] not in ("chat", "normal"):
+            return
+
+        response, encoding = find_hybrid(msg.xml, "hybrid_response")
+        if response is None:
+            error, _ = find_hybrid(msg.xml, "hybrid_error")
+            rec = self.pending.pop(error.get("nonce") or "", None) if error is not None else None
+            if rec is not None and not rec["future"].done():
+                rec["future"].set_result(0)
+            return
+
+        try:
+            nonce, ciphertext, peer_hash = decode_response_element(response, encoding)
+        except ValueError:
+            return
+        rec = self.pending.pop(nonce, None)
+        if rec is None:
+            return
+
+        ok = 0
+        try:
+            dec = await self.apqc.decapsulate_secret_raw(
+                KEM_ALG, ciphertext, rec["kem_secret_key"], ephemeral=True
+            )
+            ok = int(sha256_hex(dec.value.shared_secret) == peer_hash)
+        except Exception:
+            ok = 0
+        if not rec["future"].done():
+            rec["future"].set_result(ok)
+
+    async def handshake(self, sig_alg: str, identity: dict, seq: int) -> tuple[int, float]:
+        nonce = f"{self.boundjid.user}-{seq}-{time.time_ns()}"
+        kem = (await self.apqc.generate_kem_keypair(KEM_ALG)).value
+        sign = (
+            await self.apqc.sign_with_secret_key_raw(
+                sig_alg,
+                hello_message_to_sign(KEM_ALG, kem.public_key_b64, nonce, identity["cert_fingerprint"]),
+                identity["secret_key"],
+                identity["public_key"],
+            )
+        ).value
+
+        msg = self.make_message(mto=self.recipient, mbody="[HYBRID_HELLO]", mtype="chat")
+        msg["thread"] = nonce
+        msg.xml.append(
+            build_hello_element(
+                HybridHelloData(
+                    kem_alg=KEM_ALG,
+                    sig_alg=sig_alg,
+                    nonce=nonce,
+                    kem_pk_b64=kem.public_key_b64,
+                    sig_b64=sign.sig_b64,
+                    cert_pem=identity["cert_pem"],
+                    cert_fingerprint_sha256=identity["cert_fingerprint"],
+                )
+            )
+        )
+
+        fut = asyncio.get_event_loop().create_future()
+        self.pending[nonce] = {"future": fut, "kem_secret_key": kem.secret_key}
+        t_send = time.perf_counter()
+        msg.send()
+        self.sent += 1
+
+        try:
+            ok = await asyncio.wait_for(fut, timeout=self.response_timeout_s)
+        except asyncio.TimeoutError:
+            self.pending.pop(nonce, None)
+            return 0, float("nan")
+
+        rtt_ms = (time.perf_counter() - t_send) * 1000.0
+        if ok:
+            self.ok += 1
+            self.histogram.add(rtt_ms)
+        return ok, rtt_ms
+
+    async def run(self, sig_alg: str, identity: dict, handshakes: int, window: int) -> None:
+        slots = asyncio.Semaphore(max(1, window))
+
+        async def one(seq: int):
+            async with slots:
+                await self.handshake(sig_alg, identity, seq)
+
+        await asyncio.gather(*(one(seq) for seq in range(1, handshakes + 1)))
+
+
+class LoadGenerator:
+    """
+    Abre M sesiones XMPP en un mismo bucle asyncio y reparte entre ellas los handshakes
+    híbridos. Todas comparten proveedor PQC e identidad de firma, para que el coste
+    medido sea el del receptor y la red, no el de M identidades.
+    """
+
+    def __init__(
+        self,
+        jids: list[str],
+        password: str,
+        recipient: str,
+        sig_alg: str,
+        handshakes_per_client: int,
+        window: int,
+        crypto_threads: int = 4,
+        qr_fingerprint_output_file: str | None = None,
+    ):
+        self.sig_alg = sig_alg
+        self.handshakes_per_client = max(1, handshakes_per_client)
+        self.window = max(1, window)
+        self.qr_fingerprint_output_file = qr_fingerprint_output_file
+        self.run_id = uuid.uuid4().hex[:12]
+
+        self.pqc = PQCProvider(context_pool=OQSContextPool())
+        self.apqc = AsyncPQCProvider(self.pqc, max_threads=crypto_threads)
+        self.clients = [LoadClient(jid, password, recipient, self.apqc) for jid in jids]
+        self.identity = self._build_identity()
+
+    def _build_identity(self) -> dict:
+        kp = self.pqc.generate_signature_keypair(self.sig_alg)
+        cert = create_self_signed_certificate(
+            pqc=self.pqc,
+            sig_alg=self.sig_alg,
+            subject_dn=f"CN=loadgen,O=UMA,C=ES,OU={self.sig_alg}",
+            subject_secret_key_b64=kp.secret_key_b64,
+            subject_public_key_b64=kp.public_key_b64,
+            validity_days=365,
+        )
+        if self.qr_fingerprint_output_file:
+            os.makedirs(os.path.dirname(self.qr_fingerprint_output_file) or ".", exist_ok=True)
+            with open(self.qr_fingerprint_output_file, "a", encoding="utf-8") as f:
+                f.write(cert["fingerprint_sha256"] + "\n")
+        return {
+            "secret_key": kp.secret_key,
+            "public_key": kp.public_key,
+            "cert_fingerprint": cert["fingerprint_sha256"],
+            "cert_pem": certificate_to_pem(cert),
+        }
+
+    def connect(self, host: str, port: int) -> None:
+        for client in self.clients:
+            client.register_plugin("xep_0030")
+            client.connect(host=host, port=port)
+
+    async def run(self, startup_timeout_s: float) -> int:
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(c.ready.wait() for c in self.clients)), timeout=startup_timeout_s
+            )
+        except asyncio.TimeoutError:
+            pass
+        active = [c for c in self.clients if c.ready.is_set() and not c.failed]
+        print(f"Sesiones activas: {len(active)}/{len(self.clients)}")
+        if not active:
+            return 2
+
+        t0 = time.perf_counter()
+        await asyncio.gather(
+            *(c.run(self.sig_alg, self.identity, self.handshakes_per_client, self.window) for c in active)
+        )
+        elapsed_s = time.perf_counter() - t0
+
+        self._write_results(active, elapsed_s)
+        for client in self.clients:
+            client.disconnect()
+        await asyncio.sleep(0.5)
+        return 0
+
+    def _write_results(self, active: list[LoadClient], elapsed_s: float) -> None:
+        ts = time.time()
+        global_hist = LatencyHistogram()
+
+        sessions_f, sessions_writer = open_append_csv(
+            OUT_SESSIONS_CSV,
+            ["ts_unix", "run_id", "jid", "sig_alg", "sent", "ok", "rtt_mean_ms", "rtt_p50_ms", "rtt_p95_ms", "rtt_p99_ms"],
+        )
+        hist_f, hist_writer = open_append_csv(
+            OUT_HISTOGRAM_CSV,
+            ["ts_unix", "run_id", "scope", "sig_alg", "lower_ms", "upper_ms", "count"],
+        )
+        with sessions_f, hist_f:
+            for client in active:
+                hist = client.histogram
+                global_hist.merge(hist)
+                jid = client.boundjid.bare
+                sessions_writer.writerow(
+                    {
+                        "ts_unix": ts,
+                        "run_id": self.run_id,
+                        "jid": jid,
+                        "sig_alg": self.sig_alg,
+                        "sent": client.sent,
+                        "ok": client.ok,
+                        "rtt_mean_ms": hist.mean,
+                        "rtt_p50_ms": hist.percentile(50),
+                        "rtt_p95_ms": hist.percentile(95),
+                        "rtt_p99_ms": hist.percentile(99),
+                    }
+                )
+                self._write_histogram(hist_writer, ts, jid, hist)
+            self._write_histogram(hist_writer, ts, "global", global_hist)
+
+        sent = sum(c.sent for c in active)
+        summary = {
+            "ts_unix": ts,
+            "run_id": self.run_id,
+            "sig_alg": self.sig_alg,
+            "kem_alg": KEM_ALG,
+            "clients": len(active),
+            "window_per_client": self.window,
+            "sent": sent,
+            "ok": global_hist.count,
+            "elapsed_s": elapsed_s,
+            "throughput_per_s": global_hist.count / elapsed_s if elapsed_s > 0 else float("nan"),
+            "rtt_mean_ms": global_hist.mean,
+            "rtt_p50_ms": global_hist.percentile(50),
+            "rtt_p95_ms": global_hist.percentile(95),
+            "rtt_p99_ms": global_hist.percentile(99),
+        }
+        summary_f, summary_writer = open_append_csv(OUT_SUMMARY_CSV, list(summary))
+        with summary_f:
+            summary_writer.writerow(summary)
+
+        print(
+            f"[{self.sig_alg}] {len(active)} clientes: {summary['ok']}/{sent} ok en {elapsed_s:.2f}s | "
+            f"{summary['throughput_per_s']:.1f} handshakes/s | RTT p50={summary['rtt_p50_ms']:.2f} "
+            f"p95={summary['rtt_p95_ms']:.2f} p99={summary['rtt_p99_ms']:.2f} ms"
+        )
+
+    def _write_histogram(self, writer, ts: float, scope: str, hist: LatencyHistogram) -> None:
+        for lower_ms, upper_ms, count in hist.bucket_rows():
+            writer.writerow(
+                {
+                    "ts_unix": ts,
+                    "run_id": self.run_id,
+                    "scope": scope,
+                    "sig_alg": self.sig_alg,
+                    "lower_ms": lower_ms,
+                    "upper_ms": upper_ms,
+                    "count": count,
+                }
+            )
+
+    def close(self) -> None:
+        self.apqc.shutdown()
+        self.pqc.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generador de carga: M sesiones XMPP enviando handshakes híbridos")
+    parser.add_argument("--clients", type=int, default=10, help="Sesiones XMPP simultáneas (default: 10)")
+    parser.add_argument(
+        "--jid-pattern", default="loadgen{i}",
+        help="Patrón de JID; {i} va de 1 a --clients. Sin @dominio se usa XMPP_DOMAIN (default: loadgen{i})"
+    )
+    parser.add_argument("--password", default=xmpp_env.get_xmpp_password("LOADGEN"))
+    parser.add_argument("--algorithm", choices=[family for family, _, _ in SIG_ALGS], default="ML-DSA")
+    parser.add_argument("--handshakes", type=int, default=20, help="Handshakes por cliente (default: 20)")
+    parser.add_argument("--window", type=int, default=1, help="Hellos pendientes por cliente (default: 1)")
+    parser.add_argument("--crypto-threads", type=int, default=4)
+    parser.add_argument("--qr-fingerprint-output-file", default="artifacts/csv/trusted_qr_fingerprints.txt")
+    parser.add_argument("--host", default=xmpp_env.get_xmpp_host())
+    parser.add_argument("--port", type=int, default=xmpp_env.get_xmpp_port())
+    parser.add_argument("--startup-timeout", type=int, default=30)
+    args = parser.parse_args()
+
+    generator = LoadGenerator(
+        [jid_from_pattern(args.jid_pattern, i) for i in range(1, max(1, args.clients) + 1)],
+        args.password,
+        xmpp_env.get_xmpp_jid("RECEPTOR"),
+        sig_alg={family: alg for family, alg, _ in SIG_ALGS}[args.algorithm],
+        handshakes_per_client=args.handshakes,
+        window=args.window,
+        crypto_threads=args.crypto_threads,
+        qr_fingerprint_output_file=args.qr_fingerprint_output_file,
+    )
+    generator.connect(args.host, args.port)
+    try:
+        exit_code = generator.clients[0].loop.run_until_complete(generator.run(args.startup_timeout))
+    finally:
+        generator.close()
+    raise SystemExit(exit_code)
@@ -1,8 +1,23 @@
+import base64
 import hashlib
+import hmac
 import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from crypto.pqc_certificate import ParsedCertificate
 
 NS_HYBRID = "urn:uma:tfm:pqc:hybrid:1"
+# v2: los campos binarios van en un único blob con prefijo de longitud, en base64 una vez.
+NS_HYBRID_COMPACT = "urn:uma:tfm:pqc:hybrid:2"
+
+# Codificación del payload -> espacio de nombres; el receptor responde en la versión del hello.
+HYBRID_ENCODINGS = {"xml": NS_HYBRID, "compact": NS_HYBRID_COMPACT}
 
 
 @dataclass
@@ -16,6 +31,36 @@ class HybridHelloData:
     cert_fingerprint_sha256: str
 
 
+@dataclass
+class DecodedHello:
+    """Hello ya decodificado, en cualquiera de las dos codificaciones."""
+
+    encoding: str
+    kem_alg: str
+    sig_alg: str
+    nonce: str
+    kem_pk: bytes
+    kem_pk_b64: str
+    sig: bytes
+    cert: str | bytes  # PEM (xml) o DER (compact); vacío si se envió por referencia
+    cert_fingerprint_sha256: str
+
+
+@dataclass
+class ResumptionTicket:
+    """Ticket de reanudación: el receptor lo emite tras un handshake completo y el emisor lo guarda."""
+
+    ticket_id: str
+    secret: bytes
+    expires_at: float  # time.monotonic()
+    uses_left: int
+    peer: str = ""
+    sig_alg: str = ""
+
+    def usable(self) -> bool:
+        return self.uses_left > 0 and time.monotonic() < self.expires_at
+
+
 def stable_json_bytes(payload: dict) -> bytes:
     return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
 
@@ -33,11 +78,228 @@ def hello_message_to_sign(kem_alg: str, kem_pk_b64: str, nonce: str, cert_finger
     )
 
 
-def sha256_hex_from_b64(secret_b64: str) -> str:
-    secret = __import__("base64").b64decode(secret_b64.encode("ascii"))
+def sha256_hex(secret: bytes) -> str:
     return hashlib.sha256(secret).hexdigest()
 
 
+def _pack(*fields: bytes) -> str:
+    out = bytearray()
+    for field in fields:
+        out += len(field).to_bytes(4, "big")
+        out += field
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+
+def _unpack(text: str, count: int) -> list[bytes]:
+    raw = base64.b64decode((text or "").strip().encode("ascii"))
+    fields = []
+    pos = 0
+    for _ in range(count):
+        if pos + 4 > len(raw):
+            raise ValueError("blob compacto truncado")
+        size = int.from_bytes(raw[pos:pos + 4], "big")
+        pos += 4
+        if pos + size > len(raw):
+            raise ValueError("blob compacto truncado")
+        fields.append(raw[pos:pos + size])
+        pos += size
+    if pos != len(raw):
+        raise ValueError("blob compacto con bytes sobrantes")
+    return fields
+
+
+def build_hello_element(data: HybridHelloData) -> ET.Element:
+    hello = ET.Element(f"{{{NS_HYBRID}}}hybrid_hello")
+    hello.set("kem_alg", data.kem_alg)
+    hello.set("sig_alg", data.sig_alg)
+    hello.set("nonce", data.nonce)
+
+    ET.SubElement(hello, f"{{{NS_HYBRID}}}kem_pk").text = data.kem_pk_b64
+    ET.SubElement(hello, f"{{{NS_HYBRID}}}sig").text = data.sig_b64
+    if data.cert_pem:
+        # Sin cert_pem = certificado por referencia: el receptor lo resuelve por la huella.
+        ET.SubElement(hello, f"{{{NS_HYBRID}}}cert_pem").text = data.cert_pem
+    ET.SubElement(hello, f"{{{NS_HYBRID}}}cert_fingerprint_sha256").text = data.cert_fingerprint_sha256
+    return hello
+
+
+def build_compact_hello_element(
+    kem_alg: str, sig_alg: str, nonce: str, kem_pk: bytes, sig: bytes, cert_der: bytes, cert_fingerprint_sha256: str
+) -> ET.Element:
+    hello = ET.Element(f"{{{NS_HYBRID_COMPACT}}}hybrid_hello")
+    hello.set("kem_alg", kem_alg)
+    hello.set("sig_alg", sig_alg)
+    hello.set("nonce", nonce)
+    hello.text = _pack(kem_pk, sig, cert_der, bytes.fromhex(cert_fingerprint_sha256))
+    return hello
+
+
+def _child_text(parent: ET.Element, tag: str) -> str:
+    el = parent.find(f"{{{NS_HYBRID}}}{tag}")
+    return (el.text or "").strip() if el is not None else ""
+
+
+def find_hybrid(stanza: ET.Element, tag: str) -> tuple[ET.Element | None, str]:
+    """Busca `tag` en cualquiera de las versiones del espacio de nombres: (elemento, codificación)."""
+    for encoding, ns in HYBRID_ENCODINGS.items():
+        el = stanza.find(f"{{{ns}}}{tag}")
+        if el is not None:
+            return el, encoding
+    return None, ""
+
+
+def decode_hello_element(hello: ET.Element, encoding: str) -> DecodedHello:
+    """Decodifica un hybrid_hello; ValueError si falta algún campo o el blob es inválido."""
+    kem_alg = hello.get("kem_alg") or ""
+    sig_alg = hello.get("sig_alg") or ""
+    nonce = hello.get("nonce") or ""
+
+    if encoding == "compact":
+        kem_pk, sig, cert_der, fingerprint = _unpack(hello.text, 4)
+        decoded = DecodedHello(
+            encoding=encoding,
+            kem_alg=kem_alg,
+            sig_alg=sig_alg,
+            nonce=nonce,
+            kem_pk=kem_pk,
+            # El mensaje firmado es el mismo en ambas codificaciones (incluye la clave en base64).
+            kem_pk_b64=base64.b64encode(kem_pk).decode("ascii"),
+            sig=sig,
+            cert=cert_der,
+            cert_fingerprint_sha256=fingerprint.hex(),
+        )
+    else:
+        kem_pk_b64 = _child_text(hello, "kem_pk")
+        sig_b64 = _child_text(hello, "sig")
+        cert_pem = _child_text(hello, "cert_pem") or _child_text(hello, "cert_json")
+        decoded = DecodedHello(
+            encoding=encoding,
+            kem_alg=kem_alg,
+            sig_alg=sig_alg,
+            nonce=nonce,
+            kem_pk=base64.b64decode(kem_pk_b64.encode("ascii")),
+            kem_pk_b64=kem_pk_b64,
+            sig=base64.b64decode(sig_b64.encode("ascii")),
+            cert=cert_pem,
+            cert_fingerprint_sha256=_child_text(hello, "cert_fingerprint_sha256"),
+        )
+
+    if not (kem_alg and sig_alg and nonce and decoded.kem_pk and decoded.sig and decoded.cert_fingerprint_sha256):
+        raise ValueError("hybrid_hello incompleto")
+    return decoded
+
+
+def build_response_element(
+    kem_alg: str,
+    nonce: str,
+    ciphertext: bytes,
+    shared_secret_sha256: str,
+    encoding: str = "xml",
+    cert_ack: str = "",
+    ticket: ResumptionTicket | None = None,
+    resumed: bool = False,
+) -> ET.Element:
+    ns = HYBRID_ENCODINGS[encoding]
+    response = ET.Element(f"{{{ns}}}hybrid_response")
+    response.set("kem_alg", kem_alg)
+    response.set("nonce", nonce)
+    if cert_ack:
+        # Huella del certificado que el receptor guardó: el emisor puede enviarla sola en adelante.
+        response.set("cert_ack", cert_ack)
+    if ticket is not None:
+        # El secreto no viaja: ambos lados lo derivan del secreto ML-KEM de este handshake.
+        response.set("ticket", ticket.ticket_id)
+        response.set("ticket_lifetime", str(max(0, round(ticket.expires_at - time.monotonic()))))
+        response.set("ticket_uses", str(ticket.uses_left))
+    if resumed:
+        response.set("resumed", "1")
+    if encoding == "compact":
+        response.text = _pack(ciphertext, bytes.fromhex(shared_secret_sha256))
+    else:
+        ET.SubElement(response, f"{{{ns}}}ciphertext").text = base64.b64encode(ciphertext).decode("ascii")
+        ET.SubElement(response, f"{{{ns}}}shared_secret_sha256").text = shared_secret_sha256
+    return response
+
+
+def decode_response_element(response: ET.Element, encoding: str) -> tuple[str, bytes, str]:
+    """(nonce, ciphertext, shared_secret_sha256) de un hybrid_response."""
+    nonce = response.get("nonce") or ""
+    if encoding == "compact":
+        ciphertext, secret_hash = _unpack(response.text, 2)
+        return nonce, ciphertext, secret_hash.hex()
+    return (
+        nonce,
+        base64.b64decode(_child_text(response, "ciphertext").encode("ascii")),
+        _child_text(response, "shared_secret_sha256"),
+    )
+
+
+def derive_resumption_secret(shared_secret: bytes, nonce: str) -> bytes:
+    """Secreto de reanudación ligado al secreto ML-KEM y al nonce del handshake completo."""
+    return hmac.new(shared_secret, b"hybrid-resumption|" + nonce.encode("utf-8"), hashlib.sha256).digest()
+
+
+def resumed_session_secret(resumption_secret: bytes, kem_shared_secret: bytes) -> bytes:
+    """Secreto de una sesión reanudada: PSK del ticket + ML-KEM nuevo (conserva el secreto hacia delante)."""
+    return hmac.new(resumption_secret, b"hybrid-resumed|" + kem_shared_secret, hashlib.sha256).digest()
+
+
+def resume_mac(resumption_secret: bytes, kem_alg: str, kem_pk_b64: str, nonce: str, ticket_id: str) -> str:
+    payload = stable_json_bytes(
+        {
+            "type": "hybrid_resume",
+            "version": 1,
+            "kem_alg": kem_alg,
+            "kem_pk_b64": kem_pk_b64,
+            "nonce": nonce,
+            "ticket": ticket_id,
+        }
+    )
+    return hmac.new(resumption_secret, payload, hashlib.sha256).hexdigest()
+
+
+def build_resume_element(kem_alg: str, nonce: str, kem_pk_b64: str, ticket_id: str, mac: str) -> ET.Element:
+    resume = ET.Element(f"{{{NS_HYBRID}}}hybrid_resume")
+    resume.set("kem_alg", kem_alg)
+    resume.set("nonce", nonce)
+    resume.set("ticket", ticket_id)
+    resume.set("mac", mac)
+    ET.SubElement(resume, f"{{{NS_HYBRID}}}kem_pk").text = kem_pk_b64
+    return resume
+
+
+def decode_resume_element(resume: ET.Element) -> tuple[str, str, str, str, str]:
+    """(kem_alg, nonce, ticket_id, mac, kem_pk_b64) de un hybrid_resume."""
+    return (
+        resume.get("kem_alg") or "",
+        resume.get("nonce") or "",
+        resume.get("ticket") or "",
+        resume.get("mac") or "",
+        _child_text(resume, "kem_pk"),
+    )
+
+
+def ticket_from_response(response: ET.Element, resumption_secret: bytes) -> ResumptionTicket:
+    """Ticket anunciado en los atributos de un hybrid_response (lado emisor)."""
+    return ResumptionTicket(
+        ticket_id=response.get("ticket") or "",
+        secret=resumption_secret,
+        expires_at=time.monotonic() + float(response.get("ticket_lifetime") or 0),
+        uses_left=int(response.get("ticket_uses") or 0),
+    )
+
+
+def build_error_element(nonce: str, reason: str, encoding: str = "xml") -> ET.Element:
+    error = ET.Element(f"{{{HYBRID_ENCODINGS[encoding]}}}hybrid_error")
+    error.set("nonce", nonce)
+    error.set("reason", reason)
+    return error
+
+
+def sha256_hex_from_b64(secret_b64: str) -> str:
+    return sha256_hex(base64.b64decode(secret_b64.encode("ascii")))
+
+
 def load_trusted_values(path: str | None) -> set[str]:
     if not path:
         return set()
@@ -53,4 +315,218 @@ def load_trusted_values(path: str | None) -> set[str]:
     except FileNotFoundError:
         return set()
 
-    
+
+class PeerCertificateCache:
+    """
+    Certificados ya validados de cada par (JID desnudo -> huella -> ParsedCertificate).
+
+    Permite que un emisor que ya envió su certificado mande después solo la huella.
+    LRU por par (`max_peers`); cada par conserva como mucho `per_peer` certificados.
+    Solo ahorra el transporte y el parseo: la política se vuelve a aplicar en cada hello.
+    """
+
+    def __init__(self, max_peers: int = 1024, per_peer: int = 4):
+        self.max_peers = max(1, max_peers)
+        self.per_peer = max(1, per_peer)
+        self._peers: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, peer: str, fingerprint: str) -> "ParsedCertificate | None":
+        certs = self._peers.get(peer)
+        parsed = certs.get(fingerprint) if certs is not None else None
+        if parsed is None:
+            self.misses += 1
+            return None
+        self._peers.move_to_end(peer)
+        certs.move_to_end(fingerprint)
+        self.hits += 1
+        return parsed
+
+    def put(self, peer: str, parsed: "ParsedCertificate") -> None:
+        certs = self._peers.setdefault(peer, OrderedDict())
+        certs[parsed.fingerprint_sha256] = parsed
+        certs.move_to_end(parsed.fingerprint_sha256)
+        while len(certs) > self.per_peer:
+            certs.popitem(last=False)
+        self._peers.move_to_end(peer)
+        while len(self._peers) > self.max_peers:
+            self._peers.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "peers": len(self._peers),
+            "certs": sum(len(c) for c in self._peers.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ResumptionTicketStore:
+    """
+    Tickets de reanudación emitidos por el receptor (id -> ResumptionTicket).
+
+    Cada ticket queda ligado al JID desnudo que hizo el handshake completo, caduca a los
+    `lifetime_s` segundos y admite `max_uses` reanudaciones. Como mucho `max_tickets`
+    vivos; al superarlo se descartan los más antiguos.
+    """
+
+    def __init__(self, lifetime_s: float, max_uses: int = 10, max_tickets: int = 4096):
+        self.lifetime_s = max(0.0, lifetime_s)
+        self.max_uses = max(1, max_uses)
+        self.max_tickets = max(1, max_tickets)
+        self._tickets: OrderedDict = OrderedDict()
+        self.issued = 0
+        self.redeemed = 0
+        self.rejected = 0
+
+    def issue(self, peer: str, secret: bytes, sig_alg: str = "") -> ResumptionTicket:
+        ticket = ResumptionTicket(
+            ticket_id=os.urandom(16).hex(),
+            secret=secret,
+            expires_at=time.monotonic() + self.lifetime_s,
+            uses_left=self.max_uses,
+            peer=peer,
+            sig_alg=sig_alg,
+        )
+        self._tickets[ticket.ticket_id] = ticket
+        while len(self._tickets) > self.max_tickets:
+            self._tickets.popitem(last=False)
+        self.issued += 1
+        return ticket
+
+    def lookup(self, peer: str, ticket_id: str) -> ResumptionTicket | None:
+        """Ticket vigente de `peer`, sin consumir uso (el MAC se comprueba antes)."""
+        ticket = self._tickets.get(ticket_id)
+        if ticket is not None and not ticket.usable():
+            del self._tickets[ticket_id]
+            ticket = None
+        if ticket is None or ticket.peer != peer:
+            self.rejected += 1
+            return None
+        return ticket
+
+    def consume(self, ticket: ResumptionTicket) -> None:
+        ticket.uses_left -= 1
+        if ticket.uses_left <= 0:
+            self._tickets.pop(ticket.ticket_id, None)
+        self.redeemed += 1
+
+    def reject(self) -> None:
+        self.rejected += 1
+
+    def stats(self) -> dict:
+        return {
+            "tickets": len(self._tickets),
+            "issued": self.issued,
+            "redeemed": self.redeemed,
+            "rejected": self.rejected,
+        }
+
+
+# Coste aproximado por nonce recordado: digest de 16 bytes (objeto bytes) + hueco en el set.
+_REPLAY_ENTRY_BYTES = 100
+
+
+class NonceReplayCache:
+    """
+    Nonces vistos recientemente, para descartar hellos repetidos antes de cualquier operación PQC.
+
+    Dos generaciones de sets de digests: se consulta en ambas y se inserta en la actual.
+    Cada `window_s` (o cuando la actual llena su mitad de `max_bytes`) la actual pasa a
+    ser la anterior y la anterior se descarta. Un nonce se recuerda entre una y dos ventanas,
+    y la memoria nunca pasa de `max_bytes` aunque llegue una avalancha de nonces distintos.
+    En ese caso la ventana efectiva se acorta (`forced_rotations`).
+    """
+
+    def __init__(self, window_s: float = 60.0, max_bytes: int = 4 << 20):
+        self.window_s = max(0.001, window_s)
+        self.max_per_generation = max(1, max_bytes // _REPLAY_ENTRY_BYTES // 2)
+        self._current: set[bytes] = set()
+        self._previous: set[bytes] = set()
+        self._rotated_at = time.monotonic()
+        self.replays = 0
+        self.rotations = 0
+        self.forced_rotations = 0
+
+    @staticmethod
+    def _key(nonce: str) -> bytes:
+        return hashlib.blake2b(nonce.encode("utf-8"), digest_size=16).digest()
+
+    def _rotate(self) -> None:
+        self._previous = self._current
+        self._current = set()
+        self._rotated_at = time.monotonic()
+        self.rotations += 1
+
+    def check_and_add(self, nonce: str) -> bool:
+        """True si el nonce es nuevo (y queda registrado); False si es una repetición."""
+        if time.monotonic() - self._rotated_at >= self.window_s:
+            self._rotate()
+        key = self._key(nonce)
+        if key in self._current or key in self._previous:
+            self.replays += 1
+            return False
+        if len(self._current) >= self.max_per_generation:
+            self._rotate()
+            self.forced_rotations += 1
+        self._current.add(key)
+        return True
+
+    def discard(self, nonce: str) -> None:
+        """Olvida un nonce cuyo hello se rechazó sin procesar (el emisor puede reenviarlo)."""
+        key = self._key(nonce)
+        self._current.discard(key)
+        self._previous.discard(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._current) + len(self._previous),
+            "bytes_est": (len(self._current) + len(self._previous)) * _REPLAY_ENTRY_BYTES,
+            "replays": self.replays,
+            "rotations": self.rotations,
+            "forced_rotations": self.forced_rotations,
+        }
+
+
+class TrustedValuesFile:
+    """
+    Valores confiables de un fichero (uno por línea) con recarga en caliente.
+
+    `values` devuelve un frozenset ya construido; como mucho cada `poll_interval_s`
+    se hace un stat() del fichero y, si cambió su mtime o tamaño, se relee y se
+    sustituye el conjunto entero. `version` aumenta en cada sustitución.
+    """
+
+    def __init__(self, path: str | None, poll_interval_s: float = 1.0):
+        self.path = path
+        self.poll_interval_s = max(0.0, poll_interval_s)
+        self.version = 0
+        self._stamp = None
+        self._next_check = 0.0
+        self._values: frozenset[str] = frozenset()
+        self.refresh(force=True)
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self, force: bool = False) -> bool:
+        self._next_check = time.monotonic() + self.poll_interval_s
+        stamp = self._file_stamp() if self.path else None
+        if not force and stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        self._values = frozenset(load_trusted_values(self.path))
+        self.version += 1
+        return True
+
+    @property
+    def values(self) -> frozenset[str]:
+        if self.path and time.monotonic() >= self._next_check:
+            self.refresh()
+        return self._values
+
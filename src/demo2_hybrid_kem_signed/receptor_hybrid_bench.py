@@ -1,23 +1,43 @@
-import base64
-import csv
+import asyncio
 import argparse
-import os
+import hmac
+import signal
 import time
-from pathlib import Path
-import psutil as _psutil
 
 import slixmpp
 from slixmpp.xmlstream import ET
 
-from crypto.pqc_wrapper import PQCProvider
-from crypto.pqc_certificate import certificate_from_pem, verify_certificate
+from crypto.pqc_wrapper import PQCProvider, b64decode_str
+from crypto.oqs_pool import OQSContextPool
+from crypto.executor import DEFAULT_PROCESS_ALGS
+from crypto.async_provider import AsyncPQCProvider
+from crypto.verify_cache import VerifyCache
+from crypto.pqc_certificate import CertificateCache, TrustAnchorRegistry, ValidationPolicy, parse_certificate, validate
 from crypto.xmpp_env import get_xmpp_host, get_xmpp_jid, get_xmpp_password, get_xmpp_port
-from metrics.realtime import RealtimeStats
-from demo2_hybrid_kem_signed.protocol import NS_HYBRID, hello_message_to_sign, sha256_hex_from_b64, load_trusted_values
+from metrics.sink import MetricsSink
+from metrics.realtime import RealtimeStatsByLabel
+from metrics.resources import ResourceProbe, ResourceSampler
+from metrics.tracing import Tracer
+from demo2_hybrid_kem_signed.protocol import (
+    HYBRID_ENCODINGS,
+    NonceReplayCache,
+    PeerCertificateCache,
+    ResumptionTicketStore,
+    TrustedValuesFile,
+    build_error_element,
+    build_response_element,
+    decode_hello_element,
+    decode_resume_element,
+    derive_resumption_secret,
+    find_hybrid,
+    hello_message_to_sign,
+    resume_mac,
+    resumed_session_secret,
+    sha256_hex,
+)
 
 OUT_CSV = "artifacts/csv/hybrid_xmpp_receiver_metrics.csv"
 
-_PROC = _psutil.Process()
 
 
 class ReceptorHybridBench(slixmpp.ClientXMPP):
@@ -29,6 +49,19 @@ class ReceptorHybridBench(slixmpp.ClientXMPP):
         trusted_fingerprints_file: str | None,
         trusted_issuer_public_keys_file: str | None,
         startup_timeout_s: int = 20,
+        crypto_processes: int = 0,
+        offload_algs: tuple[str, ...] = DEFAULT_PROCESS_ALGS,
+        crypto_threads: int = 4,
+        crypto_timeout_s: float | None = None,
+        verify_cache_size: int = 0,
+        trust_poll_interval_s: float = 1.0,
+        workers: int = 4,
+        queue_size: int = 64,
+        encodings: tuple[str, ...] = tuple(HYBRID_ENCODINGS),
+        ticket_lifetime_s: float = 0.0,
+        ticket_max_uses: int = 10,
+        replay_window_s: float = 60.0,
+        replay_max_bytes: int = 4 << 20,
     ):
         super().__init__(jid, password)
 
@@ -42,12 +75,40 @@ class ReceptorHybridBench(slixmpp.ClientXMPP):
         self.session_ready = False
         self.exit_code = 0
 
-        self.pqc = PQCProvider()
+        verify_cache = VerifyCache(max_entries=verify_cache_size) if verify_cache_size > 0 else None
+        self.pqc = PQCProvider(context_pool=OQSContextPool(), verify_cache=verify_cache)
+        self.apqc = AsyncPQCProvider(
+            self.pqc,
+            max_threads=crypto_threads,
+            process_workers=crypto_processes,
+            process_algs=offload_algs,
+            timeout_s=crypto_timeout_s,
+        )
+        self.cert_cache = CertificateCache()
+        # CPU por hello con getrusage (proceso: incluye los hilos de cripto); RSS del muestreador.
+        self.probe = ResourceProbe(sampler=ResourceSampler(source="hybrid_xmpp_receiver"))
+        # Spans por hello (Chrome trace) si existe TRACE_DIR; mismo nonce que las del emisor.
+        self.tracer = Tracer.from_env("hybrid_xmpp_receiver")
+        self.peer_certs = PeerCertificateCache()
         self.verify_mode = verify_mode
-        self.trusted_fingerprints_file = trusted_fingerprints_file
-        self.trusted_issuer_public_keys_file = trusted_issuer_public_keys_file
-        self.trusted_fingerprints = load_trusted_values(trusted_fingerprints_file)
-        self.trusted_issuer_public_keys = load_trusted_values(trusted_issuer_public_keys_file)
+        self.trusted_fingerprints = TrustedValuesFile(trusted_fingerprints_file, trust_poll_interval_s)
+        self.trusted_issuer_public_keys = TrustedValuesFile(trusted_issuer_public_keys_file, trust_poll_interval_s)
+        self.trust_anchors = TrustAnchorRegistry(self.trusted_issuer_public_keys.values)
+        self._trust_anchors_version = self.trusted_issuer_public_keys.version
+
+        # Pipeline de recepción: cola acotada + N workers. Si la cola está llena, el
+        # hello se rechaza con un hybrid_error en lugar de acumular latencia.
+        self.workers = max(1, workers)
+        self.hello_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._worker_tasks: list[asyncio.Task] = []
+        self.rejected = 0
+        self.timeouts = 0
+        # Codificaciones aceptadas; un hello en otra versión recibe hybrid_error y el emisor baja a xml.
+        self.encodings = tuple(encodings)
+        # Reanudación por ticket (None = desactivada): sin firma ni certificado mientras el ticket valga.
+        self.tickets = ResumptionTicketStore(ticket_lifetime_s, ticket_max_uses) if ticket_lifetime_s > 0 else None
+        # Nonces recientes: un hello repetido se descarta sin verificar ni encapsular (None = desactivada).
+        self.replay_cache = NonceReplayCache(replay_window_s, replay_max_bytes) if replay_window_s > 0 else None
 
         self.add_event_handler("session_start", self.start)
         self.add_event_handler("message", self.on_message)
@@ -55,12 +116,10 @@ class ReceptorHybridBench(slixmpp.ClientXMPP):
         self.add_event_handler("connection_failed", self.on_connection_failed)
         self.add_event_handler("disconnected", self.on_disconnected)
 
-        os.makedirs("artifacts/csv", exist_ok=True)
-        csv_exists = Path(OUT_CSV).exists() and Path(OUT_CSV).stat().st_size > 0
-        self.csv_f = open(OUT_CSV, "a", newline="", encoding="utf-8")
-        self.writer = csv.DictWriter(
-            self.csv_f,
-            fieldnames=[
+        # Filas por hello: búfer en memoria volcado por un hilo, fuera del manejador de stanzas.
+        self.metrics = MetricsSink(
+            OUT_CSV,
+            [
                 "ts_unix",
                 "from",
                 "msg_id",
@@ -82,17 +141,30 @@ class ReceptorHybridBench(slixmpp.ClientXMPP):
                 "mem_rss_kb",
                 "kem_pk_bytes",
                 "kem_ct_bytes",
+                "verify_queue_ms",
+                "encaps_queue_ms",
+                "verify_cached",
+                "queue_wait_ms",
+                "service_ms",
+                "encoding",
+                "cert_by_ref",
+                "resumed",
+                "ok",
+                "error_reason",
             ],
         )
-        if not csv_exists:
-            self.writer.writeheader()
-        self.stats = RealtimeStats(window=50)
+        self.stats = RealtimeStatsByLabel()
 
     async def start(self, _):
         self.session_ready = True
         self.send_presence()
         await self.get_roster()
-        print("ReceptorHybridBench listo. CSV:", OUT_CSV)
+        self.apqc.warmup()
+        for encoding in self.encodings:
+            self.plugin["xep_0030"].add_feature(HYBRID_ENCODINGS[encoding])
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        print(f"ReceptorHybridBench listo ({self.workers} workers, cola {self.hello_queue.maxsize}). CSV:", OUT_CSV)
 
     def on_failed_auth(self, _):
         if not self.session_ready:
@@ -114,107 +186,231 @@ class ReceptorHybridBench(slixmpp.ClientXMPP):
             self.exit_code = 2
             self.disconnect()
 
+    def _validation_policy(self) -> ValidationPolicy:
+        # Solo se consulta (y recarga si cambió) el fichero del modo activo.
+        if self.verify_mode == "qr":
+            return ValidationPolicy(mode="qr", trusted_fingerprints=self.trusted_fingerprints.values)
+
+        issuer_keys = self.trusted_issuer_public_keys.values
+        if self.trusted_issuer_public_keys.version != self._trust_anchors_version:
+            self.trust_anchors.update(issuer_keys)
+            self._trust_anchors_version = self.trusted_issuer_public_keys.version
+        return ValidationPolicy(
+            mode=self.verify_mode,
+            trusted_issuer_public_keys=issuer_keys,
+            trust_anchors=self.trust_anchors,
+        )
+
     def on_message(self, msg):
         if msg["type"] not in ("chat", "normal"):
             return
 
-        if self.verify_mode == "qr":
-            self.trusted_fingerprints = load_trusted_values(self.trusted_fingerprints_file)
-        elif self.verify_mode == "cert":
-            self.trusted_issuer_public_keys = load_trusted_values(self.trusted_issuer_public_keys_file)
-
-        hello = msg.xml.find(f"{{{NS_HYBRID}}}hybrid_hello")
+        hello, encoding = find_hybrid(msg.xml, "hybrid_hello")
+        handler = self._handle_hello
+        if hello is None:
+            hello, encoding = find_hybrid(msg.xml, "hybrid_resume")
+            handler = self._handle_resume
         if hello is None:
             return
+        if encoding not in self.encodings:
+            self._reject_hello(msg, hello, "codificacion_no_soportada", encoding)
+            return
+        if self.replay_cache is not None and not self.replay_cache.check_and_add(hello.get("nonce") or ""):
+            # Repetición: sin respuesta, para no dar al atacante ni siquiera un error que medir.
+            return
 
-        t0 = time.perf_counter()
+        try:
+            self.hello_queue.put_nowait((handler, msg, hello, encoding, time.perf_counter()))
+        except asyncio.QueueFull:
+            self._reject_hello(msg, hello, "sobrecarga", encoding)
 
-        # Deserialización: extraer todos los campos del stanza
-        _t0_deser = time.perf_counter()
-        kem_alg = hello.get("kem_alg") or ""
-        sig_alg = hello.get("sig_alg") or ""
+    def _reject_hello(self, msg, hello, reason: str, encoding: str):
+        self.rejected += 1
         nonce = hello.get("nonce") or ""
+        if self.replay_cache is not None:
+            self.replay_cache.discard(nonce)
+        response = self.make_message(mto=msg["from"], mbody="[HYBRID_ERROR]", mtype="chat")
+        response["thread"] = nonce
+        response.xml.append(build_error_element(nonce, reason, encoding))
+        response.send()
+
+    def _crypto_timeout(self, msg, hello, encoding: str, t0: float, queue_wait_ms: float, **fields):
+        """
+        La cripto no terminó en `--crypto-timeout`: error `timeout` al emisor (como `sobrecarga`,
+        para que no agote sus 10 s) y fila con `ok=0`, para que la saturación quede en los datos.
+        """
+        self._reject_hello(msg, hello, "timeout", encoding)
+        self.timeouts += 1
+        service_ms = (time.perf_counter() - t0) * 1000.0
+        row = dict.fromkeys(self.metrics.fieldnames, float("nan"))
+        row.update(
+            {
+                "ts_unix": time.time(),
+                "from": str(msg["from"]),
+                "msg_id": msg["id"],
+                "nonce": hello.get("nonce") or "",
+                "receiver_total_ms": queue_wait_ms + service_ms,
+                "queue_wait_ms": queue_wait_ms,
+                "service_ms": service_ms,
+                "encoding": encoding,
+                "ok": 0,
+                "error_reason": "timeout",
+            }
+        )
+        row.update(fields)
+        self.metrics.write(row)
+
+    def _trace_receive(self, hello, t_enqueued: float, t0: float) -> None:
+        """Span `receive`: desde la llegada del stanza (`on_message`) hasta que un worker lo toma."""
+        if self.tracer.enabled:
+            end_ns = time.time_ns()
+            self.tracer.add("receive", hello.get("nonce") or "", end_ns - int((t0 - t_enqueued) * 1e9), end_ns)
+
+    async def _worker(self):
+        while True:
+            handler, msg, hello, encoding, t_enqueued = await self.hello_queue.get()
+            try:
+                await handler(msg, hello, encoding, t_enqueued)
+            except Exception as exc:
+                print(f"WARN: error procesando hello de {msg['from']}: {exc!r}")
+            finally:
+                self.hello_queue.task_done()
+
+    async def _handle_hello(self, msg, hello, encoding: str, t_enqueued: float):
+        t0 = time.perf_counter()
+        queue_wait_ms = (t0 - t_enqueued) * 1000.0
+        self._trace_receive(hello, t_enqueued, t0)
 
-        kem_pk_el = hello.find(f"{{{NS_HYBRID}}}kem_pk")
-        sig_el = hello.find(f"{{{NS_HYBRID}}}sig")
-        cert_el = hello.find(f"{{{NS_HYBRID}}}cert_pem")
-        if cert_el is None:
-            cert_el = hello.find(f"{{{NS_HYBRID}}}cert_json")
-        cert_fp_el = hello.find(f"{{{NS_HYBRID}}}cert_fingerprint_sha256")
-
-        kem_pk_b64 = (kem_pk_el.text or "").strip() if kem_pk_el is not None else ""
-        sig_b64 = (sig_el.text or "").strip() if sig_el is not None else ""
-        cert_pem = (cert_el.text or "").strip() if cert_el is not None else ""
-        cert_fingerprint_claim = (cert_fp_el.text or "").strip() if cert_fp_el is not None else ""
-
-        hello_stanza_bytes = len(ET.tostring(msg.xml, encoding="utf-8"))
-        deserialize_time_ms = (time.perf_counter() - _t0_deser) * 1000.0
-
-        if not (kem_alg and sig_alg and nonce and kem_pk_b64 and sig_b64 and cert_pem and cert_fingerprint_claim):
+        # Deserialización: campos del stanza ya decodificados a bytes (base64 o blob compacto)
+        _t0_deser = time.perf_counter()
+        try:
+            with self.tracer.span("parse", hello.get("nonce") or "", encoding=encoding):
+                decoded = decode_hello_element(hello, encoding)
+        except ValueError:
             return
+        deserialize_time_ms = (time.perf_counter() - _t0_deser) * 1000.0
+        hello_stanza_bytes = len(ET.tostring(msg.xml, encoding="utf-8"))
 
-        cert = certificate_from_pem(cert_pem)
-        cert_check = verify_certificate(
-            cert,
-            self.pqc,
-            mode=self.verify_mode,
-            trusted_fingerprints=self.trusted_fingerprints,
-            trusted_issuer_public_keys=self.trusted_issuer_public_keys,
-        )
+        kem_alg = decoded.kem_alg
+        sig_alg = decoded.sig_alg
+        nonce = decoded.nonce
+        kem_pk = decoded.kem_pk
+        sig_bytes = decoded.sig
+        cert_fingerprint_claim = decoded.cert_fingerprint_sha256
+
+        peer = msg["from"].bare
+        cert_by_ref = int(not decoded.cert)
+        with self.tracer.span("cert_validate", nonce, cert_by_ref=cert_by_ref) as span:
+            if cert_by_ref:
+                parsed_cert = self.peer_certs.get(peer, cert_fingerprint_claim)
+                if parsed_cert is None:
+                    # NACK: el emisor reenviará el mismo hello con el certificado completo.
+                    span.set(cert_reason="cert_desconocido")
+                    self._reject_hello(msg, hello, "cert_desconocido", encoding)
+                    return
+            else:
+                parsed_cert = parse_certificate(decoded.cert, cache=self.cert_cache)
+            cert_check = validate(parsed_cert, self._validation_policy())
+            span.set(cert_reason=cert_check.reason)
 
         cert_ok = int(bool(cert_check.ok and cert_check.fingerprint_sha256 == cert_fingerprint_claim))
         cert_reason = cert_check.reason if cert_check.ok else cert_check.reason
 
+        try:
+            subject_pk = b64decode_str(parsed_cert.pqc_subject_public_key_b64)
+        except Exception:
+            cert_ok = 0
+            cert_reason = "clave_pqc_sujeto_invalida"
+
+        verify_queue_ms = float("nan")
         if cert_ok:
-            vr = self.pqc.verify_signature(
-                sig_alg,
-                hello_message_to_sign(kem_alg, kem_pk_b64, nonce, cert_fingerprint_claim),
-                sig_b64,
-                cert["pqc_subject_public_key_b64"],
-            )
+            try:
+                with self.tracer.span("verify", nonce, sig_alg=sig_alg) as span:
+                    timed = await self.apqc.verify_signature_raw(
+                        sig_alg,
+                        hello_message_to_sign(kem_alg, decoded.kem_pk_b64, nonce, cert_fingerprint_claim),
+                        sig_bytes,
+                        subject_pk,
+                    )
+                    span.set(queue_ms=timed.queue_wait_ms, ok=int(timed.value.ok), cached=int(timed.value.cached))
+            except asyncio.TimeoutError:
+                self._crypto_timeout(
+                    msg, hello, encoding, t0, queue_wait_ms,
+                    kem_alg=kem_alg, sig_alg=sig_alg, hello_stanza_bytes=hello_stanza_bytes,
+                    deserialize_time_ms=deserialize_time_ms, verify_ok=0, cert_ok=cert_ok, cert_reason=cert_reason,
+                    cert_by_ref=cert_by_ref, resumed=0,
+                )
+                return
+            vr = timed.value
+            verify_queue_ms = timed.queue_wait_ms
         else:
-            vr = self.pqc.verify_signature(sig_alg, b"", "", "")
+            vr = self.pqc.verify_signature_raw(sig_alg, b"", b"", b"")
 
         verify_ok = int(bool(vr.ok and cert_ok))
         enc_ms = float("nan")
         response_stanza_bytes = 0
         kem_ct_bytes = 0
+        encaps_queue_ms = float("nan")
 
         # Métricas CPU/memoria sobre el bloque crítico (verify + encaps)
-        _t_cpu0 = _PROC.cpu_times()
-        _mem0_kb = _PROC.memory_info().rss >> 10
+        _t_cpu0 = self.probe.cpu()
 
         if verify_ok:
-            enc = self.pqc.encapsulate_secret(kem_alg, kem_pk_b64)
+            # Solo se recuerdan certificados válidos cuyo titular acaba de firmar el hello.
+            cert_ack = ""
+            if not cert_by_ref:
+                self.peer_certs.put(peer, parsed_cert)
+                cert_ack = parsed_cert.fingerprint_sha256
+            try:
+                with self.tracer.span("encaps", nonce, kem_alg=kem_alg) as span:
+                    timed = await self.apqc.encapsulate_secret_raw(kem_alg, kem_pk)
+                    span.set(queue_ms=timed.queue_wait_ms)
+            except asyncio.TimeoutError:
+                self._crypto_timeout(
+                    msg, hello, encoding, t0, queue_wait_ms,
+                    kem_alg=kem_alg, sig_alg=sig_alg, hello_stanza_bytes=hello_stanza_bytes,
+                    deserialize_time_ms=deserialize_time_ms, verify_time_ms=vr.verify_time_ms, verify_ok=verify_ok,
+                    cert_ok=cert_ok, cert_reason=cert_reason, verify_queue_ms=verify_queue_ms,
+                    verify_cached=int(vr.cached), cert_by_ref=cert_by_ref, resumed=0,
+                )
+                return
+            enc = timed.value
+            encaps_queue_ms = timed.queue_wait_ms
             enc_ms = enc.encaps_time_ms
-            kem_ct_bytes = len(base64.b64decode(enc.ciphertext_b64))
-
-            response = self.make_message(mto=msg["from"], mbody="[HYBRID_RESPONSE]", mtype="chat")
-            response["thread"] = nonce
-
-            response_tag = ET.Element(f"{{{NS_HYBRID}}}hybrid_response")
-            response_tag.set("kem_alg", kem_alg)
-            response_tag.set("nonce", nonce)
-
-            ct_el = ET.SubElement(response_tag, f"{{{NS_HYBRID}}}ciphertext")
-            ct_el.text = enc.ciphertext_b64
-
-            ss_el = ET.SubElement(response_tag, f"{{{NS_HYBRID}}}shared_secret_sha256")
-            ss_el.text = sha256_hex_from_b64(enc.shared_secret_b64)
-
-            response.xml.append(response_tag)
-            response_stanza_bytes = len(ET.tostring(response.xml, encoding="utf-8"))
-            response.send()
-
-        _mem1_kb = _PROC.memory_info().rss >> 10
-        _t_cpu1 = _PROC.cpu_times()
-        cpu_user_ms = (_t_cpu1.user - _t_cpu0.user) * 1000.0
-        cpu_sys_ms  = (_t_cpu1.system - _t_cpu0.system) * 1000.0
+            kem_ct_bytes = len(enc.ciphertext)
+
+            with self.tracer.span("xml_build", nonce, encoding=encoding):
+                response = self.make_message(mto=msg["from"], mbody="[HYBRID_RESPONSE]", mtype="chat")
+                response["thread"] = nonce
+
+                ticket = None
+                if self.tickets is not None:
+                    ticket = self.tickets.issue(peer, derive_resumption_secret(enc.shared_secret, nonce), sig_alg)
+                response.xml.append(
+                    build_response_element(
+                        kem_alg,
+                        nonce,
+                        enc.ciphertext,
+                        sha256_hex(enc.shared_secret),
+                        encoding,
+                        cert_ack=cert_ack,
+                        ticket=ticket,
+                    )
+                )
+                response_stanza_bytes = len(ET.tostring(response.xml, encoding="utf-8"))
+            with self.tracer.span("send", nonce):
+                response.send()
+
+        _mem1_kb = self.probe.rss_kb()
+        _t_cpu1 = self.probe.cpu()
+        cpu_user_ms = (_t_cpu1[0] - _t_cpu0[0]) * 1000.0
+        cpu_sys_ms  = (_t_cpu1[1] - _t_cpu0[1]) * 1000.0
         mem_rss_kb  = _mem1_kb
 
-        kem_pk_bytes = len(base64.b64decode(kem_pk_b64)) if kem_pk_b64 else 0
+        kem_pk_bytes = len(kem_pk)
 
-        receiver_total_ms = (time.perf_counter() - t0) * 1000.0
+        service_ms = (time.perf_counter() - t0) * 1000.0
+        receiver_total_ms = queue_wait_ms + service_ms
 
         row = {
             "ts_unix": time.time(),
@@ -238,18 +434,143 @@ class ReceptorHybridBench(slixmpp.ClientXMPP):
             "mem_rss_kb": mem_rss_kb,
             "kem_pk_bytes": kem_pk_bytes,
             "kem_ct_bytes": kem_ct_bytes,
+            "verify_queue_ms": verify_queue_ms,
+            "encaps_queue_ms": encaps_queue_ms,
+            "verify_cached": int(vr.cached),
+            "queue_wait_ms": queue_wait_ms,
+            "service_ms": service_ms,
+            "encoding": encoding,
+            "cert_by_ref": cert_by_ref,
+            "resumed": 0,
+            "ok": int(bool(verify_ok and response_stanza_bytes)),
+            "error_reason": "",
         }
-        self.writer.writerow(row)
-        self.csv_f.flush()
+        self.metrics.write(row)
 
-        self.stats.add(verify_ms=vr.verify_time_ms, stanza_bytes=hello_stanza_bytes)
-        self.stats.maybe_print(prefix=f"[{sig_alg}] ")
+        self.stats[sig_alg].add(verify_ms=vr.verify_time_ms, stanza_bytes=hello_stanza_bytes)
+        self.stats[sig_alg].maybe_print(prefix=f"[{sig_alg}] ")
+
+    async def _handle_resume(self, msg, resume, encoding: str, t_enqueued: float):
+        t0 = time.perf_counter()
+        queue_wait_ms = (t0 - t_enqueued) * 1000.0
+        self._trace_receive(resume, t_enqueued, t0)
+
+        _t0_deser = time.perf_counter()
+        with self.tracer.span("parse", resume.get("nonce") or "", resumed=1):
+            kem_alg, nonce, ticket_id, mac, kem_pk_b64 = decode_resume_element(resume)
+            try:
+                kem_pk = b64decode_str(kem_pk_b64)
+            except Exception:
+                return
+        deserialize_time_ms = (time.perf_counter() - _t0_deser) * 1000.0
+        hello_stanza_bytes = len(ET.tostring(msg.xml, encoding="utf-8"))
+
+        # El MAC se comprueba antes de gastar un uso: un id de ticket filtrado no basta para agotarlo.
+        _t_cpu0 = self.probe.cpu()
+        with self.tracer.span("resume_mac", nonce) as span:
+            ticket = self.tickets.lookup(msg["from"].bare, ticket_id) if self.tickets is not None else None
+            if ticket is not None and not hmac.compare_digest(
+                mac, resume_mac(ticket.secret, kem_alg, kem_pk_b64, nonce, ticket_id)
+            ):
+                self.tickets.reject()
+                ticket = None
+            span.set(ok=int(ticket is not None))
+        if ticket is None:
+            # El emisor descarta el ticket y repite con un handshake completo.
+            self._reject_hello(msg, resume, "ticket_invalido", encoding)
+            return
+        self.tickets.consume(ticket)
 
-    def close(self):
         try:
-            self.csv_f.close()
-        except Exception:
-            pass
+            with self.tracer.span("encaps", nonce, kem_alg=kem_alg) as span:
+                timed = await self.apqc.encapsulate_secret_raw(kem_alg, kem_pk)
+                span.set(queue_ms=timed.queue_wait_ms)
+        except asyncio.TimeoutError:
+            self._crypto_timeout(
+                msg, resume, encoding, t0, queue_wait_ms,
+                kem_alg=kem_alg, sig_alg=ticket.sig_alg, hello_stanza_bytes=hello_stanza_bytes,
+                deserialize_time_ms=deserialize_time_ms, cert_reason="reanudada", cert_by_ref=0, resumed=1,
+            )
+            return
+        enc = timed.value
+
+        with self.tracer.span("xml_build", nonce, resumed=1):
+            response = self.make_message(mto=msg["from"], mbody="[HYBRID_RESPONSE]", mtype="chat")
+            response["thread"] = nonce
+            response.xml.append(
+                build_response_element(
+                    kem_alg,
+                    nonce,
+                    enc.ciphertext,
+                    sha256_hex(resumed_session_secret(ticket.secret, enc.shared_secret)),
+                    encoding,
+                    resumed=True,
+                )
+            )
+            response_stanza_bytes = len(ET.tostring(response.xml, encoding="utf-8"))
+        with self.tracer.span("send", nonce):
+            response.send()
+
+        _t_cpu1 = self.probe.cpu()
+        service_ms = (time.perf_counter() - t0) * 1000.0
+
+        row = dict.fromkeys(self.metrics.fieldnames, float("nan"))
+        row.update(
+            {
+                "ts_unix": time.time(),
+                "from": str(msg["from"]),
+                "msg_id": msg["id"],
+                "nonce": nonce,
+                "kem_alg": kem_alg,
+                "sig_alg": ticket.sig_alg,
+                "hello_stanza_bytes": hello_stanza_bytes,
+                "response_stanza_bytes": response_stanza_bytes,
+                "deserialize_time_ms": deserialize_time_ms,
+                "verify_ok": 1,
+                "cert_ok": 1,
+                "cert_reason": "reanudada",
+                "cert_fingerprint_sha256": "",
+                "encaps_time_ms": enc.encaps_time_ms,
+                "receiver_total_ms": queue_wait_ms + service_ms,
+                "cpu_user_ms": (_t_cpu1[0] - _t_cpu0[0]) * 1000.0,
+                "cpu_sys_ms": (_t_cpu1[1] - _t_cpu0[1]) * 1000.0,
+                "mem_rss_kb": self.probe.rss_kb(),
+                "kem_pk_bytes": len(kem_pk),
+                "kem_ct_bytes": len(enc.ciphertext),
+                "encaps_queue_ms": timed.queue_wait_ms,
+                "verify_cached": 0,
+                "queue_wait_ms": queue_wait_ms,
+                "service_ms": service_ms,
+                "encoding": encoding,
+                "cert_by_ref": 0,
+                "resumed": 1,
+                "ok": 1,
+                "error_reason": "",
+            }
+        )
+        self.metrics.write(row)
+
+        label = f"{ticket.sig_alg} reanudada"
+        self.stats[label].add(stanza_bytes=hello_stanza_bytes)
+        self.stats[label].maybe_print(prefix=f"[{label}] ")
+
+    def close(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        if self.rejected:
+            print(f"Hellos rechazados (sobrecarga, codificación, timeout...): {self.rejected} (timeouts de cripto: {self.timeouts})")
+        self.metrics.close()
+        self.probe.close()
+        self.tracer.close()
+        print("Certificados por par:", self.peer_certs.stats())
+        if self.tickets is not None:
+            print("Tickets de reanudación:", self.tickets.stats())
+        if self.replay_cache is not None:
+            print("Caché anti-replay:", self.replay_cache.stats())
+        if self.pqc.verify_cache is not None:
+            print("Caché de verificación:", self.pqc.verify_cache.stats())
+        self.apqc.shutdown()
+        self.pqc.close()
 
 
 if __name__ == "__main__":
@@ -260,6 +581,58 @@ if __name__ == "__main__":
     parser.add_argument("--host", default=get_xmpp_host())
     parser.add_argument("--port", type=int, default=get_xmpp_port())
     parser.add_argument("--startup-timeout", type=int, default=20)
+    parser.add_argument(
+        "--crypto-processes", type=int, default=0,
+        help="Procesos para verificar fuera del bucle XMPP los algoritmos de --offload-alg (0 = inline)"
+    )
+    parser.add_argument(
+        "--offload-alg", action="append", default=None,
+        help=f"Prefijo de algoritmo enviado al pool de procesos (repetible; default: {' '.join(DEFAULT_PROCESS_ALGS)})"
+    )
+    parser.add_argument(
+        "--crypto-threads", type=int, default=4,
+        help="Hilos para operaciones PQC fuera del bucle XMPP (default: 4)"
+    )
+    parser.add_argument(
+        "--crypto-timeout", type=float, default=None,
+        help="Timeout (s) por operación PQC; el handshake se descarta si se supera"
+    )
+    parser.add_argument(
+        "--verify-cache-size", type=int, default=0,
+        help="Entradas de la caché de verificaciones (hellos repetidos/retransmitidos; 0 = desactivada)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="Handshakes procesados en paralelo (default: 4)"
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=64,
+        help="Hellos en espera antes de rechazar con hybrid_error (default: 64)"
+    )
+    parser.add_argument(
+        "--accept-encoding", action="append", choices=list(HYBRID_ENCODINGS), default=None,
+        help="Codificación del hello aceptada (repetible; default: todas)"
+    )
+    parser.add_argument(
+        "--ticket-lifetime", type=float, default=0.0,
+        help="Segundos de validez del ticket de reanudación emitido tras cada handshake completo (0 = sin reanudación)"
+    )
+    parser.add_argument(
+        "--ticket-max-uses", type=int, default=10,
+        help="Reanudaciones permitidas por ticket (default: 10)"
+    )
+    parser.add_argument(
+        "--replay-window", type=float, default=60.0,
+        help="Segundos durante los que se recuerda un nonce para descartar hellos repetidos (0 = sin caché)"
+    )
+    parser.add_argument(
+        "--replay-max-kb", type=int, default=4096,
+        help="Memoria máxima estimada de la caché anti-replay en KiB (default: 4096)"
+    )
+    parser.add_argument(
+        "--trust-poll-interval", type=float, default=1.0,
+        help="Segundos entre comprobaciones de cambios en los ficheros de confianza (default: 1.0)"
+    )
     args = parser.parse_args()
 
     receptor_jid = get_xmpp_jid("RECEPTOR")
@@ -272,10 +645,29 @@ if __name__ == "__main__":
         trusted_fingerprints_file=args.trusted_fingerprints_file,
         trusted_issuer_public_keys_file=args.trusted_issuer_public_keys_file,
         startup_timeout_s=args.startup_timeout,
+        crypto_processes=args.crypto_processes,
+        offload_algs=tuple(args.offload_alg or DEFAULT_PROCESS_ALGS),
+        crypto_threads=args.crypto_threads,
+        crypto_timeout_s=args.crypto_timeout,
+        verify_cache_size=args.verify_cache_size,
+        trust_poll_interval_s=args.trust_poll_interval,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        encodings=tuple(args.accept_encoding or HYBRID_ENCODINGS),
+        ticket_lifetime_s=args.ticket_lifetime,
+        ticket_max_uses=args.ticket_max_uses,
+        replay_window_s=args.replay_window,
+        replay_max_bytes=args.replay_max_kb << 10,
     )
     bot.register_plugin("xep_0030")
 
     bot.connect(host=args.host, port=args.port)
     bot.loop.call_later(args.startup_timeout, bot._startup_watchdog)
-    bot.loop.run_forever()
+    # run_all_demos.sh lo para con SIGTERM: se sale del bucle y close() vuelca las métricas pendientes.
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        bot.loop.add_signal_handler(sig, bot.loop.stop)
+    try:
+        bot.loop.run_forever()
+    finally:
+        bot.close()
     raise SystemExit(bot.exit_code)
@@ -17,7 +17,6 @@ Vista chat (?role=jury):
 import sys
 import json
 import hashlib
-import base64
 import time
 import os
 import io
@@ -142,7 +141,7 @@ if _role == "jury":
             with st.spinner(f"Firmando con {alg_name}…"):
                 msg_bytes = msg_content.encode()
                 res  = pqc.sign_message(alg_name, msg_bytes)
-                vres = pqc.verify_signature(alg_name, msg_bytes, res.sig_b64, res.pk_b64)
+                vres = pqc.verify_signature_raw(alg_name, msg_bytes, res.sig, res.pk)
 
                 chat_msg = ChatMessage(
                     timestamp     = datetime.now().strftime("%H:%M:%S"),
@@ -151,8 +150,8 @@ if _role == "jury":
                     alg_name      = alg_name,
                     sign_time_ms  = res.sign_time_ms,
                     verify_time_ms= vres.verify_time_ms,
-                    sig_size_bytes= len(base64.b64decode(res.sig_b64)),
-                    pk_size_bytes = len(base64.b64decode(res.pk_b64)),
+                    sig_size_bytes= len(res.sig),
+                    pk_size_bytes = len(res.pk),
                     verify_ok     = vres.ok,
                 )
 
@@ -164,8 +163,8 @@ if _role == "jury":
             c1, c2, c3, c4 = st.columns(4)
             c1.metric("Firma",          f"{res.sign_time_ms:.2f} ms")
             c2.metric("Verificación",   f"{vres.verify_time_ms:.2f} ms")
-            c3.metric("Tamaño firma",   f"{len(base64.b64decode(res.sig_b64)):,} B")
-            c4.metric("Clave pública",  f"{len(base64.b64decode(res.pk_b64)):,} B")
+            c3.metric("Tamaño firma",   f"{len(res.sig):,} B")
+            c4.metric("Clave pública",  f"{len(res.pk):,} B")
 
             st.markdown("---")
             st.markdown("Puedes enviar otro mensaje si lo deseas. La firma anterior ya llegó al presentador.")
@@ -221,7 +220,7 @@ with tab1:
                 msg_bytes = msg_text.encode()
                 with st.spinner("Operando con liboqs…"):
                     res  = pqc.sign_message(alg_name, msg_bytes)
-                    vres = pqc.verify_signature(alg_name, msg_bytes, res.sig_b64, res.pk_b64)
+                    vres = pqc.verify_signature_raw(alg_name, msg_bytes, res.sig, res.pk)
 
                 if vres.ok:
                     st.success("✅ Firma VÁLIDA — el receptor puede autenticar el mensaje")
@@ -232,8 +231,8 @@ with tab1:
                 c1.metric("Tiempo de firma",        f"{res.sign_time_ms:.3f} ms")
                 c2.metric("Tiempo de verificación", f"{vres.verify_time_ms:.3f} ms")
 
-                sig_raw = base64.b64decode(res.sig_b64)
-                pk_raw  = base64.b64decode(res.pk_b64)
+                sig_raw = res.sig
+                pk_raw  = res.pk
 
                 c3, c4 = st.columns(2)
                 c3.metric("Tamaño firma",         f"{len(sig_raw):,} bytes")
@@ -255,12 +254,12 @@ with tab1:
         with st.spinner("Calculando…"):
             for lbl, alg in SIG_OPTIONS.items():
                 r = pqc.sign_message(alg, sample)
-                v = pqc.verify_signature(alg, sample, r.sig_b64, r.pk_b64)
+                v = pqc.verify_signature_raw(alg, sample, r.sig, r.pk)
                 rows[lbl] = {
                     "Firma (ms)":        round(r.sign_time_ms,   3),
                     "Verif. (ms)":       round(v.verify_time_ms, 3),
-                    "Firma (bytes)":     len(base64.b64decode(r.sig_b64)),
-                    "Clave pública (B)": len(base64.b64decode(r.pk_b64)),
+                    "Firma (bytes)":     len(r.sig),
+                    "Clave pública (B)": len(r.pk),
                 }
 
         st.dataframe(pd.DataFrame(rows).T, use_container_width=True)
@@ -332,7 +331,7 @@ Emisor                    Receptor
             # ── Paso 1: KEM keygen ────────────────────────────────────────
             status_box.write("⏳ **Paso 1 / Emisor** — Generando par de claves KEM efímero (ML-KEM-768)…")
             kem_kp   = pqc.generate_kem_keypair(KEM_ALG)
-            pk_kem_B = len(base64.b64decode(kem_kp.public_key_b64))
+            pk_kem_B = len(kem_kp.public_key)
             status_box.write(
                 f"✅ **KEM keygen** completado — {kem_kp.keygen_time_ms:.3f} ms · "
                 f"Clave pública: **{pk_kem_B} bytes**"
@@ -362,13 +361,13 @@ Emisor                    Receptor
                 },
                 sort_keys=True, separators=(",", ":"),
             ).encode()
-            sign_res   = pqc.sign_with_secret_key(
-                sig_alg, hello_payload, sig_kp.secret_key_b64, sig_kp.public_key_b64,
+            sign_res   = pqc.sign_with_secret_key_raw(
+                sig_alg, hello_payload, sig_kp.secret_key, sig_kp.public_key,
             )
             hello_size = (
                 len(hello_payload)
-                + len(base64.b64decode(sign_res.sig_b64))
-                + len(base64.b64decode(sign_res.pk_b64))
+                + len(sign_res.sig)
+                + len(sign_res.pk)
             )
             status_box.write(
                 f"✅ **Firma HELLO** completada — {sign_res.sign_time_ms:.3f} ms · "
@@ -380,8 +379,8 @@ Emisor                    Receptor
             status_box.write(
                 "⏳ **Paso 4 / Receptor** — Verificando la firma del mensaje HELLO…"
             )
-            vr = pqc.verify_signature(
-                sig_alg, hello_payload, sign_res.sig_b64, sign_res.pk_b64,
+            vr = pqc.verify_signature_raw(
+                sig_alg, hello_payload, sign_res.sig, sign_res.pk,
             )
             if vr.ok:
                 status_box.write(
@@ -402,8 +401,8 @@ Emisor                    Receptor
                     "⏳ **Paso 5 / Receptor** — Encapsulando secreto compartido "
                     "con la clave KEM pública del emisor…"
                 )
-                enc  = pqc.encapsulate_secret(KEM_ALG, kem_kp.public_key_b64)
-                ct_B = len(base64.b64decode(enc.ciphertext_b64))
+                enc  = pqc.encapsulate_secret_raw(KEM_ALG, kem_kp.public_key)
+                ct_B = len(enc.ciphertext)
                 status_box.write(
                     f"✅ **Encapsulación KEM** completada — {enc.encaps_time_ms:.3f} ms · "
                     f"Ciphertext: **{ct_B} bytes** *(enviado al emisor)*"
@@ -415,8 +414,8 @@ Emisor                    Receptor
                     "⏳ **Paso 6 / Emisor** — Decapsulando el ciphertext para recuperar "
                     "el secreto compartido…"
                 )
-                dec = pqc.decapsulate_secret(
-                    KEM_ALG, enc.ciphertext_b64, kem_kp.secret_key_b64,
+                dec = pqc.decapsulate_secret_raw(
+                    KEM_ALG, enc.ciphertext, kem_kp.secret_key,
                 )
                 status_box.write(
                     f"✅ **Decapsulación KEM** completada — {dec.decaps_time_ms:.3f} ms"
@@ -428,8 +427,8 @@ Emisor                    Receptor
                     "⏳ **Paso 7** — Verificando que emisor y receptor derivaron "
                     "el mismo secreto compartido…"
                 )
-                h_sender = hashlib.sha256(base64.b64decode(dec.shared_secret_b64)).hexdigest()
-                h_recvr  = hashlib.sha256(base64.b64decode(enc.shared_secret_b64)).hexdigest()
+                h_sender = hashlib.sha256(dec.shared_secret).hexdigest()
+                h_recvr  = hashlib.sha256(enc.shared_secret).hexdigest()
                 secrets_match = h_sender == h_recvr
 
                 if secrets_match:
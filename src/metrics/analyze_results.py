@@ -5,13 +5,9 @@ from typing import Iterable
 import pandas as pd
 from scipy import stats
 
-OUT_CSV = "artifacts/csv/statistical_analysis.csv"
-
+from metrics.columnar import load_metrics
 
-def _load_if_exists(path: str):
-    if not os.path.exists(path):
-        return None
-    return pd.read_csv(path)
+OUT_CSV = "artifacts/csv/statistical_analysis.csv"
 
 
 def _family_label(value) -> str:
@@ -130,7 +126,7 @@ def main():
 
     rows = []
     for csv_path, family_col, metrics, dataset_name in datasets:
-        df = _load_if_exists(csv_path)
+        df = load_metrics(csv_path, [family_col, *metrics])
         if df is None:
             continue
         for metric_col in metrics:
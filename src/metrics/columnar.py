@@ -0,0 +1,171 @@
+import glob
+import math
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Columnas de texto de los CSV de los benches; el resto son numéricas (float64, NaN si falta:
+# los contadores y flags también, para que una fila incompleta no cambie el tipo de la columna).
+STRING_COLUMNS = frozenset(
+    {
+        "from",
+        "msg_id",
+        "nonce",
+        "alg",
+        "alg_family",
+        "alg_name",
+        "kem_alg",
+        "sig_alg",
+        "verify_mode",
+        "cert_reason",
+        "cert_fingerprint_sha256",
+        "error_reason",
+        "encoding",
+        "identity_mode",
+        "key_id",
+        "mode",
+    }
+)
+
+# Filas por row group: los volcados del sink son pequeños y se agrupan antes de escribir.
+ROW_GROUP_ROWS = 65536
+
+
+def column_type(name: str) -> str:
+    return "string" if name in STRING_COLUMNS else "float64"
+
+
+def parquet_dir(csv_path: str) -> Path:
+    """`artifacts/csv/x.csv` -> `artifacts/csv/x.parquet/` (un fichero part-*.parquet por ejecución)."""
+    p = Path(csv_path)
+    return p.with_name(f"{p.stem}.parquet")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise RuntimeError("La salida Parquet (METRICS_FORMAT=parquet|both) requiere pyarrow: pip install pyarrow") from exc
+    return pyarrow, pyarrow.parquet
+
+
+def _as_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+
+def _as_str(value):
+    if value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+
+class ParquetPartWriter:
+    """
+    Escribe las filas de una ejecución en `<csv>.parquet/part-<ts>.parquet` con esquema fijo.
+
+    Recibe columnas (listas de valores, como el búfer de `MetricsSink`) y las agrupa en
+    row groups de `ROW_GROUP_ROWS` filas. Con `append=False` borra antes las partes previas,
+    igual que un CSV abierto en modo "w".
+    """
+
+    def __init__(self, csv_path: str, fieldnames: list[str], append: bool = True):
+        pa, pq = _require_pyarrow()
+        self._pa = pa
+        self.fieldnames = list(fieldnames)
+        self.schema = pa.schema(
+            [(name, pa.string() if column_type(name) == "string" else pa.float64()) for name in self.fieldnames]
+        )
+        directory = parquet_dir(csv_path)
+        directory.mkdir(parents=True, exist_ok=True)
+        if not append:
+            for old in directory.glob("part-*.parquet"):
+                old.unlink()
+        self.path = directory / f"part-{time.time_ns()}-{os.getpid()}.parquet"
+        self._writer = pq.ParquetWriter(str(self.path), self.schema, compression="zstd")
+        self._pending: list = []
+        self._pending_rows = 0
+
+    def write_columns(self, cols: list[list], n: int) -> None:
+        arrays = []
+        for col, name in zip(cols, self.fieldnames):
+            if column_type(name) == "string":
+                arrays.append(self._pa.array([_as_str(v) for v in col[:n]], type=self._pa.string()))
+            else:
+                arrays.append(self._pa.array([_as_float(v) for v in col[:n]], type=self._pa.float64()))
+        self._pending.append(self._pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self._pending_rows += n
+        if self._pending_rows >= ROW_GROUP_ROWS:
+            self._write_pending()
+
+    def _write_pending(self) -> None:
+        if self._pending:
+            self._writer.write_table(self._pa.Table.from_batches(self._pending, schema=self.schema))
+            self._pending = []
+            self._pending_rows = 0
+
+    def close(self) -> None:
+        self._write_pending()
+        self._writer.close()
+
+
+def _readable_parts(parts: list[str]):
+    """(partes legibles, sus esquemas). Una parte sin footer (proceso muerto antes de `close()`) se omite con un aviso."""
+    pa, pq = _require_pyarrow()
+    ok, schemas = [], []
+    for part in parts:
+        try:
+            schemas.append(pq.read_schema(part))
+        except (pa.ArrowInvalid, OSError) as exc:
+            print(f"WARN: se ignora {part} (Parquet incompleto o corrupto: {exc})")
+            continue
+        ok.append(part)
+    return ok, schemas
+
+
+def load_metrics(csv_path: str, columns: list[str] | None = None, fmt: str | None = None, required: bool = False):
+    """
+    DataFrame de un experimento, o None si no hay datos (FileNotFoundError con `required=True`).
+
+    - `fmt="csv"` o `fmt="parquet"` fuerza la fuente. Por defecto se usa la más reciente
+      (mtime del CSV frente a la última parte de `<csv>.parquet/`): tras volver a `METRICS_FORMAT=csv`,
+      las partes Parquet de ejecuciones anteriores no tapan los datos nuevos.
+    - Las partes Parquet ilegibles se ignoran; si no queda ninguna, se lee el CSV.
+    - Solo se leen `columns`; las que no existan en los datos (ficheros de versiones
+      anteriores) simplemente no aparecen.
+    """
+    if fmt not in (None, "csv", "parquet"):
+        raise ValueError(f"formato desconocido: {fmt!r} (csv o parquet)")
+    parts = []
+    if fmt != "csv":
+        parts = sorted(glob.glob(str(parquet_dir(csv_path) / "part-*.parquet")))
+    has_csv = fmt != "parquet" and os.path.exists(csv_path)
+    if parts and has_csv and os.path.getmtime(csv_path) > max(os.path.getmtime(part) for part in parts):
+        parts = []
+
+    if parts:
+        parts, schemas = _readable_parts(parts)
+    if parts:
+        pa, _ = _require_pyarrow()
+        import pyarrow.dataset as ds
+
+        schema = pa.unify_schemas(schemas)
+        wanted = [c for c in columns if c in schema.names] if columns is not None else None
+        return ds.dataset(parts, schema=schema, format="parquet").to_table(columns=wanted).to_pandas()
+
+    if not os.path.exists(csv_path):
+        if required:
+            raise FileNotFoundError(f"No hay métricas en {csv_path} ni en {parquet_dir(csv_path)}/")
+        return None
+    if columns is None:
+        return pd.read_csv(csv_path)
+    wanted = set(columns)
+    return pd.read_csv(csv_path, usecols=lambda c: c in wanted)
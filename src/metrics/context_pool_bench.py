@@ -0,0 +1,154 @@
+"""
+context_pool_bench.py — Benchmark autónomo (sin XMPP) del coste por llamada de
+PQCProvider con contexto liboqs nuevo por operación frente a contextos reutilizados
+desde OQSContextPool.
+
+Mide el tiempo total de la llamada (creación/liberación de contexto + carga de la
+clave secreta + operación) y el tiempo de la operación criptográfica que ya reporta
+PQCProvider, para aislar el ahorro por operación.
+
+Salida:
+  artifacts/csv/context_pool_metrics.csv
+
+Uso:
+  PYTHONPATH=src python src/metrics/context_pool_bench.py [--iterations N]
+"""
+
+import argparse
+import csv
+import os
+import time
+from pathlib import Path
+from statistics import fmean
+
+from crypto.oqs_pool import OQSContextPool
+from crypto.pqc_wrapper import PQCProvider
+
+SIG_ALGS = [
+    "ML-DSA-44",
+    "ML-DSA-65",
+    "ML-DSA-87",
+    "SPHINCS+-SHA2-128s-simple",
+    "SPHINCS+-SHA2-128f-simple",
+]
+
+KEM_ALGS = [
+    "ML-KEM-512",
+    "ML-KEM-768",
+    "ML-KEM-1024",
+]
+
+OUT_CSV = Path("artifacts/csv/context_pool_metrics.csv")
+
+FIELDS = [
+    "ts_unix", "alg_name", "op", "mode", "iteration",
+    "call_time_ms", "op_time_ms", "overhead_ms",
+]
+
+MESSAGE = b"Benchmark PQC TFM - reutilizacion de contextos liboqs"
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, (time.perf_counter() - t0) * 1000.0
+
+
+def _sig_ops(pqc: PQCProvider, alg_name: str, kp, sig_b64: str):
+    sign_res, sign_call_ms = _timed(
+        pqc.sign_with_secret_key, alg_name, MESSAGE, kp.secret_key_b64, kp.public_key_b64
+    )
+    verify_res, verify_call_ms = _timed(
+        pqc.verify_signature, alg_name, MESSAGE, sig_b64, kp.public_key_b64
+    )
+    return [
+        ("sign", sign_call_ms, sign_res.sign_time_ms),
+        ("verify", verify_call_ms, verify_res.verify_time_ms),
+    ]
+
+
+def _kem_ops(pqc: PQCProvider, alg_name: str, kp, ciphertext_b64: str):
+    enc_res, enc_call_ms = _timed(pqc.encapsulate_secret, alg_name, kp.public_key_b64)
+    dec_res, dec_call_ms = _timed(
+        pqc.decapsulate_secret, alg_name, ciphertext_b64, kp.secret_key_b64
+    )
+    return [
+        ("encaps", enc_call_ms, enc_res.encaps_time_ms),
+        ("decaps", dec_call_ms, dec_res.decaps_time_ms),
+    ]
+
+
+def run_benchmark(iterations: int, pool_size: int):
+    os.makedirs(OUT_CSV.parent, exist_ok=True)
+
+    fresh = PQCProvider()
+    pooled = PQCProvider(context_pool=OQSContextPool(max_size=pool_size))
+    providers = [("fresh", fresh), ("pooled", pooled)]
+
+    with open(OUT_CSV, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS)
+        w.writeheader()
+
+        jobs = []
+        for alg_name in SIG_ALGS:
+            kp = fresh.generate_signature_keypair(alg_name)
+            sig_b64 = fresh.sign_with_secret_key(
+                alg_name, MESSAGE, kp.secret_key_b64, kp.public_key_b64
+            ).sig_b64
+            jobs.append((alg_name, _sig_ops, kp, sig_b64))
+        for alg_name in KEM_ALGS:
+            kp = fresh.generate_kem_keypair(alg_name)
+            ciphertext_b64 = fresh.encapsulate_secret(alg_name, kp.public_key_b64).ciphertext_b64
+            jobs.append((alg_name, _kem_ops, kp, ciphertext_b64))
+
+        for alg_name, ops_fn, kp, payload_b64 in jobs:
+            print(f"\n== {alg_name} ({iterations} iter) ==")
+            # Calentamiento: el primer acceso al pool crea el contexto.
+            ops_fn(pooled, alg_name, kp, payload_b64)
+
+            call_times: dict = {}
+            for i in range(1, iterations + 1):
+                # Alternar el orden evita sesgos de caché entre modos.
+                order = providers if i % 2 else providers[::-1]
+                for mode, pqc in order:
+                    for op, call_ms, op_ms in ops_fn(pqc, alg_name, kp, payload_b64):
+                        w.writerow({
+                            "ts_unix": time.time(),
+                            "alg_name": alg_name,
+                            "op": op,
+                            "mode": mode,
+                            "iteration": i,
+                            "call_time_ms": call_ms,
+                            "op_time_ms": op_ms,
+                            "overhead_ms": call_ms - op_ms,
+                        })
+                        call_times.setdefault((op, mode), []).append(call_ms)
+
+            for op in sorted({op for op, _ in call_times}):
+                fresh_ms = fmean(call_times[(op, "fresh")])
+                pooled_ms = fmean(call_times[(op, "pooled")])
+                print(
+                    f"  {op:<7} fresh={fresh_ms:.4f} ms | pooled={pooled_ms:.4f} ms | "
+                    f"ahorro={(fresh_ms - pooled_ms) * 1000.0:.1f} us/op"
+                )
+
+    print("\nPool:", pooled.context_pool.stats())
+    pooled.close()
+    print(f"\nCSV → {OUT_CSV}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark: contexto liboqs nuevo por llamada vs contextos reutilizados (sin XMPP)"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=200,
+        help="Iteraciones por algoritmo y modo (default: 200)"
+    )
+    parser.add_argument(
+        "--pool-size", type=int, default=64,
+        help="Tamaño máximo del pool LRU de contextos (default: 64)"
+    )
+    args = parser.parse_args()
+
+    run_benchmark(max(1, args.iterations), args.pool_size)
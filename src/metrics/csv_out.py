@@ -0,0 +1,27 @@
+import csv
+import os
+import time
+from pathlib import Path
+
+
+def open_append_csv(path: str, fieldnames: list[str]):
+    """
+    Abre `path` en modo append con un DictWriter.
+
+    Si el CSV existente tiene otra cabecera (se añadieron columnas), se renombra a
+    `<nombre>.<ts>.csv` y se empieza uno nuevo, para no mezclar esquemas.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    p = Path(path)
+    if p.exists() and p.stat().st_size > 0:
+        with open(p, "r", newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        if header != list(fieldnames):
+            p.rename(p.with_name(f"{p.stem}.{int(time.time())}{p.suffix}"))
+
+    csv_exists = p.exists() and p.stat().st_size > 0
+    f = open(p, "a", newline="", encoding="utf-8")
+    writer = csv.DictWriter(f, fieldnames=fieldnames)
+    if not csv_exists:
+        writer.writeheader()
+    return f, writer
@@ -0,0 +1,102 @@
+import math
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias con cubos logarítmicos (error relativo acotado).
+
+    - Cada cubo cubre [base^k, base^(k+1)) ms; con `base=1.05`, ±2.5 % de error.
+    - Memoria constante por histograma y `merge()` exacto, para agregar sesiones.
+    """
+
+    def __init__(self, base: float = 1.05, min_ms: float = 0.001):
+        self.base = base
+        self.min_ms = min_ms
+        self._log_base = math.log(base)
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value_ms: float) -> int:
+        return int(math.floor(math.log(max(value_ms, self.min_ms)) / self._log_base))
+
+    def add(self, value_ms: float) -> None:
+        if value_ms is None or math.isnan(value_ms):
+            return
+        idx = self._index(value_ms)
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        if other.base != self.base:
+            raise ValueError("No se pueden combinar histogramas con distinta base")
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float("nan")
+
+    def percentile(self, q: float) -> float:
+        return self.percentiles((q,))[0]
+
+    def percentiles(self, qs) -> list[float]:
+        """Varios percentiles en una sola pasada por los cubos (qs en orden creciente)."""
+        if not self.count:
+            return [float("nan")] * len(qs)
+        ranks = [max(1, math.ceil((q / 100.0) * self.count)) for q in qs]
+        out = []
+        seen = 0
+        it = iter(sorted(self.buckets))
+        idx = None
+        for rank in ranks:
+            while seen < rank:
+                idx = next(it, None)
+                if idx is None:
+                    break
+                seen += self.buckets[idx]
+            if idx is None:
+                out.append(self.max)
+            else:
+                # Punto medio geométrico del cubo, acotado por los extremos observados.
+                out.append(min(max(self.base ** (idx + 0.5), self.min), self.max))
+        return out
+
+    def to_dict(self) -> dict:
+        """Estado serializable (JSON) para combinar histogramas de otros procesos con `from_dict` + `merge`."""
+        return {
+            "base": self.base,
+            "min_ms": self.min_ms,
+            "buckets": {str(idx): n for idx, n in self.buckets.items()},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        hist = cls(base=data["base"], min_ms=data["min_ms"])
+        hist.buckets = {int(idx): int(n) for idx, n in data["buckets"].items()}
+        hist.count = int(data["count"])
+        hist.total = float(data["total"])
+        if hist.count:
+            hist.min = float(data["min"])
+            hist.max = float(data["max"])
+        return hist
+
+    def bucket_rows(self) -> list[tuple[float, float, int]]:
+        """(límite inferior ms, límite superior ms, cuenta) de los cubos no vacíos."""
+        return [
+            (self.base ** idx, self.base ** (idx + 1), self.buckets[idx])
+            for idx in sorted(self.buckets)
+        ]
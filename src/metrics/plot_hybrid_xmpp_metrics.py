@@ -1,7 +1,8 @@
 import os
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from metrics.columnar import load_metrics
+
 SENDER_CSV = "artifacts/csv/hybrid_xmpp_sender_metrics.csv"
 RECEIVER_CSV = "artifacts/csv/hybrid_xmpp_receiver_metrics.csv"
 FIGS_DIR = "artifacts/figs"
@@ -40,8 +41,12 @@ def bar_mean_by_group(df, group_col, value_col, title, ylabel, out_png):
 def main():
     os.makedirs(FIGS_DIR, exist_ok=True)
 
-    sender = pd.read_csv(SENDER_CSV)
-    receiver = pd.read_csv(RECEIVER_CSV)
+    sender = load_metrics(
+        SENDER_CSV,
+        ["alg_family", "sign_time_ms", "rtt_ms", "hello_stanza_bytes", "response_stanza_bytes"],
+        required=True,
+    )
+    receiver = load_metrics(RECEIVER_CSV, ["sig_alg", "verify_time_ms"], required=True)
 
     boxplot_by_group(
         sender,
@@ -1,7 +1,8 @@
 import os
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from metrics.columnar import load_metrics
+
 SENDER_CSV = "artifacts/csv/sender_metrics.csv"
 RECEIVER_CSV = "artifacts/csv/receiver_metrics.csv"
 FIGS_DIR = "artifacts/figs"
@@ -85,8 +86,12 @@ def main():
     # Crear directorio de figuras si no existe
     os.makedirs(FIGS_DIR, exist_ok=True)
 
-    sender = pd.read_csv(SENDER_CSV)
-    receiver = pd.read_csv(RECEIVER_CSV)
+    sender = load_metrics(
+        SENDER_CSV,
+        ["alg_family", "sign_time_ms", "rtt_ms", "net_baseline_rtt_ms", "stanza_bytes", "body_bytes", "sig_b64_bytes", "pk_b64_bytes"],
+        required=True,
+    )
+    receiver = load_metrics(RECEIVER_CSV, ["alg", "alg_family", "verify_time_ms", "stanza_bytes"], required=True)
 
     # Asegurar columna "alg_family" en receiver
     if "alg_family" not in receiver.columns:
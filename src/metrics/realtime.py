@@ -1,27 +1,61 @@
 import time
-import statistics
-from collections import deque
+
+from metrics.histogram import LatencyHistogram
+
 
 class RealtimeStats:
-    def __init__(self, window=50):
-        self.window = window
-        self.rtt = deque(maxlen=window)
-        self.sign = deque(maxlen=window)
-        self.verify = deque(maxlen=window)
-        self.stanza = deque(maxlen=window)
+    """
+    Estadísticas de consola de un algoritmo (o variante) en los bots XMPP, acumuladas desde el arranque.
+
+    Cada latencia es un `LatencyHistogram`: memoria fija aunque el bench dure horas,
+    percentiles (p50/p95/p99/p99.9) en una pasada por los cubos y `merge()` para
+    juntar los de varios procesos o clientes. El tamaño de stanza no es una latencia:
+    solo se lleva su media y su máximo.
+    """
+
+    QUANTILES = (50, 95, 99, 99.9)
+    LATENCIES = ("rtt", "sign", "verify")
+
+    def __init__(self, base=1.05):
+        self.rtt = LatencyHistogram(base=base)
+        self.sign = LatencyHistogram(base=base)
+        self.verify = LatencyHistogram(base=base)
+        self.stanza_n = 0
+        self.stanza_total = 0
+        self.stanza_max = 0
         self.last_print = time.time()
 
     def add(self, rtt_ms=None, sign_ms=None, verify_ms=None, stanza_bytes=None):
-        if rtt_ms is not None: self.rtt.append(float(rtt_ms))
-        if sign_ms is not None: self.sign.append(float(sign_ms))
-        if verify_ms is not None: self.verify.append(float(verify_ms))
-        if stanza_bytes is not None: self.stanza.append(int(stanza_bytes))
+        if rtt_ms is not None: self.rtt.add(float(rtt_ms))
+        if sign_ms is not None: self.sign.add(float(sign_ms))
+        if verify_ms is not None: self.verify.add(float(verify_ms))
+        if stanza_bytes is not None:
+            self.stanza_n += 1
+            self.stanza_total += int(stanza_bytes)
+            self.stanza_max = max(self.stanza_max, int(stanza_bytes))
 
-    def _p(self, arr, q):
-        if not arr: return None
-        s = sorted(arr)
-        i = int((q/100.0) * (len(s)-1))
-        return s[i]
+    def merge(self, other: "RealtimeStats") -> None:
+        for name in self.LATENCIES:
+            getattr(self, name).merge(getattr(other, name))
+        self.stanza_n += other.stanza_n
+        self.stanza_total += other.stanza_total
+        self.stanza_max = max(self.stanza_max, other.stanza_max)
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name).to_dict() for name in self.LATENCIES}
+        data["stanza"] = {"n": self.stanza_n, "total": self.stanza_total, "max": self.stanza_max}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RealtimeStats":
+        stats = cls()
+        for name in cls.LATENCIES:
+            setattr(stats, name, LatencyHistogram.from_dict(data[name]))
+        stanza = data.get("stanza", {})
+        stats.stanza_n = stanza.get("n", 0)
+        stats.stanza_total = stanza.get("total", 0)
+        stats.stanza_max = stanza.get("max", 0)
+        return stats
 
     def maybe_print(self, every_sec=2.0, prefix=""):
         now = time.time()
@@ -29,19 +63,27 @@ class RealtimeStats:
             return
         self.last_print = now
 
-        def fmt(name, arr):
-            if not arr: return f"{name}: n/a"
-            return (f"{name}: n={len(arr)} "
-                    f"mean={statistics.fmean(arr):.2f} "
-                    f"med={statistics.median(arr):.2f} "
-                    f"p95={self._p(arr,95):.2f}")
+        def fmt(name, hist):
+            if not hist.count: return f"{name}: n/a"
+            p50, p95, p99, p999 = hist.percentiles(self.QUANTILES)
+            return (f"{name}: n={hist.count} "
+                    f"mean={hist.mean:.2f} "
+                    f"p50={p50:.2f} p95={p95:.2f} p99={p99:.2f} p99.9={p999:.2f}")
 
         parts = [
-            fmt("RTT(ms)", list(self.rtt)),
-            fmt("SIGN(ms)", list(self.sign)),
-            fmt("VERIFY(ms)", list(self.verify)),
+            fmt("RTT(ms)", self.rtt),
+            fmt("SIGN(ms)", self.sign),
+            fmt("VERIFY(ms)", self.verify),
         ]
-        if self.stanza:
-            parts.append(f"STANZA(bytes): mean={statistics.fmean(self.stanza):.0f} med={statistics.median(self.stanza):.0f}")
+        if self.stanza_n:
+            parts.append(f"STANZA(bytes): mean={self.stanza_total / self.stanza_n:.0f} max={self.stanza_max}")
 
         print(prefix + " | " + " | ".join(parts))
+
+
+class RealtimeStatsByLabel(dict):
+    """`RealtimeStats` por etiqueta (algoritmo, variante): los percentiles de un algoritmo no mezclan los del anterior."""
+
+    def __missing__(self, label: str) -> RealtimeStats:
+        stats = self[label] = RealtimeStats()
+        return stats
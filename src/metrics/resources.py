@@ -0,0 +1,107 @@
+import bisect
+import os
+import resource
+import threading
+import time
+from collections import deque
+
+from metrics.sink import MetricsSink
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") >> 10
+# getrusage(RUSAGE_THREAD) solo existe en Linux; en otros sistemas se cae a RUSAGE_SELF.
+_RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+SAMPLES_CSV = "artifacts/csv/resource_samples_{source}.csv"
+
+
+def _read_rss_kb() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except OSError:
+        # Sin /proc (macOS): ru_maxrss es el pico, no el actual, pero es lo único barato.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ResourceSampler:
+    """
+    Hilo que muestrea RSS y CPU del proceso cada `interval_ms` (por defecto la variable de
+    entorno `RESOURCE_SAMPLE_MS`, o 50 ms).
+
+    - Cada muestra (ts_unix, rss_kb, cpu_user_s, cpu_sys_s) se guarda en un anillo de
+      `capacity` entradas y, si hay `source`, en `resource_samples_<source>.csv` vía
+      `MetricsSink`. Las filas de métricas se correlacionan con ella por `ts_unix`.
+    - `rss_kb` es la última muestra: leerla no hace ninguna llamada al sistema.
+    """
+
+    def __init__(self, interval_ms: float | None = None, capacity: int = 4096, source: str | None = None):
+        if interval_ms is None:
+            interval_ms = float(os.environ.get("RESOURCE_SAMPLE_MS", "50"))
+        self.interval_s = max(0.001, interval_ms / 1000.0)
+        self._samples: deque = deque(maxlen=max(2, capacity))
+        self._stop = threading.Event()
+        self._sink = None
+        if source:
+            self._sink = MetricsSink(
+                SAMPLES_CSV.format(source=source),
+                ["ts_unix", "rss_kb", "cpu_user_s", "cpu_sys_s"],
+                append=False,
+            )
+        self.rss_kb = _read_rss_kb()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def _sample(self) -> None:
+        t = os.times()
+        self.rss_kb = _read_rss_kb()
+        sample = (time.time(), self.rss_kb, t.user, t.system)
+        self._samples.append(sample)
+        if self._sink is not None:
+            self._sink.write(dict(zip(self._sink.fieldnames, sample)))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def sample_at(self, ts_unix: float) -> tuple[float, int, float, float] | None:
+        """Muestra más cercana a `ts_unix` de las que siguen en el anillo."""
+        samples = list(self._samples)
+        if not samples:
+            return None
+        i = bisect.bisect_left([s[0] for s in samples], ts_unix)
+        candidates = samples[max(0, i - 1):i + 1]
+        return min(candidates, key=lambda s: abs(s[0] - ts_unix))
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        if self._sink is not None:
+            self._sink.close()
+
+
+class ResourceProbe:
+    """
+    CPU y memoria alrededor de una operación sin leer /proc en el camino medido.
+
+    - `cpu()` devuelve (user_s, sys_s) con una sola llamada a getrusage: del proceso
+      (`scope="process"`, incluye los hilos de cripto de AsyncPQCProvider) o solo del
+      hilo actual (`scope="thread"`, para benches síncronos; excluye sink y sampler).
+    - `rss_kb()` devuelve la última muestra del `ResourceSampler` de fondo.
+    """
+
+    def __init__(self, scope: str = "process", sampler: ResourceSampler | None = None):
+        if scope not in ("process", "thread"):
+            raise ValueError(f"scope desconocido: {scope!r} (process o thread)")
+        self._who = resource.RUSAGE_SELF if scope == "process" else _RUSAGE_THREAD
+        self.sampler = sampler if sampler is not None else ResourceSampler()
+
+    def cpu(self) -> tuple[float, float]:
+        ru = resource.getrusage(self._who)
+        return ru.ru_utime, ru.ru_stime
+
+    def rss_kb(self) -> int:
+        return self.sampler.rss_kb
+
+    def close(self) -> None:
+        self.sampler.close()
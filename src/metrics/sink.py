@@ -0,0 +1,155 @@
+import atexit
+import csv
+import os
+import threading
+import time
+
+from metrics.csv_out import open_append_csv
+
+
+class MetricsSink:
+    """
+    Escritura de filas de métricas fuera del camino medido.
+
+    - `write(row)` solo copia los valores en un búfer columnar preasignado
+      (una lista de `batch_rows` huecos por columna); no hay E/S ni flush.
+    - Un hilo de fondo vuelca el búfer al CSV cada `batch_rows` filas o cada
+      `flush_interval_ms`, lo que ocurra antes. El volcado trabaja sobre el búfer
+      ya intercambiado, así que el lock solo protege el cambio de búfer.
+    - `close()` (también registrado con atexit) vuelca lo pendiente y cierra el fichero.
+    - Con `append=True` se usa `open_append_csv` (rotación si cambia la cabecera);
+      con `append=False` el fichero se trunca, como hacían los benches de Demo 1.
+    - `fmt` (por defecto la variable de entorno `METRICS_FORMAT`): `csv`, `parquet`
+      (`<csv>.parquet/part-*.parquet`, esquema tipado de `metrics.columnar`) o `both`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fieldnames: list[str],
+        append: bool = True,
+        batch_rows: int = 256,
+        flush_interval_ms: float = 500.0,
+        fmt: str | None = None,
+    ):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.batch_rows = max(1, batch_rows)
+        self.flush_interval_s = max(0.001, flush_interval_ms / 1000.0)
+        self.fmt = fmt or os.environ.get("METRICS_FORMAT", "csv")
+        if self.fmt not in ("csv", "parquet", "both"):
+            raise ValueError(f"METRICS_FORMAT desconocido: {self.fmt!r} (csv, parquet o both)")
+
+        self._f = None
+        self._csv = None
+        if self.fmt in ("csv", "both"):
+            if append:
+                self._f, _ = open_append_csv(path, self.fieldnames)
+            else:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._f = open(path, "w", newline="", encoding="utf-8")
+                csv.writer(self._f).writerow(self.fieldnames)
+                self._f.flush()
+            self._csv = csv.writer(self._f)
+        self._parquet = None
+        if self.fmt in ("parquet", "both"):
+            from metrics.columnar import ParquetPartWriter
+
+            self._parquet = ParquetPartWriter(path, self.fieldnames, append=append)
+
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._active = self._new_buffer()
+        self._spare = self._new_buffer()
+        self._n = 0
+        self._wake = threading.Event()
+        self._closed = False
+
+        self.rows = 0
+        self.flushes = 0
+        self.flush_ms_max = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=f"metrics-sink:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _new_buffer(self) -> list[list]:
+        return [[""] * self.batch_rows for _ in self.fieldnames]
+
+    def write(self, row: dict) -> None:
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"MetricsSink cerrado: {self.path}")
+            i = self._n
+            if i == len(self._active[0]):
+                # El hilo aún no ha vaciado el búfer lleno: se amplía en lugar de bloquear.
+                for col in self._active:
+                    col.extend([""] * self.batch_rows)
+            for col, name in zip(self._active, self.fieldnames):
+                col[i] = row.get(name, "")
+            self._n = i + 1
+            self.rows += 1
+            full = self._n >= self.batch_rows
+        if full:
+            self._wake.set()
+
+    def _swap(self) -> tuple[list[list], int]:
+        with self._lock:
+            cols, n = self._active, self._n
+            if n == 0:
+                return cols, 0
+            self._active = self._spare if self._spare is not None else self._new_buffer()
+            self._spare = None
+            self._n = 0
+        return cols, n
+
+    def flush(self) -> None:
+        """Vuelca ya lo pendiente (síncrono)."""
+        with self._io_lock:
+            cols, n = self._swap()
+            if n == 0:
+                return
+            t0 = time.perf_counter()
+            if self._csv is not None:
+                self._csv.writerows(zip(*(col[:n] for col in cols)))
+                self._f.flush()
+            if self._parquet is not None:
+                self._parquet.write_columns(cols, n)
+            self.flush_ms_max = max(self.flush_ms_max, (time.perf_counter() - t0) * 1000.0)
+            self.flushes += 1
+            if len(cols[0]) == self.batch_rows:
+                with self._lock:
+                    if self._spare is None:
+                        self._spare = cols
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except ValueError:
+                return  # fichero cerrado por close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5.0)
+        self.flush()
+        if self._f is not None:
+            self._f.close()
+        if self._parquet is not None:
+            self._parquet.close()
+        atexit.unregister(self.close)
+
+    def stats(self) -> dict:
+        return {"rows": self.rows, "flushes": self.flushes, "flush_ms_max": round(self.flush_ms_max, 3)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
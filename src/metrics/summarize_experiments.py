@@ -1,13 +1,13 @@
 import os
 import pandas as pd
 
+from metrics.columnar import load_metrics
+
 OUT_SUMMARY = "artifacts/csv/summary_experiments.csv"
 
 
-def _load_if_exists(path: str):
-    if not os.path.exists(path):
-        return None
-    return pd.read_csv(path)
+# Columnas que separan variantes del mismo experimento (ver `_by_variant`).
+_VARIANT_COLUMNS = ["encoding", "resumed"]
 
 
 def _summarize(df, group_col, columns, experiment_name):
@@ -33,61 +33,76 @@ def _summarize(df, group_col, columns, experiment_name):
     return rows
 
 
+def _by_variant(df):
+    """
+    Separa las filas por codificación del hello y por handshake completo/reanudado.
+
+    CSV antiguos sin esas columnas cuentan como xml y completos.
+    """
+    if df is None:
+        return [("", df)]
+    encoding = df["encoding"].fillna("xml") if "encoding" in df.columns else pd.Series("xml", index=df.index)
+    resumed = df["resumed"].fillna(0).astype(int) if "resumed" in df.columns else pd.Series(0, index=df.index)
+    out = []
+    for (enc, res), group in df.groupby([encoding, resumed]):
+        suffix = ("" if enc == "xml" else f"_{enc}") + ("_resumed" if res else "")
+        out.append((suffix, group))
+    return out
+
+
 def main():
     os.makedirs("artifacts/csv", exist_ok=True)
 
-    sender_sig = _load_if_exists("artifacts/csv/sender_metrics.csv")
-    receiver_sig = _load_if_exists("artifacts/csv/receiver_metrics.csv")
-    sender_kem_local = _load_if_exists("artifacts/csv/kem_signed_sender_metrics.csv")
-    receiver_kem_local = _load_if_exists("artifacts/csv/kem_signed_receiver_metrics.csv")
-    sender_kem_xmpp = _load_if_exists("artifacts/csv/hybrid_xmpp_sender_metrics.csv")
-    receiver_kem_xmpp = _load_if_exists("artifacts/csv/hybrid_xmpp_receiver_metrics.csv")
+    specs = [
+        (
+            "artifacts/csv/sender_metrics.csv",
+            "alg_family",
+            ["sig_keygen_time_ms", "sign_time_ms", "serialize_time_ms", "rtt_ms", "net_baseline_rtt_ms", "stanza_bytes", "sig_b64_bytes"],
+            "xmpp_signature_sender",
+        ),
+        (
+            "artifacts/csv/receiver_metrics.csv",
+            "alg",
+            ["deserialize_time_ms", "verify_time_ms", "stanza_bytes", "mem_rss_kb"],
+            "xmpp_signature_receiver",
+        ),
+        (
+            "artifacts/csv/kem_signed_sender_metrics.csv",
+            "sig_alg",
+            ["kem_keygen_ms", "sig_keygen_ms", "sign_time_ms", "decaps_time_ms", "sender_total_ms", "hello_bytes", "response_bytes", "kem_pk_bytes"],
+            "hybrid_local_sender",
+        ),
+        (
+            "artifacts/csv/kem_signed_receiver_metrics.csv",
+            "sig_alg",
+            ["verify_time_ms", "encaps_time_ms", "receiver_total_ms", "hello_bytes", "response_bytes", "kem_pk_bytes", "kem_ct_bytes"],
+            "hybrid_local_receiver",
+        ),
+        (
+            "artifacts/csv/hybrid_xmpp_sender_metrics.csv",
+            "alg_family",
+            ["kem_keygen_time_ms", "sign_time_ms", "serialize_time_ms", "decaps_time_ms", "rtt_ms", "sender_total_ms", "cpu_user_ms", "hello_stanza_bytes", "response_stanza_bytes", "kem_pk_bytes"],
+            "hybrid_xmpp_sender",
+        ),
+        (
+            "artifacts/csv/hybrid_xmpp_receiver_metrics.csv",
+            "sig_alg",
+            ["deserialize_time_ms", "verify_time_ms", "encaps_time_ms", "receiver_total_ms", "cpu_user_ms", "hello_stanza_bytes", "response_stanza_bytes", "kem_pk_bytes", "kem_ct_bytes"],
+            "hybrid_xmpp_receiver",
+        ),
+    ]
 
     rows = []
-
-    rows += _summarize(
-        sender_sig,
-        "alg_family",
-        ["sig_keygen_time_ms", "sign_time_ms", "serialize_time_ms", "rtt_ms", "net_baseline_rtt_ms", "stanza_bytes", "sig_b64_bytes"],
-        "xmpp_signature_sender",
-    )
-    rows += _summarize(
-        receiver_sig,
-        "alg",
-        ["deserialize_time_ms", "verify_time_ms", "stanza_bytes", "mem_rss_kb"],
-        "xmpp_signature_receiver",
-    )
-
-    rows += _summarize(
-        sender_kem_local,
-        "sig_alg",
-        ["kem_keygen_ms", "sig_keygen_ms", "sign_time_ms", "decaps_time_ms", "sender_total_ms", "hello_bytes", "response_bytes", "kem_pk_bytes"],
-        "hybrid_local_sender",
-    )
-    rows += _summarize(
-        receiver_kem_local,
-        "sig_alg",
-        ["verify_time_ms", "encaps_time_ms", "receiver_total_ms", "hello_bytes", "response_bytes", "kem_pk_bytes", "kem_ct_bytes"],
-        "hybrid_local_receiver",
-    )
-
-    rows += _summarize(
-        sender_kem_xmpp,
-        "alg_family",
-        ["kem_keygen_time_ms", "sign_time_ms", "serialize_time_ms", "decaps_time_ms", "rtt_ms", "sender_total_ms", "hello_stanza_bytes", "response_stanza_bytes", "kem_pk_bytes"],
-        "hybrid_xmpp_sender",
-    )
-    rows += _summarize(
-        receiver_kem_xmpp,
-        "sig_alg",
-        ["deserialize_time_ms", "verify_time_ms", "encaps_time_ms", "receiver_total_ms", "hello_stanza_bytes", "response_stanza_bytes", "kem_pk_bytes", "kem_ct_bytes"],
-        "hybrid_xmpp_receiver",
-    )
+    for path, group_col, columns, experiment_name in specs:
+        # Solo se leen las columnas usadas (proyección en Parquet, usecols en CSV).
+        df = load_metrics(path, [group_col, *columns, *_VARIANT_COLUMNS])
+        for suffix, variant_df in _by_variant(df):
+            rows += _summarize(variant_df, group_col, columns, f"{experiment_name}{suffix}")
 
     out = pd.DataFrame(rows)
 
     # Métricas derivadas: proporción de crypto sobre el RTT total
-    sender_mask = out["experiment"].isin(["xmpp_signature_sender", "hybrid_xmpp_sender"])
+    sender_mask = (out["experiment"] == "xmpp_signature_sender") | out["experiment"].str.startswith("hybrid_xmpp_sender")
     if "sign_time_ms_mean" in out.columns and "rtt_ms_mean" in out.columns:
         out.loc[sender_mask, "crypto_pct_of_rtt"] = (
             out.loc[sender_mask, "sign_time_ms_mean"] / out.loc[sender_mask, "rtt_ms_mean"] * 100
@@ -0,0 +1,63 @@
+import csv
+import os
+import time
+from pathlib import Path
+
+from crypto.pqc_wrapper import PQCProvider
+
+OUT_CSV = "artifacts/csv/sig_throughput_metrics.csv"
+
+FIELDS = [
+    "ts_unix",
+    "source",
+    "sig_alg",
+    "batch_size",
+    "sign_total_ms",
+    "sign_ops_per_sec",
+    "verify_total_ms",
+    "verify_ops_per_sec",
+    "verify_ok_count",
+]
+
+
+def measure_signature_throughput(pqc: PQCProvider, sig_alg: str, batch_size: int, source: str) -> dict:
+    """Firma y verifica `batch_size` mensajes distintos en ráfaga con una identidad fija."""
+    batch_size = max(1, batch_size)
+    kp = pqc.generate_signature_keypair(sig_alg)
+    messages = [f"[{sig_alg} #{i}] Mensaje throughput UMA".encode("utf-8") for i in range(batch_size)]
+
+    signed = pqc.sign_many(sig_alg, [(m, kp.secret_key) for m in messages])
+    verified = pqc.verify_many(
+        sig_alg, [(m, s, kp.public_key) for m, s in zip(messages, signed.sigs)]
+    )
+
+    return {
+        "ts_unix": time.time(),
+        "source": source,
+        "sig_alg": sig_alg,
+        "batch_size": batch_size,
+        "sign_total_ms": signed.total_time_ms,
+        "sign_ops_per_sec": signed.ops_per_sec,
+        "verify_total_ms": verified.total_time_ms,
+        "verify_ops_per_sec": verified.ops_per_sec,
+        "verify_ok_count": verified.ok_count,
+    }
+
+
+def append_throughput_row(row: dict, path: str = OUT_CSV) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    csv_exists = Path(path).exists() and Path(path).stat().st_size > 0
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if not csv_exists:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def print_throughput_row(row: dict, prefix: str = "") -> None:
+    print(
+        f"{prefix}throughput n={row['batch_size']} | "
+        f"sign={row['sign_ops_per_sec']:.1f} ops/s | "
+        f"verify={row['verify_ops_per_sec']:.1f} ops/s | "
+        f"ok={row['verify_ok_count']}/{row['batch_size']}"
+    )
@@ -0,0 +1,149 @@
+import argparse
+import atexit
+import glob
+import json
+import os
+import time
+import zlib
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "trace_id", "attrs", "t0_ns")
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.t0_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.add(self.name, self.trace_id, self.t0_ns, time.time_ns(), **self.attrs)
+        return False
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """
+    Spans por operación del handshake, exportados como Chrome trace (`chrome://tracing`, Perfetto).
+
+    - Desactivado (`path=None`), `span()` devuelve siempre el mismo objeto vacío: el coste es
+      una llamada y un `with`, sin reloj ni reservas de memoria.
+    - `trace_id` es el nonce del handshake: cada nonce es una "línea" (tid) propia y el emisor
+      y el receptor escriben el mismo tid. Al combinar sus ficheros con `merge`, las dos mitades
+      de un handshake quedan alineadas. Los tiempos son de reloj de pared (`time.time_ns`), así
+      que solo son comparables entre procesos de la misma máquina o con relojes sincronizados.
+    - Los eventos se guardan en memoria (como mucho `max_events`) y se escriben en `close()`
+      (también registrado con atexit).
+    """
+
+    def __init__(self, process_name: str, path: str | None = None, max_events: int = 1_000_000):
+        self.process_name = process_name
+        self.path = path
+        self.enabled = path is not None
+        self.max_events = max(1, max_events)
+        self.pid = os.getpid()
+        self.dropped = 0
+        self._events: list[dict] = []
+        self._named_tids: set[int] = set()
+        if self.enabled:
+            self._events.append(
+                {"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": process_name}}
+            )
+            atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, process_name: str) -> "Tracer":
+        """Activo si existe la variable `TRACE_DIR`: escribe `<TRACE_DIR>/<proceso>-<pid>.trace.json`."""
+        directory = os.environ.get("TRACE_DIR")
+        if not directory:
+            return cls(process_name)
+        return cls(process_name, os.path.join(directory, f"{process_name}-{os.getpid()}.trace.json"))
+
+    def span(self, name: str, trace_id: str = "", **attrs):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, trace_id, attrs)
+
+    def add(self, name: str, trace_id: str, start_ns: int, end_ns: int, **attrs) -> None:
+        """Span ya medido (p. ej. la espera en cola, desde un instante guardado antes)."""
+        if not self.enabled:
+            return
+        if len(self._events) >= self.max_events:
+            self.dropped += 1
+            return
+        tid = zlib.crc32(trace_id.encode("utf-8")) & 0x7FFFFFFF if trace_id else 0
+        if tid not in self._named_tids:
+            self._named_tids.add(tid)
+            self._events.append(
+                {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": trace_id or "-"}}
+            )
+        args = {"nonce": trace_id}
+        args.update(attrs)
+        self._events.append(
+            {
+                "name": name,
+                "cat": "handshake",
+                "ph": "X",
+                "ts": start_ns / 1000.0,
+                "dur": (end_ns - start_ns) / 1000.0,
+                "pid": self.pid,
+                "tid": tid,
+                "args": args,
+            }
+        )
+
+    def close(self) -> None:
+        if not self.enabled or self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms"}, f)
+        print(f"Traza: {self.path} ({len(self._events)} eventos, {self.dropped} descartados)")
+        self.enabled = False
+        atexit.unregister(self.close)
+
+
+def merge_traces(paths: list[str], out_path: str) -> int:
+    events = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            events.extend(json.load(f).get("traceEvents", []))
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combina trazas de emisor y receptor en un único Chrome trace")
+    parser.add_argument("traces", nargs="*", help="Ficheros .trace.json (default: artifacts/traces/*.trace.json)")
+    parser.add_argument("--out", default="artifacts/traces/merged.json")
+    args = parser.parse_args()
+
+    paths = args.traces or sorted(glob.glob("artifacts/traces/*.trace.json"))
+    n = merge_traces(paths, args.out)
+    print(f"{len(paths)} trazas, {n} eventos -> {args.out}")
@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import base64
+import signal
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import deque
+from xml.sax.saxutils import escape, quoteattr
+
+NS_CLIENT = "jabber:client"
+NS_STREAM = "http://etherx.jabber.org/streams"
+NS_SASL = "urn:ietf:params:xml:ns:xmpp-sasl"
+NS_BIND = "urn:ietf:params:xml:ns:xmpp-bind"
+NS_SESSION = "urn:ietf:params:xml:ns:xmpp-session"
+NS_STANZAS = "urn:ietf:params:xml:ns:xmpp-stanzas"
+NS_ROSTER = "jabber:iq:roster"
+NS_PING = "urn:xmpp:ping"
+NS_XML = "http://www.w3.org/XML/1998/namespace"
+
+STANZA_TAGS = {f"{{{NS_CLIENT}}}message", f"{{{NS_CLIENT}}}presence", f"{{{NS_CLIENT}}}iq"}
+
+
+def bare_jid(jid: str) -> str:
+    return jid.split("/", 1)[0]
+
+
+def _split(tag: str) -> tuple[str, str]:
+    if tag[:1] == "{":
+        ns, local = tag[1:].split("}", 1)
+        return ns, local
+    return "", tag
+
+
+def _serialize(elem: ET.Element, parent_ns: str, out: list[str]) -> None:
+    ns, local = _split(elem.tag)
+    out.append(f"<{local}")
+    if ns != parent_ns:
+        out.append(f" xmlns={quoteattr(ns)}")
+    for key, value in elem.attrib.items():
+        if key.startswith(f"{{{NS_XML}}}"):
+            key = "xml:" + key[len(NS_XML) + 2:]
+        elif key[:1] == "{":
+            raise ValueError(f"atributo con espacio de nombres: {key}")
+        out.append(f" {key}={quoteattr(value)}")
+    if elem.text is None and not len(elem):
+        out.append("/>")
+    else:
+        out.append(">")
+        if elem.text:
+            out.append(escape(elem.text))
+        for child in elem:
+            _serialize(child, ns, out)
+            if child.tail:
+                out.append(escape(child.tail))
+        out.append(f"</{local}>")
+
+
+def stanza_to_bytes(elem: ET.Element) -> bytes:
+    """Serializa con `xmlns` por defecto (sin prefijos ns0:), como un servidor real."""
+    out: list[str] = []
+    try:
+        _serialize(elem, NS_CLIENT, out)
+        text = "".join(out)
+    except ValueError:
+        text = ET.tostring(elem, encoding="unicode")
+    return text.encode("utf-8")
+
+
+class ClientSession:
+    """Un stream c2s: negociación SASL PLAIN + bind y después lectura de stanzas."""
+
+    def __init__(self, router: "LoopbackRouter", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.router = router
+        self.reader = reader
+        self.writer = writer
+        self.domain = router.domain
+        self.user: str | None = None
+        self.jid: str | None = None
+        self.closed = False
+        self._bytes_in = 0
+        self._reset_parser()
+
+    def _reset_parser(self) -> None:
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root: ET.Element | None = None
+        self._depth = 0
+
+    def send_raw(self, data: bytes) -> None:
+        if not self.closed:
+            self.writer.write(data)
+            self.router.bytes_out += len(data)
+
+    def send(self, elem: ET.Element) -> None:
+        self.send_raw(stanza_to_bytes(elem))
+
+    def _open_stream(self) -> None:
+        self.send_raw(
+            (
+                "<?xml version='1.0'?>"
+                f"<stream:stream xmlns='{NS_CLIENT}' xmlns:stream='{NS_STREAM}' "
+                f"id='{uuid.uuid4().hex}' from='{self.domain}' version='1.0' xml:lang='en'>"
+            ).encode("utf-8")
+        )
+        if self.user is None:
+            features = f"<mechanisms xmlns='{NS_SASL}'><mechanism>PLAIN</mechanism></mechanisms>"
+        else:
+            features = f"<bind xmlns='{NS_BIND}'/><session xmlns='{NS_SESSION}'><optional/></session>"
+        self.send_raw(f"<stream:features>{features}</stream:features>".encode("utf-8"))
+
+    async def run(self) -> None:
+        try:
+            while not self.closed:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                if self._bytes_in == 0 and data[:1] == b"\x16":
+                    # ClientHello de TLS directo (XEP-0368): sin TLS, el cliente reintenta en claro.
+                    break
+                self._bytes_in += len(data)
+                self.router.bytes_in += len(data)
+                self._feed(data)
+                await self.writer.drain()
+        except (ET.ParseError, ConnectionError) as exc:
+            print(f"WARN: cerrando stream de {self.jid or 'anónimo'}: {exc!r}")
+        finally:
+            self.close()
+
+    def _feed(self, data: bytes) -> None:
+        self._parser.feed(data)
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._depth += 1
+                if self._depth == 1:
+                    if elem.tag != f"{{{NS_STREAM}}}stream":
+                        raise ET.ParseError(f"se esperaba stream:stream, llegó {elem.tag}")
+                    self._root = elem
+                    self.domain = elem.get("to") or self.router.domain
+                    self._open_stream()
+                continue
+
+            self._depth -= 1
+            if self._depth == 0:
+                self.send_raw(b"</stream:stream>")
+                self.closed = True
+                return
+            if self._depth == 1:
+                self._root.remove(elem)
+                restarted = self._handle(elem)
+                if restarted:
+                    # Tras <success/> el cliente abre un stream nuevo sobre el mismo socket.
+                    self._reset_parser()
+                    return
+
+    def _handle(self, elem: ET.Element) -> bool:
+        if self.user is None:
+            return self._handle_auth(elem)
+        if self.jid is None:
+            if elem.tag == f"{{{NS_CLIENT}}}iq" and elem.find(f"{{{NS_BIND}}}bind") is not None:
+                self._handle_bind(elem)
+            return False
+        if elem.tag in STANZA_TAGS:
+            self.router.route(self, elem)
+        return False
+
+    def _handle_auth(self, elem: ET.Element) -> bool:
+        if elem.tag != f"{{{NS_SASL}}}auth" or elem.get("mechanism") != "PLAIN":
+            self.send_raw(f"<failure xmlns='{NS_SASL}'><invalid-mechanism/></failure>".encode("utf-8"))
+            return False
+        try:
+            _, authcid, password = base64.b64decode(elem.text or "").decode("utf-8").split("\0")
+        except ValueError:
+            authcid, password = "", ""
+        if not authcid or not self.router.check_password(authcid, password):
+            self.send_raw(f"<failure xmlns='{NS_SASL}'><not-authorized/></failure>".encode("utf-8"))
+            return False
+        self.user = authcid
+        self.send_raw(f"<success xmlns='{NS_SASL}'/>".encode("utf-8"))
+        return True
+
+    def _handle_bind(self, iq: ET.Element) -> None:
+        resource = (iq.findtext(f"{{{NS_BIND}}}bind/{{{NS_BIND}}}resource") or "").strip()
+        self.jid = f"{self.user}@{self.domain}/{resource or uuid.uuid4().hex[:8]}"
+        self.router.register(self)
+
+        result = ET.Element(f"{{{NS_CLIENT}}}iq", {"type": "result", "id": iq.get("id", "")})
+        bind = ET.SubElement(result, f"{{{NS_BIND}}}bind")
+        ET.SubElement(bind, f"{{{NS_BIND}}}jid").text = self.jid
+        self.send(result)
+        self.router.flush_offline(self)
+
+    def close(self) -> None:
+        if self.jid is not None:
+            self.router.unregister(self)
+        self.closed = True
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class LoopbackRouter:
+    """
+    Servidor XMPP mínimo para localhost: stream, SASL PLAIN, bind y enrutado de stanzas.
+
+    - Enruta message/presence/iq entre sesiones por JID completo o desnudo; los
+      receipts XEP-0184 y los elementos propios (hybrid_hello, ...) viajan tal cual.
+    - Sin TLS, sin roster persistente ni s2s: sirve para aislar el coste de cripto y
+      serialización del coste de un servidor real.
+    - Los mensajes a un JID sin sesión se guardan (acotados) hasta que haga bind.
+    - `password=None` acepta cualquier credencial.
+    """
+
+    def __init__(self, domain: str = "localhost", password: str | None = None, max_offline: int = 1000):
+        self.domain = domain
+        self.password = password
+        self.max_offline = max_offline
+        self.sessions: dict[str, ClientSession] = {}
+        self.by_bare: dict[str, list[ClientSession]] = {}
+        self.offline: dict[str, deque] = {}
+        self.routed = 0
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.route_time_s = 0.0
+        self._server: asyncio.AbstractServer | None = None
+
+    def check_password(self, user: str, password: str) -> bool:
+        return self.password is None or password == self.password
+
+    def register(self, session: ClientSession) -> None:
+        previous = self.sessions.get(session.jid)
+        if previous is not None and previous is not session:
+            # Conflicto de recurso: gana la sesión nueva, como en Prosody.
+            previous.send_raw(b"</stream:stream>")
+            previous.close()
+        self.sessions[session.jid] = session
+        self.by_bare.setdefault(bare_jid(session.jid), []).append(session)
+
+    def unregister(self, session: ClientSession) -> None:
+        if self.sessions.get(session.jid) is session:
+            del self.sessions[session.jid]
+        peers = self.by_bare.get(bare_jid(session.jid), [])
+        if session in peers:
+            peers.remove(session)
+        if not peers:
+            self.by_bare.pop(bare_jid(session.jid), None)
+
+    def flush_offline(self, session: ClientSession) -> None:
+        for stanza in self.offline.pop(bare_jid(session.jid), ()):
+            stanza.set("to", session.jid)
+            session.send(stanza)
+            self.routed += 1
+
+    def _reply_local(self, session: ClientSession, stanza: ET.Element) -> None:
+        if stanza.tag != f"{{{NS_CLIENT}}}iq" or stanza.get("type") not in ("get", "set"):
+            return
+        query = list(stanza)
+        child = query[0] if query else None
+        result = ET.Element(f"{{{NS_CLIENT}}}iq", {"type": "result", "id": stanza.get("id", ""), "to": session.jid})
+        if stanza.get("to"):
+            result.set("from", stanza.get("to"))
+        if child is not None and child.tag == f"{{{NS_ROSTER}}}query":
+            ET.SubElement(result, child.tag)
+        elif child is None or child.tag not in (f"{{{NS_SESSION}}}session", f"{{{NS_PING}}}ping"):
+            self._send_error(session, stanza)
+            return
+        session.send(result)
+
+    def _send_error(self, session: ClientSession, stanza: ET.Element) -> None:
+        error = ET.Element(stanza.tag, {"type": "error", "id": stanza.get("id", ""), "to": session.jid})
+        if stanza.get("to"):
+            error.set("from", stanza.get("to"))
+        err = ET.SubElement(error, f"{{{NS_CLIENT}}}error", {"type": "cancel"})
+        ET.SubElement(err, f"{{{NS_STANZAS}}}service-unavailable")
+        session.send(error)
+
+    def route(self, session: ClientSession, stanza: ET.Element) -> None:
+        t0 = time.perf_counter()
+        to = stanza.get("to") or ""
+        stanza.set("from", session.jid)
+
+        if not to or to == session.domain or (to == bare_jid(session.jid) and stanza.tag.endswith("}iq")):
+            self._reply_local(session, stanza)
+        else:
+            target = self.sessions.get(to)
+            if target is not None:
+                targets = [target]
+            else:
+                peers = self.by_bare.get(bare_jid(to), [])
+                if stanza.tag.endswith("}message"):
+                    # Mensaje a JID desnudo: a la sesión más reciente.
+                    targets = peers[-1:]
+                elif stanza.tag.endswith("}presence"):
+                    targets = list(peers)
+                else:
+                    targets = []
+
+            if targets:
+                data = stanza_to_bytes(stanza)
+                for target in targets:
+                    target.send_raw(data)
+                self.routed += len(targets)
+            elif stanza.tag.endswith("}message") and stanza.get("type") != "error":
+                queue = self.offline.setdefault(bare_jid(to), deque(maxlen=self.max_offline))
+                queue.append(stanza)
+            elif stanza.tag.endswith("}iq") and stanza.get("type") in ("get", "set"):
+                self._send_error(session, stanza)
+            else:
+                self.dropped += 1
+        self.route_time_s += time.perf_counter() - t0
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await ClientSession(self, reader, writer).run()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 5222) -> None:
+        self._server = await asyncio.start_server(self._on_connect, host, port)
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "routed": self.routed,
+            "dropped": self.dropped,
+            "offline_pending": sum(len(q) for q in self.offline.values()),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "route_time_ms": self.route_time_s * 1000.0,
+        }
+
+
+async def _main(args) -> None:
+    router = LoopbackRouter(domain=args.domain, password=args.password)
+    await router.start(args.host, args.port)
+    print(f"Router XMPP loopback listo en {args.host}:{args.port} (dominio {args.domain})")
+
+    serving = asyncio.ensure_future(router.serve_forever())
+    # run_all_demos.sh lo para con SIGTERM: se imprimen igualmente las estadísticas.
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        print("Router:", router.stats())
+
+
+if __name__ == "__main__":
+    from crypto import xmpp_env
+
+    parser = argparse.ArgumentParser(description="Router XMPP mínimo en localhost para ejecutar los benchmarks sin servidor")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=xmpp_env.get_xmpp_port())
+    parser.add_argument("--domain", default=xmpp_env.get_env("XMPP_DOMAIN", "localhost"))
+    parser.add_argument("--password", default=None, help="Contraseña exigida a todas las cuentas (default: cualquiera)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass